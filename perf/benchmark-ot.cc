@@ -41,4 +41,61 @@ BENCHMARK_CAPTURE (BM_hb_ot_tags_from_script_and_language, LATIN en_US, HB_SCRIP
 BENCHMARK_CAPTURE (BM_hb_ot_tags_from_script_and_language, COMMON none, HB_SCRIPT_LATIN, nullptr);
 BENCHMARK_CAPTURE (BM_hb_ot_tags_from_script_and_language, LATIN none, HB_SCRIPT_LATIN, nullptr);
 
+/* Mixes of language tags, as seen one paragraph after another.  Unlike
+ * the single tags above, these defeat the last-found cache of
+ * hb_ot_tags_from_script_and_language(). */
+static const char *web_languages[] = {
+  "en-US", "en-GB", "de-DE", "fr-FR", "es-ES", "es-419", "pt-BR", "it-IT",
+  "ru-RU", "ja-JP", "ko-KR", "ar-EG", "hi-IN", "tr-TR", "pl-PL", "nl-NL",
+  "sv-SE", "id-ID", "vi-VN", "th-TH", "fa-IR", "he-IL", "uk-UA", "bn-BD",
+  nullptr
+};
+static const char *long_tail_languages[] = {
+  "fil", "haw", "ast", "ceb", "ckb", "gsw", "kok", "mai", "sat", "zza",
+  "arz", "ary", "bho", "hne", "mag", "mni", "nso", "pcm", "quc", "scn",
+  "tzm", "szl", "vec", "yrl", "ban", "min", "sah", "tyv", "udm", "chr",
+  nullptr
+};
+static const char *complex_languages[] = {
+  "zh-Hans-CN", "zh-Hant-TW", "zh-HK", "zh-MO", "yue-Hant", "cmn-Hans",
+  "sr-Latn-RS", "el-polyton", "hy-arevmda", "ga-Latg", "und-fonipa",
+  "und-Syre", "nan-Hant-TW", "ro-MD", "de-CH-1901", "pa-Arab-PK",
+  nullptr
+};
+
+static void BM_hb_ot_tags_from_script_and_language_mix (benchmark::State& state,
+							hb_script_t script,
+							const char **language_strs) {
+
+  hb_language_t languages[64];
+  unsigned num_languages = 0;
+  for (; language_strs[num_languages]; num_languages++)
+    languages[num_languages] = hb_language_from_string (language_strs[num_languages], -1);
+
+  for (auto _ : state)
+  {
+    for (unsigned i = 0; i < num_languages; i++)
+    {
+      hb_tag_t script_tags[HB_OT_MAX_TAGS_PER_SCRIPT];
+      unsigned script_count = HB_OT_MAX_TAGS_PER_SCRIPT;
+
+      hb_tag_t language_tags[HB_OT_MAX_TAGS_PER_LANGUAGE];
+      unsigned language_count = HB_OT_MAX_TAGS_PER_LANGUAGE;
+
+      hb_ot_tags_from_script_and_language (script,
+					   languages[i],
+					   &script_count /* IN/OUT */,
+					   script_tags /* OUT */,
+					   &language_count /* IN/OUT */,
+					   language_tags /* OUT */);
+      benchmark::DoNotOptimize (language_tags[0]);
+    }
+  }
+
+  state.SetItemsProcessed (state.iterations () * num_languages);
+}
+BENCHMARK_CAPTURE (BM_hb_ot_tags_from_script_and_language_mix, COMMON web, HB_SCRIPT_COMMON, web_languages);
+BENCHMARK_CAPTURE (BM_hb_ot_tags_from_script_and_language_mix, COMMON long_tail, HB_SCRIPT_COMMON, long_tail_languages);
+BENCHMARK_CAPTURE (BM_hb_ot_tags_from_script_and_language_mix, COMMON complex, HB_SCRIPT_COMMON, complex_languages);
+
 BENCHMARK_MAIN();
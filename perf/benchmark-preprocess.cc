@@ -0,0 +1,190 @@
+/*
+ * Benchmarks for the text preprocessing of the Indic shaper, which inserts
+ * dotted circles into the prohibited vowel sequences.
+ *
+ * The texts are shaped with a face whose GSUB lists the Indic scripts but
+ * no lookups, so that the Indic shaper is picked but no time is spent on
+ * applying lookups.  Each text is shaped with and without
+ * HB_BUFFER_FLAG_DO_NOT_INSERT_DOTTED_CIRCLE, which skips preprocessing.
+ * This only times the backend built into the library, and within whole
+ * shape calls, next to which preprocessing is small.  To time the switch
+ * and DFA backends of gen-vowel-constraints.py alone, run
+ *
+ *   make -f update-unicode-tables.make vowel-constraints-benchmark
+ *
+ * in src/.
+ */
+#include "benchmark/benchmark.h"
+#include <cstring>
+
+#ifdef HAVE_CONFIG_H
+#include "config.h"
+#endif
+
+#include <cassert>
+#include <vector>
+
+#include "hb.h"
+
+static const char *default_texts[] =
+{
+  "perf/texts/hi-words.txt",
+};
+
+/* Must be sorted. */
+static const hb_tag_t indic_script_tags[] =
+{
+  HB_TAG ('b','n','g','2'),
+  HB_TAG ('d','e','v','2'),
+  HB_TAG ('g','j','r','2'),
+  HB_TAG ('g','u','r','2'),
+  HB_TAG ('k','n','d','2'),
+  HB_TAG ('m','l','m','2'),
+  HB_TAG ('o','r','y','2'),
+  HB_TAG ('t','e','l','2'),
+  HB_TAG ('t','m','l','2'),
+};
+
+static void
+push16 (std::vector<char> &data, unsigned v)
+{
+  data.push_back (v >> 8);
+  data.push_back (v & 0xFF);
+}
+
+static hb_blob_t *
+reference_table (hb_face_t *, hb_tag_t tag, void *user_data)
+{
+  if (tag != HB_TAG ('G','S','U','B'))
+    return nullptr;
+  const std::vector<char> &gsub = *(const std::vector<char> *) user_data;
+  return hb_blob_create (gsub.data (), gsub.size (), HB_MEMORY_MODE_READONLY, nullptr, nullptr);
+}
+
+static hb_face_t *
+create_indic_face (std::vector<char> &gsub)
+{
+  unsigned num_scripts = sizeof (indic_script_tags) / sizeof (indic_script_tags[0]);
+  unsigned script_list_size = 2 + 6 * num_scripts + 4 + 6;
+
+  push16 (gsub, 1); /* majorVersion */
+  push16 (gsub, 0); /* minorVersion */
+  push16 (gsub, 10); /* scriptListOffset */
+  push16 (gsub, 10 + script_list_size); /* featureListOffset */
+  push16 (gsub, 10 + script_list_size + 2); /* lookupListOffset */
+
+  /* ScriptList, all of whose scripts share one Script table. */
+  push16 (gsub, num_scripts);
+  for (unsigned i = 0; i < num_scripts; i++)
+  {
+    push16 (gsub, indic_script_tags[i] >> 16);
+    push16 (gsub, indic_script_tags[i] & 0xFFFF);
+    push16 (gsub, 2 + 6 * num_scripts);
+  }
+  push16 (gsub, 4); /* defaultLangSysOffset */
+  push16 (gsub, 0); /* langSysCount */
+  push16 (gsub, 0); /* lookupOrderOffset */
+  push16 (gsub, 0xFFFF); /* requiredFeatureIndex */
+  push16 (gsub, 0); /* featureIndexCount */
+
+  push16 (gsub, 0); /* FeatureList featureCount */
+  push16 (gsub, 0); /* LookupList lookupCount */
+
+  return hb_face_create_for_tables (reference_table, &gsub, nullptr);
+}
+
+static void BM_Preprocess (benchmark::State &state,
+			   hb_font_t *font,
+			   bool lines,
+			   bool dotted_circle,
+			   const char *text_path)
+{
+  hb_blob_t *text_blob = hb_blob_create_from_file_or_fail (text_path);
+  assert (text_blob);
+  unsigned orig_text_length;
+  const char *orig_text = hb_blob_get_data (text_blob, &orig_text_length);
+
+  hb_buffer_flags_t flags = dotted_circle ? HB_BUFFER_FLAG_DEFAULT : HB_BUFFER_FLAG_DO_NOT_INSERT_DOTTED_CIRCLE;
+  const char *shapers[] = {"ot", nullptr};
+
+  hb_buffer_t *buf = hb_buffer_create ();
+  for (auto _ : state)
+  {
+    if (!lines)
+    {
+      hb_buffer_clear_contents (buf);
+      hb_buffer_set_flags (buf, flags);
+      hb_buffer_add_utf8 (buf, orig_text, orig_text_length, 0, orig_text_length);
+      hb_buffer_guess_segment_properties (buf);
+      hb_shape_full (font, buf, nullptr, 0, shapers);
+      continue;
+    }
+
+    unsigned text_length = orig_text_length;
+    const char *text = orig_text;
+
+    const char *end;
+    while ((end = (const char *) memchr (text, '\n', text_length)))
+    {
+      hb_buffer_clear_contents (buf);
+      hb_buffer_set_flags (buf, flags);
+      hb_buffer_add_utf8 (buf, text, text_length, 0, end - text);
+      hb_buffer_guess_segment_properties (buf);
+      hb_shape_full (font, buf, nullptr, 0, shapers);
+
+      unsigned skip = end - text + 1;
+      text_length -= skip;
+      text += skip;
+    }
+  }
+  hb_buffer_destroy (buf);
+
+  state.SetBytesProcessed (state.iterations () * orig_text_length);
+
+  hb_blob_destroy (text_blob);
+}
+
+static void test_text (hb_font_t *font,
+		       bool lines,
+		       bool dotted_circle,
+		       const char *text_path)
+{
+  char name[1024] = "BM_Preprocess/";
+  const char *p = strrchr (text_path, '/');
+  strcat (name, p ? p + 1 : text_path);
+  strcat (name, lines ? "/lines" : "/text");
+  strcat (name, dotted_circle ? "/dotted-circle" : "/no-dotted-circle");
+
+  benchmark::RegisterBenchmark (name, BM_Preprocess, font, lines, dotted_circle, text_path)
+   ->Unit(benchmark::kMicrosecond);
+}
+
+int main(int argc, char** argv)
+{
+  benchmark::Initialize(&argc, argv);
+
+  const char **texts = default_texts;
+  unsigned num_texts = sizeof (default_texts) / sizeof (default_texts[0]);
+  if (argc > 1)
+  {
+    texts = (const char **) argv + 1;
+    num_texts = argc - 1;
+  }
+
+  std::vector<char> gsub;
+  hb_face_t *face = create_indic_face (gsub);
+  hb_font_t *font = hb_font_create (face);
+
+  for (unsigned i = 0; i < num_texts; i++)
+    for (int lines = 1; lines >= 0; lines--)
+    {
+      test_text (font, lines, true, texts[i]);
+      test_text (font, lines, false, texts[i]);
+    }
+
+  benchmark::RunSpecifiedBenchmarks();
+  benchmark::Shutdown();
+
+  hb_font_destroy (font);
+  hb_face_destroy (face);
+}
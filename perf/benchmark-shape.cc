@@ -47,6 +47,10 @@ struct test_input_t
    "perf/texts/en-words.txt",
    false},
 
+  {"perf/fonts/Roboto-Regular.ttf",
+   "perf/texts/emoji-sequences.txt",
+   false},
+
   {SUBSET_FONT_BASE_PATH "SourceSerifVariable-Roman.ttf",
    "perf/texts/en-thelittleprince.txt",
    true},
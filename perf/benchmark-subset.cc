@@ -77,6 +77,68 @@ struct test_input_t
 static test_input_t *tests = default_tests;
 static unsigned num_tests = sizeof (default_tests) / sizeof (default_tests[0]);
 
+/* Code point ranges, mostly CJK ideographs and Hangul, covering a bit over
+ * 100k code points. */
+static const hb_codepoint_t many_codepoints_ranges[][2] =
+{
+  {0x3400, 0x4DBF},
+  {0x4E00, 0x9FFF},
+  {0xAC00, 0xD7A3},
+  {0xF900, 0xFAFF},
+  {0x20000, 0x2A6DF},
+  {0x2A700, 0x2EBEF},
+  {0x2F800, 0x2FA1F},
+  {0x30000, 0x3134F},
+};
+
+static char *put16 (char *p, unsigned v) { *p++ = v >> 8; *p++ = v; return p; }
+static char *put32 (char *p, unsigned v) { return put16 (put16 (p, v >> 16), v & 0xFFFF); }
+
+static void add_table (hb_face_t *builder, hb_tag_t tag, const char *data, unsigned length)
+{
+  hb_blob_t *blob = hb_blob_create (data, length, HB_MEMORY_MODE_DUPLICATE, nullptr, nullptr);
+  hb_face_builder_add_table (builder, tag, blob);
+  hb_blob_destroy (blob);
+}
+
+/* A font whose cmap maps all of many_codepoints_ranges to one glyph, for
+ * subsets retaining far more code points than the fonts above have. */
+static hb_face_t* create_many_codepoints_face ()
+{
+  hb_face_t *builder = hb_face_builder_create ();
+  const unsigned num_ranges = ARRAY_LEN (many_codepoints_ranges);
+
+  /* cmap, with a format 13 (many-to-one) subtable. */
+  char cmap[12 + 16 + 12 * sizeof (many_codepoints_ranges) / sizeof (many_codepoints_ranges[0])];
+  char *p = put16 (put16 (cmap, 0), 1);
+  p = put32 (put16 (put16 (p, 3), 10), 12);
+  p = put32 (put16 (put16 (p, 13), 0), 16 + 12 * num_ranges);
+  p = put32 (put32 (p, 0), num_ranges);
+  for (unsigned i = 0; i < num_ranges; i++)
+    p = put32 (put32 (put32 (p, many_codepoints_ranges[i][0]), many_codepoints_ranges[i][1]), 1);
+  add_table (builder, HB_TAG ('c','m','a','p'), cmap, sizeof (cmap));
+
+  /* collect_unicodes () clamps each group as if it mapped to consecutive
+   * glyphs, so the glyph count must exceed the largest range. */
+  char maxp[6];
+  put16 (put32 (maxp, 0x00005000u), 0xFFFF);
+  add_table (builder, HB_TAG ('m','a','x','p'), maxp, sizeof (maxp));
+
+  /* Version 4 OS/2 with all of ulUnicodeRange set, for the subsetter to
+   * recompute. */
+  char os2[96] = {0};
+  put16 (os2, 4);
+  for (unsigned i = 0; i < 4; i++)
+    put32 (os2 + 42 + 4 * i, 0xFFFFFFFFu);
+  add_table (builder, HB_TAG ('O','S','/','2'), os2, sizeof (os2));
+
+  hb_blob_t *blob = hb_face_reference_blob (builder);
+  hb_face_destroy (builder);
+  hb_face_t *face = hb_face_create (blob, 0);
+  hb_blob_destroy (blob);
+  return face;
+}
+
 
 void AddCodepoints(const hb_set_t* codepoints_in_font,
                    unsigned subset_size,
@@ -192,6 +254,41 @@ static void BM_subset (benchmark::State &state,
   hb_face_destroy (face);
 }
 
+/* benchmark for subsetting the font of create_many_codepoints_face (); the
+ * cmap is dropped, as serializing it would dominate the time taken by the
+ * per code point work of the plan and of the other tables, like the
+ * ulUnicodeRange update of OS/2. */
+static void BM_subset_many_codepoints (benchmark::State &state)
+{
+  unsigned subset_size = state.range(0);
+
+  hb_face_t *face = create_many_codepoints_face ();
+
+  hb_subset_input_t* input = hb_subset_input_create_or_fail ();
+  assert (input);
+  hb_set_add (hb_subset_input_set (input, HB_SUBSET_SETS_DROP_TABLE_TAG),
+              HB_TAG ('c','m','a','p'));
+
+  /* Collected before preprocessing, whose face no longer has the format 13
+   * cmap; the subset accelerator keeps the original mapping. */
+  hb_set_t* all_codepoints = hb_set_create ();
+  hb_face_collect_unicodes (face, all_codepoints);
+  AddCodepoints(all_codepoints, subset_size, input);
+  hb_set_destroy (all_codepoints);
+
+  face = preprocess_face (face);
+
+  for (auto _ : state)
+  {
+    hb_face_t* subset = hb_subset_or_fail (face, input);
+    assert (subset);
+    hb_face_destroy (subset);
+  }
+
+  hb_subset_input_destroy (input);
+  hb_face_destroy (face);
+}
+
 static void test_subset (operation_t op,
                          const char *op_name,
                          bool hinting,
@@ -251,6 +348,12 @@ int main(int argc, char** argv)
 
 #undef TEST_OPERATION
 
+  if (tests == default_tests)
+    benchmark::RegisterBenchmark ("BM_subset/subset_codepoints/many-codepoints",
+                                  BM_subset_many_codepoints)
+        ->Range(10, 100000)
+        ->Unit(benchmark::kMillisecond);
+
   benchmark::RunSpecifiedBenchmarks();
   benchmark::Shutdown();
 
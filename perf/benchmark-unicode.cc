@@ -0,0 +1,134 @@
+/*
+ * Benchmarks for the hb_unicode_funcs_t property lookups, as used during
+ * buffer setup, over the code points of the perf texts.
+ */
+#include "benchmark/benchmark.h"
+#include <cstring>
+
+#ifdef HAVE_CONFIG_H
+#include "config.h"
+#endif
+
+#include <cassert>
+#include <vector>
+
+#include "hb.h"
+
+static const char *default_texts[] =
+{
+  "perf/texts/en-thelittleprince.txt",
+  "perf/texts/en-words.txt",
+  "perf/texts/fa-thelittleprince.txt",
+  "perf/texts/fa-words.txt",
+  "perf/texts/hi-words.txt",
+};
+
+enum property_t { GENERAL_CATEGORY, SCRIPT, COMBINING_CLASS, MIRRORING };
+
+static std::vector<hb_codepoint_t>
+load_codepoints (const char *text_path)
+{
+  hb_blob_t *blob = hb_blob_create_from_file_or_fail (text_path);
+  assert (blob);
+  unsigned text_length;
+  const char *text = hb_blob_get_data (blob, &text_length);
+
+  hb_buffer_t *buf = hb_buffer_create ();
+  hb_buffer_add_utf8 (buf, text, text_length, 0, text_length);
+  unsigned count;
+  hb_glyph_info_t *infos = hb_buffer_get_glyph_infos (buf, &count);
+
+  std::vector<hb_codepoint_t> codepoints;
+  for (unsigned i = 0; i < count; i++)
+    codepoints.push_back (infos[i].codepoint);
+
+  hb_buffer_destroy (buf);
+  hb_blob_destroy (blob);
+  return codepoints;
+}
+
+static void BM_Unicode (benchmark::State &state,
+			property_t property,
+			const std::vector<hb_codepoint_t> *codepoints)
+{
+  hb_unicode_funcs_t *ufuncs = hb_unicode_funcs_get_default ();
+
+  for (auto _ : state)
+  {
+    unsigned sum = 0;
+    switch (property)
+    {
+      case GENERAL_CATEGORY:
+	for (hb_codepoint_t u : *codepoints)
+	  sum += hb_unicode_general_category (ufuncs, u);
+	break;
+      case SCRIPT:
+	for (hb_codepoint_t u : *codepoints)
+	  sum += hb_unicode_script (ufuncs, u);
+	break;
+      case COMBINING_CLASS:
+	for (hb_codepoint_t u : *codepoints)
+	  sum += hb_unicode_combining_class (ufuncs, u);
+	break;
+      case MIRRORING:
+	for (hb_codepoint_t u : *codepoints)
+	  sum += hb_unicode_mirroring (ufuncs, u);
+	break;
+    }
+    benchmark::DoNotOptimize (sum);
+  }
+
+  state.SetItemsProcessed (state.iterations () * codepoints->size ());
+}
+
+static void test_property (property_t property,
+			   const char *property_name,
+			   const char *input_name,
+			   const std::vector<hb_codepoint_t> *codepoints)
+{
+  char name[1024] = "BM_Unicode/";
+  strcat (name, property_name);
+  strcat (name, "/");
+  strcat (name, input_name);
+
+  benchmark::RegisterBenchmark (name, BM_Unicode, property, codepoints)
+   ->Unit(benchmark::kMicrosecond);
+}
+
+int main(int argc, char** argv)
+{
+  benchmark::Initialize(&argc, argv);
+
+  const char **texts = default_texts;
+  unsigned num_texts = sizeof (default_texts) / sizeof (default_texts[0]);
+  if (argc > 1)
+  {
+    texts = (const char **) argv + 1;
+    num_texts = argc - 1;
+  }
+
+  std::vector<std::vector<hb_codepoint_t>> inputs (num_texts + 1);
+  std::vector<const char *> input_names;
+  for (unsigned i = 0; i < num_texts; i++)
+  {
+    inputs[i] = load_codepoints (texts[i]);
+    const char *p = strrchr (texts[i], '/');
+    input_names.push_back (p ? p + 1 : texts[i]);
+  }
+  /* Every Latin-1 code point, the range hit hardest by Latin-script text. */
+  for (unsigned i = 0; i < 64; i++)
+    for (hb_codepoint_t u = 0; u < 256; u++)
+      inputs[num_texts].push_back (u);
+  input_names.push_back ("latin1");
+
+  for (unsigned i = 0; i < inputs.size (); i++)
+  {
+    test_property (GENERAL_CATEGORY, "general_category", input_names[i], &inputs[i]);
+    test_property (SCRIPT, "script", input_names[i], &inputs[i]);
+    test_property (COMBINING_CLASS, "combining_class", input_names[i], &inputs[i]);
+    test_property (MIRRORING, "mirroring", input_names[i], &inputs[i]);
+  }
+
+  benchmark::RunSpecifiedBenchmarks();
+  benchmark::Shutdown();
+}
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""usage: ./explore-ucd-table.py ucd.nounihan.grouped.zip [TEXT...]
+
+Explores the size versus lookup-latency trade-off of the packTab layouts
+used by gen-ucd-table.py.  For each of the gc, sc, ccc and bmg datasets,
+every Pareto-optimal packTab solution is compiled into a small C
+microbenchmark that looks up the code points of each TEXT (default: the
+files in perf/texts/).  The measured size / latency Pareto frontier is
+then printed, marking the solutions picked by the compression levels
+gen-ucd-table.py uses.
+
+The C compiler and flags are taken from $CC and $CFLAGS (default:
+cc -O2).
+
+Input file:
+* https://unicode.org/Public/UCD/latest/ucdxml/ucd.nounihan.grouped.zip
+"""
+
+import sys, os, glob, shlex, struct, subprocess, tempfile
+import logging
+logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+
+if len (sys.argv) < 2:
+	sys.exit (__doc__)
+
+# https://github.com/harfbuzz/packtab
+import packTab
+import ucd_loader
+
+# Keep in sync with gen-ucd-table.py.
+compression_levels = (5, 9)
+
+texts = sys.argv[2:] or sorted (glob.glob (os.path.join (os.path.dirname (os.path.abspath (__file__)), '..', 'perf', 'texts', '*.txt')))
+if not texts:
+	sys.exit ('No texts found.')
+
+cc = shlex.split (os.environ.get ('CC', 'cc'))
+cflags = shlex.split (os.environ.get ('CFLAGS', '-O2'))
+
+logging.info ('Loading UCDXML...')
+ucd = ucd_loader.load_ucdxml (sys.argv[1], ('gc', 'ccc', 'bmg', 'sc'))
+
+# The value numbering does not matter for the layout, so values are
+# simply numbered in sorted order.
+def ordered (data):
+	mapping = {}
+	for i, v in enumerate (sorted (set (data))):
+		mapping[i] = v
+		mapping[v] = i
+	return mapping
+
+gc = ucd['gc'].tolist ()
+sc = ucd['sc'].tolist ()
+datasets = [
+	('gc', gc, 'Cn', ordered (gc)),
+	('ccc', ucd['ccc'].map (int).tolist (), 0, None),
+	('bmg', [int (v, 16) - u if v else 0 for u, v in enumerate (ucd['bmg'].tolist ())], 0, None),
+	('sc', sc, 'Zzzz', ordered (sc)),
+]
+
+
+HARNESS = r'''
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+int
+main (int argc, char **argv)
+{
+  unsigned reps = atoi (argv[1]);
+  for (int arg = 2; arg < argc; arg++)
+  {
+    FILE *f = fopen (argv[arg], "rb");
+    if (!f) return 1;
+    fseek (f, 0, SEEK_END);
+    unsigned n = ftell (f) / 4;
+    fseek (f, 0, SEEK_SET);
+    unsigned *u = malloc (n * 4);
+    if (fread (u, 4, n, f) != n) return 1;
+    fclose (f);
+
+    double best = 1e30;
+    unsigned long acc = 0;
+    for (unsigned run = 0; run < 5; run++)
+    {
+      struct timespec t0, t1;
+      clock_gettime (CLOCK_MONOTONIC, &t0);
+      for (unsigned r = 0; r < reps; r++)
+	for (unsigned i = 0; i < n; i++)
+	  acc += explore_get (u[i]);
+      clock_gettime (CLOCK_MONOTONIC, &t1);
+      double ns = ((t1.tv_sec - t0.tv_sec) * 1e9 + (t1.tv_nsec - t0.tv_nsec)) / ((double) reps * n);
+      if (ns < best) best = ns;
+    }
+    printf ("%f %lu\n", best, acc);
+    free (u);
+  }
+  return 0;
+}
+'''
+
+def measure (sol, tmpdir, inputs):
+	"""Compiles sol into the benchmark harness and returns the
+	nanoseconds per lookup for each input."""
+	src = os.path.join (tmpdir, 'explore.c')
+	exe = os.path.join (tmpdir, 'explore')
+	code = packTab.Code ('explore')
+	sol.genCode (code, 'get')
+	with open (src, 'w') as f:
+		code.print_c (file=f)
+		f.write (HARNESS)
+	subprocess.run (cc + cflags + ['-o', exe, src], check=True)
+	# Aim for roughly ten million lookups per input.
+	reps = [max (1, 10000000 // max (1, os.path.getsize (i) // 4)) for i in inputs]
+	times = []
+	for i, r in zip (inputs, reps):
+		out = subprocess.run ([exe, str (r), i], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+		times.append (float (out.split ()[0]))
+	return times
+
+def frontier (results):
+	"""Returns the results not dominated in both size and mean latency."""
+	out = []
+	for r in sorted (results, key=lambda r: (r[0].cost, r[2])):
+		if not out or r[2] < out[-1][2]:
+			out.append (r)
+	return out
+
+
+with tempfile.TemporaryDirectory () as tmpdir:
+
+	inputs = []
+	for text in texts:
+		with open (text, encoding='utf-8') as f:
+			cps = [ord (c) for c in f.read ()]
+		path = os.path.join (tmpdir, os.path.basename (text) + '.u32')
+		with open (path, 'wb') as f:
+			f.write (struct.pack ('<%dI' % len (cps), *cps))
+		inputs.append (path)
+
+	names = [os.path.splitext (os.path.basename (t))[0] for t in texts]
+	for name, data, default, mapping in datasets:
+		logging.info ('Dataset=%s' % name)
+		sols = packTab.pack_table (data, default, mapping=mapping, compression=None)
+		picked = {}
+		for compression in compression_levels:
+			sol = packTab.pack_table (data, default, mapping=mapping, compression=compression)
+			picked.setdefault ((sol.nLookups, sol.nExtraOps, sol.cost), []).append (compression)
+
+		results = []
+		for sol in sols:
+			times = measure (sol, tmpdir, inputs)
+			results.append ((sol, times, sum (times) / len (times)))
+
+		print ()
+		print ('%s: %d candidates' % (name, len (results)))
+		print ('%8s %8s %8s %10s %s  %s' % ('lookups', 'ops', 'bytes', 'mean ns', ' '.join ('%10s' % n[:10] for n in names), 'compression'))
+		best = frontier (results)
+		for sol, times, mean in sorted (results, key=lambda r: r[0].cost):
+			key = (sol.nLookups, sol.nExtraOps, sol.cost)
+			print ('%8d %8d %8d %10.3f %s  %s%s' % (sol.nLookups, sol.nExtraOps, sol.cost, mean,
+							  ' '.join ('%10.3f' % t for t in times),
+							  ','.join (str (c) for c in picked.get (key, [])),
+							  ' *' if any (r[0] is sol for r in best) else ''))
+
+print ()
+print ('* marks the measured size / latency Pareto frontier.')
@@ -12,54 +12,15 @@ import os.path, sys
 if len (sys.argv) != 3:
 	sys.exit (__doc__)
 
-files = [open (x, encoding='utf-8') for x in sys.argv[1:]]
+import ucd_loader
 
-headers = [[f.readline (), f.readline ()] for f in files]
-while files[0].readline ().find ('##################') < 0:
-	pass
+joining_types = ucd_loader.load (sys.argv[1], 2)
+scripts = ucd_loader.load (sys.argv[2])
 
-def read (f):
-	mapping = {}
-	for line in f:
+headers = [joining_types.header[:2], scripts.header[:2]]
 
-		j = line.find ('#')
-		if j >= 0:
-			line = line[:j]
-
-		fields = [x.strip () for x in line.split (';')]
-		if len (fields) == 1:
-			continue
-
-		uu = fields[0].split ('..')
-		start = int (uu[0], 16)
-		if len (uu) == 1:
-			end = start
-		else:
-			end = int (uu[1], 16)
-
-		t = fields[1]
-
-		for u in range (start, end + 1):
-			mapping[u] = t
-
-	return mapping
-
-def read_joining_uu (f):
-	values = set ()
-	for line in f:
-
-		if line[0] == '#':
-			continue
-
-		fields = [x.strip () for x in line.split (';')]
-		if len (fields) == 1:
-			continue
-		if fields[2] in {'T', 'U'}:
-			continue
-
-		values.add (int (fields[0], 16))
-
-	return sorted (values)
+def read_joining_uu (joining_types):
+	return [u for u, t in joining_types.items () if t not in {'T', 'U'}]
 
 def print_has_arabic_joining (scripts, joining_uu):
 
@@ -98,7 +59,7 @@ print ("#ifndef HB_OT_SHAPER_ARABIC_JOINING_LIST_HH")
 print ("#define HB_OT_SHAPER_ARABIC_JOINING_LIST_HH")
 print ()
 
-print_has_arabic_joining (read (files[1]), read_joining_uu (files[0]))
+print_has_arabic_joining (scripts, read_joining_uu (joining_types))
 
 print ()
 print ("#endif /* HB_OT_SHAPER_ARABIC_JOINING_LIST_HH */")
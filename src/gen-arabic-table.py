@@ -1,6 +1,15 @@
 #!/usr/bin/env python3
 
-"""usage: ./gen-arabic-table.py ArabicShaping.txt UnicodeData.txt Blocks.txt
+"""usage: ./gen-arabic-table.py [--packtab | --benchmark] ArabicShaping.txt UnicodeData.txt Blocks.txt
+
+By default, joining types are stored in a flat table of the ranges of
+joining characters, looked up through a switch on the code point.  With
+--packtab, they are packed with packTab instead.
+
+With --benchmark, both layouts are generated and compiled into a small
+benchmark that checks they agree, then prints their table size and the
+nanoseconds per joining_type() call over the perf texts.  The C++
+compiler and flags are taken from $CXX and $CXXFLAGS (default: c++ -O2).
 
 Input files:
 * https://unicode.org/Public/UCD/latest/ucd/ArabicShaping.txt
@@ -10,59 +19,136 @@ Input files:
 
 import os.path, sys
 
-if len (sys.argv) != 4:
-	sys.exit (__doc__)
+packtab = '--packtab' in sys.argv[1:]
+benchmark = '--benchmark' in sys.argv[1:]
+args = [arg for arg in sys.argv[1:] if arg not in ('--packtab', '--benchmark')]
 
-files = [open (x, encoding='utf-8') for x in sys.argv[1:]]
+if len (args) != 3 or packtab and benchmark:
+	sys.exit (__doc__)
 
-headers = [[files[0].readline (), files[0].readline ()], [files[2].readline (), files[2].readline ()]]
+HARNESS = r'''
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+int
+main (int argc, char **argv)
+{
+  /* Checksum of all values, to compare layouts. */
+  unsigned long h = 0;
+  for (unsigned u = 0; u < 0x110000u; u++)
+    h = h * 31 + joining_type (u);
+  printf ("%lu\n", h);
+
+  unsigned reps = atoi (argv[1]);
+  for (int arg = 2; arg < argc; arg++)
+  {
+    FILE *f = fopen (argv[arg], "rb");
+    if (!f) return 1;
+    fseek (f, 0, SEEK_END);
+    unsigned n = ftell (f) / 4;
+    fseek (f, 0, SEEK_SET);
+    unsigned *u = (unsigned *) malloc (n * 4);
+    if (fread (u, 4, n, f) != n) return 1;
+    fclose (f);
+
+    double best = 1e30;
+    unsigned long acc = 0;
+    for (unsigned run = 0; run < 5; run++)
+    {
+      struct timespec t0, t1;
+      clock_gettime (CLOCK_MONOTONIC, &t0);
+      for (unsigned r = 0; r < reps; r++)
+	for (unsigned i = 0; i < n; i++)
+	  acc += joining_type (u[i]);
+      clock_gettime (CLOCK_MONOTONIC, &t1);
+      double ns = ((t1.tv_sec - t0.tv_sec) * 1e9 + (t1.tv_nsec - t0.tv_nsec)) / ((double) reps * n);
+      if (ns < best) best = ns;
+    }
+    printf ("%f %lu\n", best, acc);
+    free (u);
+  }
+  return 0;
+}
+'''
+
+def run_benchmark ():
+	import glob, re, shlex, struct, subprocess, tempfile
+
+	srcdir = os.path.dirname (os.path.abspath (__file__))
+	texts = sorted (glob.glob (os.path.join (srcdir, '..', 'perf', 'texts', '*.txt')))
+	cxx = shlex.split (os.environ.get ('CXX', 'c++'))
+	cxxflags = shlex.split (os.environ.get ('CXXFLAGS', '-O2'))
+
+	# The joining types are defined by the shaper that includes the table.
+	with open (os.path.join (srcdir, 'hb-ot-shaper-arabic.cc'), encoding='utf-8') as f:
+		enum = re.search (r'enum hb_arabic_joining_type_t \{.*?\};', f.read (), re.DOTALL).group (0)
+
+	with tempfile.TemporaryDirectory () as tmpdir:
+
+		inputs = []
+		for text in texts:
+			with open (text, encoding='utf-8') as f:
+				cps = [ord (c) for c in f.read ()]
+			path = os.path.join (tmpdir, os.path.basename (text) + '.u32')
+			with open (path, 'wb') as f:
+				f.write (struct.pack ('<%dI' % len (cps), *cps))
+			inputs.append ((path, len (cps)))
+
+		results = []
+		for layout, options in (('switch', []), ('packtab', ['--packtab'])):
+			table = os.path.join (tmpdir, 'arabic-table-%s.hh' % layout)
+			with open (table, 'w') as f:
+				subprocess.run ([sys.executable, os.path.abspath (__file__)] + options + args, check=True, stdout=f)
+			with open (table) as f:
+				generated = f.read ()
+			m = re.search (r'Table items: (\d+)', generated)
+			size = int (m.group (1)) if m else int (re.search (r'Table bytes: (\d+)', generated).group (1))
+
+			src = os.path.join (tmpdir, 'bench-%s.cc' % layout)
+			exe = os.path.join (tmpdir, 'bench-%s' % layout)
+			with open (src, 'w') as f:
+				f.write ('#include "hb.hh"\n')
+				f.write (enum + '\n')
+				f.write ('#include "%s"\n' % table)
+				f.write (HARNESS)
+			subprocess.run (cxx + cxxflags + ['-I', srcdir, '-o', exe, src], check=True)
+
+			# Aim for roughly ten million lookups per text.
+			reps = max (1, 10000000 // max (1, max (n for _, n in inputs)))
+			out = subprocess.run ([exe, str (reps)] + [p for p, _ in inputs], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.split ('\n')
+			results.append ((layout, size, out[0], [float (l.split ()[0]) for l in out[1:] if l]))
+
+	if results[0][2] != results[1][2]:
+		sys.exit ('The two layouts disagree.')
+
+	names = [os.path.splitext (os.path.basename (t))[0] for t in texts]
+	print ('%-8s %8s %s' % ('layout', 'bytes', ' '.join ('%12s' % n[:12] for n in names)))
+	for layout, size, _, times in results:
+		print ('%-8s %8d %s' % (layout, size, ' '.join ('%12.3f' % t for t in times)))
+
+if benchmark:
+	run_benchmark ()
+	sys.exit (0)
+
+import ucd_loader
+
+joining_types, joining_groups = ucd_loader.load_fields (args[0], (2, 3))
+unicode_names, decompositions = ucd_loader.load_fields (args[1], (1, 5))
+blocks = ucd_loader.load (args[2])
+
+headers = [joining_types.header[:2], blocks.header[:2]]
 headers.append (["UnicodeData.txt does not have a header."])
-while files[0].readline ().find ('##################') < 0:
-	pass
 
-blocks = {}
-def read_blocks(f):
-	global blocks
-	for line in f:
-
-		j = line.find ('#')
-		if j >= 0:
-			line = line[:j]
-
-		fields = [x.strip () for x in line.split (';')]
-		if len (fields) == 1:
-			continue
-
-		uu = fields[0].split ('..')
-		start = int (uu[0], 16)
-		if len (uu) == 1:
-			end = start
-		else:
-			end = int (uu[1], 16)
-
-		t = fields[1]
-
-		for u in range (start, end + 1):
-			blocks[u] = t
-
-def print_joining_table(f):
+def print_joining_table():
 
 	values = {}
-	for line in f:
-
-		if line[0] == '#':
-			continue
-
-		fields = [x.strip () for x in line.split (';')]
-		if len (fields) == 1:
-			continue
-
-		u = int (fields[0], 16)
-
-		if fields[3] in ["ALAPH", "DALATH RISH"]:
-			value = "JOINING_GROUP_" + fields[3].replace(' ', '_')
+	for u, t in joining_types.items ():
+		group = joining_groups[u]
+		if group in ["ALAPH", "DALATH RISH"]:
+			value = "JOINING_GROUP_" + group.replace(' ', '_')
 		else:
-			value = "JOINING_TYPE_" + fields[2]
+			value = "JOINING_TYPE_" + t
 		values[u] = value
 
 	short_value = {}
@@ -75,6 +161,57 @@ def print_joining_table(f):
 	for value,short in short_value.items():
 		print ("#define %s	%s" % (short, value))
 
+	if packtab:
+		print_joining_table_packtab (values, short_value)
+	else:
+		print_joining_table_switch (values, short_value)
+
+	print ()
+	for value,short in short_value.items():
+		print ("#undef %s" % (short))
+	print ()
+
+def print_joining_table_packtab (values, short_value):
+
+	import packTab
+
+	palette = ['JOINING_TYPE_X'] + sorted (set (values.values ()) - {'JOINING_TYPE_X'})
+	palette_index = {v: i for i, v in enumerate (palette)}
+	data = {u: palette_index[v] for u, v in values.items ()}
+
+	print ()
+	print ("static const uint8_t joining_values[] = {%s};" % ', '.join (short_value[v] for v in palette))
+
+	DEFAULT = 5
+	COMPACT = 9
+	for compression in (DEFAULT, COMPACT):
+		print ()
+		if compression == DEFAULT:
+			print ('#ifndef HB_OPTIMIZE_SIZE')
+		elif compression == COMPACT:
+			print ('#else')
+		else:
+			assert False
+		print ()
+
+		code = packTab.Code ('_hb_arabic_joining')
+		sol = packTab.pack_table (data, 0, compression=compression)
+		sol.genCode (code, 'index')
+		code.print_c (linkage='static inline')
+		print ()
+		print ("/* Table bytes: %d */" % (sol.cost + len (palette)))
+		print ()
+
+	print ('#endif')
+	print ()
+	print ("static unsigned int")
+	print ("joining_type (hb_codepoint_t u)")
+	print ("{")
+	print ("  return joining_values[_hb_arabic_joining_index (u)];")
+	print ("}")
+
+def print_joining_table_switch (values, short_value):
+
 	uu = sorted(values.keys())
 	num = len(values)
 	all_blocks = set([blocks[u] for u in uu])
@@ -148,10 +285,6 @@ def print_joining_table(f):
 	print ("  }")
 	print ("  return X;")
 	print ("}")
-	print ()
-	for value,short in short_value.items():
-		print ("#undef %s" % (short))
-	print ()
 
 LIGATURES = (
 	0xF2EE, 0xFC08, 0xFC0E, 0xFC12, 0xFC32, 0xFC3F, 0xFC40, 0xFC41, 0xFC42,
@@ -164,26 +297,23 @@ LIGATURES = (
 	0xF201, 0xF211, 0xF2EE,
 )
 
-def print_shaping_table(f):
+def print_shaping_table():
 
 	shapes = {}
 	ligatures = {}
 	names = {}
-	lines = f.readlines()
-	lines += [
-		"F201;PUA ARABIC LIGATURE LELLAH ISOLATED FORM;Lo;0;AL;<isolated> 0644 0644 0647;;;;N;;;;;",
-		"F211;PUA ARABIC LIGATURE LAM WITH MEEM WITH JEEM INITIAL FORM;Lo;0;AL;<initial> 0644 0645 062C;;;;N;;;;;",
-		"F2EE;PUA ARABIC LIGATURE SHADDA WITH FATHATAN ISOLATED FORM;Lo;0;AL;<isolated> 0020 064B 0651;;;;N;;;;;",
+	entries = [(u, unicode_names[u], d)
+		   for start, end, d in decompositions.ranges () if d[0:1] == '<'
+		   for u in range (start, end + 1)]
+	entries += [
+		(0xF201, "PUA ARABIC LIGATURE LELLAH ISOLATED FORM", "<isolated> 0644 0644 0647"),
+		(0xF211, "PUA ARABIC LIGATURE LAM WITH MEEM WITH JEEM INITIAL FORM", "<initial> 0644 0645 062C"),
+		(0xF2EE, "PUA ARABIC LIGATURE SHADDA WITH FATHATAN ISOLATED FORM", "<isolated> 0020 064B 0651"),
 	]
-	for line in lines:
-
-		fields = [x.strip () for x in line.split (';')]
-		if fields[5][0:1] != '<':
-			continue
+	for c, name, decomposition in entries:
 
-		items = fields[5].split (' ')
+		items = decomposition.split (' ')
 		shape, items = items[0][1:-1], tuple (int (x, 16) for x in items[1:])
-		c = int (fields[0], 16)
 
 		if not shape in ['initial', 'medial', 'isolated', 'final']:
 			continue
@@ -199,16 +329,16 @@ def print_shaping_table(f):
 				continue
 
 			# Save ligature
-			names[c] = fields[1]
+			names[c] = name
 			if items not in ligatures:
 				ligatures[items] = {}
 			ligatures[items][shape] = c
 		else:
 			# Save shape
 			if items[0] not in names:
-				names[items[0]] = fields[1]
+				names[items[0]] = name
 			else:
-				names[items[0]] = os.path.commonprefix ([names[items[0]], fields[1]]).strip ()
+				names[items[0]] = os.path.commonprefix ([names[items[0]], name]).strip ()
 			if items[0] not in shapes:
 				shapes[items[0]] = {}
 			shapes[items[0]][shape] = c
@@ -335,7 +465,7 @@ print ("/* == Start of generated table == */")
 print ("/*")
 print (" * The following table is generated by running:")
 print (" *")
-print (" *   ./gen-arabic-table.py ArabicShaping.txt UnicodeData.txt Blocks.txt")
+print (" *   ./gen-arabic-table.py%s ArabicShaping.txt UnicodeData.txt Blocks.txt" % (" --packtab" if packtab else ""))
 print (" *")
 print (" * on files with these headers:")
 print (" *")
@@ -348,9 +478,8 @@ print ("#ifndef HB_OT_SHAPER_ARABIC_TABLE_HH")
 print ("#define HB_OT_SHAPER_ARABIC_TABLE_HH")
 print ()
 
-read_blocks (files[2])
-print_joining_table (files[0])
-print_shaping_table (files[1])
+print_joining_table ()
+print_shaping_table ()
 
 print ()
 print ("#endif /* HB_OT_SHAPER_ARABIC_TABLE_HH */")
@@ -2,6 +2,9 @@
 
 """usage: ./gen-emoji-table.py emoji-data.txt emoji-test.txt
 
+Also writes ../test/shape/data/in-house/tests/emoji-clusters.tests and the
+../perf/texts/emoji-sequences.txt benchmark corpus from emoji-test.txt.
+
 Input file:
 * https://www.unicode.org/Public/UCD/latest/ucd/emoji/emoji-data.txt
 * https://www.unicode.org/Public/emoji/latest/emoji-test.txt
@@ -60,10 +63,11 @@ print ()
 for typ, s in ranges.items():
 	if typ != "Extended_Pictographic": continue
 
-	arr = dict()
+	# The ranges are sorted and merged, so the bitmap is filled in
+	# one slice per range.
+	arr = [0] * (s[-1][1] + 1)
 	for start,end in s:
-		for i in range(start, end + 1):
-			arr[i] = 1
+		arr[start:end + 1] = [1] * (end - start + 1)
 
 	sol = packTab.pack_table(arr, 0, compression=9)
 	code = packTab.Code('_hb_emoji')
@@ -77,16 +81,23 @@ print ()
 print ("/* == End of generated table == */")
 
 
-# Generate test file.
+# Generate test file and benchmark corpus.
 sequences = []
+subgroups = [[]]
 with open(sys.argv[2]) as f:
     for line in f.readlines():
+        if line.startswith("# subgroup:"):
+            subgroups.append([])
+        status = None
         if "#" in line:
             line = line[:line.index("#")]
         if ";" in line:
+            status = line[line.index(";") + 1:].strip()
             line = line[:line.index(";")]
         line = line.strip()
         line = line.split(" ")
+        if status == "fully-qualified":
+            subgroups[-1].append(line)
         if len(line) < 2:
             continue
         sequences.append(line)
@@ -96,3 +107,11 @@ with open("../test/shape/data/in-house/tests/emoji-clusters.tests", "w") as f:
         f.write("../fonts/AdobeBlank2.ttf;--no-glyph-names --no-positions --font-funcs=ot")
         f.write(";" + ",".join(sequence))
         f.write(";[" + "|".join("1=0" for c in sequence) + "]\n")
+
+# One line per subgroup, with its fully-qualified sequences separated by
+# spaces, for perf/benchmark-shape.
+with open("../perf/texts/emoji-sequences.txt", "w", encoding="utf-8") as f:
+    for seqs in subgroups:
+        if not seqs:
+            continue
+        f.write(" ".join("".join(chr(int(c, 16)) for c in seq) for seq in seqs) + "\n")
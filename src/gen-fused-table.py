@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+
+"""usage: ./gen-fused-table.py [--verify | --benchmark] ucd.nounihan.grouped.zip IndicSyllabicCategory.txt IndicPositionalCategory.txt ArabicShaping.txt DerivedCoreProperties.txt UnicodeData.txt Blocks.txt Scripts.txt IndicSyllabicCategory-Additional.txt IndicPositionalCategory-Additional.txt [hb-common.h]
+
+Generates one packed table that returns, in a single lookup, the
+General_Category, Canonical_Combining_Class and Script of a code point
+(as in gen-ucd-table.py), its USE category (as in gen-use-table.py) and
+its Indic category and position (as in gen-indic-table.py).  Each
+distinct combination of these values is stored once, as a bitfield, in
+a palette; the packed table maps code points to palette indices.
+
+With --verify, the table is generated, and so are hb-ucd-table.hh,
+hb-ot-shaper-use-table.hh and hb-ot-shaper-indic-table.cc from the same
+input files; with the input files of the tree, the latter are those of
+the tree.  They are compiled together, with and without
+HB_OPTIMIZE_SIZE, into a program checking that _hb_fused_get() agrees
+with the lookups of the separate tables on every code point.
+
+With --benchmark, the same program then prints the nanoseconds per code
+point of the separate lookups and of the fused one over the perf texts.
+
+The C++ compiler and flags are taken from $CXX and $CXXFLAGS (default:
+c++ -O2).
+
+Input files:
+* https://unicode.org/Public/UCD/latest/ucdxml/ucd.nounihan.grouped.zip
+* https://unicode.org/Public/UCD/latest/ucd/IndicSyllabicCategory.txt
+* https://unicode.org/Public/UCD/latest/ucd/IndicPositionalCategory.txt
+* https://unicode.org/Public/UCD/latest/ucd/ArabicShaping.txt
+* https://unicode.org/Public/UCD/latest/ucd/DerivedCoreProperties.txt
+* https://unicode.org/Public/UCD/latest/ucd/UnicodeData.txt
+* https://unicode.org/Public/UCD/latest/ucd/Blocks.txt
+* https://unicode.org/Public/UCD/latest/ucd/Scripts.txt
+* ms-use/IndicSyllabicCategory-Additional.txt
+* ms-use/IndicPositionalCategory-Additional.txt
+"""
+
+import sys, os, re, glob, shlex, struct, subprocess, tempfile
+import contextlib, runpy
+import logging
+logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+
+verify = '--verify' in sys.argv[1:]
+benchmark = '--benchmark' in sys.argv[1:]
+args = [arg for arg in sys.argv[1:] if arg not in ('--verify', '--benchmark')]
+
+if len (args) not in (10, 11) or verify and benchmark:
+	sys.exit (__doc__)
+
+# https://github.com/harfbuzz/packtab
+import packTab
+import ucd_loader
+
+srcdir = os.path.dirname (os.path.abspath (__file__))
+hb_common_h = args[10] if len (args) > 10 else os.path.join (srcdir, 'hb-common.h')
+
+def run_generator (script, script_args):
+	"""Runs another gen-*.py script, discarding its output, and returns
+	its globals."""
+	saved = sys.argv
+	sys.argv = [script] + list (script_args)
+	try:
+		with open (os.devnull, 'w') as devnull, contextlib.redirect_stdout (devnull):
+			return runpy.run_path (os.path.join (srcdir, script))
+	finally:
+		sys.argv = saved
+
+logging.info ('Loading UCDXML...')
+ucd = ucd_loader.load_ucdxml (args[0], ('gc', 'ccc', 'sc'))
+
+logging.info ('Running gen-use-table.py...')
+use = run_generator ('gen-use-table.py', args[1:10])
+
+logging.info ('Running gen-indic-table.py...')
+indic = run_generator ('gen-indic-table.py', (args[1], args[2], args[6]))
+
+
+# Numeric values of the shaper categories are those of the ragel machines
+# and of ot_position_t.
+
+def read_values (path, regex):
+	values = {}
+	r = re.compile (regex)
+	with open (os.path.join (srcdir, path), encoding='utf-8') as f:
+		for line in f:
+			m = r.search (line)
+			if m:
+				values[m.group (1)] = int (m.group (2))
+	return values
+
+def machine_values (shaper):
+	return read_values ('hb-ot-shaper-%s-machine.hh' % shaper,
+			    r'#define %s_syllable_machine_ex_(\w+) (\d+)u' % shaper)
+
+use_values = machine_values ('use')
+indic_values = {}
+for shaper, cats in indic['categories'].items ():
+	values = machine_values (shaper)
+	for cat in cats:
+		indic_values.setdefault (cat, values[cat])
+pos_values = read_values ('hb-ot-shaper-indic.hh', r'\bPOS_(\w+) = (\d+)')
+
+gc_order = ('Cc', 'Cf', 'Cn', 'Co', 'Cs', 'Ll', 'Lm', 'Lo', 'Lt', 'Lu',
+	    'Mc', 'Me', 'Mn', 'Nd', 'Nl', 'No', 'Pc', 'Pd', 'Pe', 'Pf',
+	    'Pi', 'Po', 'Ps', 'Sc', 'Sk', 'Sm', 'So', 'Zl', 'Zp', 'Zs',)
+gc_values = {v: i for i, v in enumerate (gc_order)}
+
+sc_values = {}
+sc_array = []
+sc_re = re.compile (r"\b(HB_SCRIPT_[_A-Z]*).*HB_TAG [(]'(.)','(.)','(.)','(.)'[)]")
+with open (hb_common_h, encoding='utf-8') as f:
+	for line in f:
+		m = sc_re.search (line)
+		if not m: continue
+		sc_values[''.join (m.group (i) for i in range (2, 6))] = len (sc_array)
+		sc_array.append (m.group (1))
+
+
+logging.info ('Preparing data tables...')
+
+use_data = use['use_data']
+indic_data = dict (indic['indic_data'])
+indic_data.update (indic['singles'])
+
+# As INDIC_COMBINE_CATEGORIES() in gen-indic-table.py.
+def indic_value (cat, pos):
+	return indic_values[cat] | (pos_values[pos] << 8)
+
+# Code points not in the USE and Indic tables get the defaults those
+# tables return for them.
+columns = [
+	('gc', [gc_values[v] for v in ucd['gc'].tolist ()]),
+	('ccc', ucd['ccc'].map (int).tolist ()),
+	('sc', [sc_values[v] for v in ucd['sc'].tolist ()]),
+	('use', [use_values[use_data[u][0] if u in use_data else 'O'] for u in range (ucd_loader.MAX_UNICODE)]),
+	('indic', [indic_value (*indic_data[u][:2]) if u in indic_data else indic_value ('X', 'END') for u in range (ucd_loader.MAX_UNICODE)]),
+]
+defaults = {
+	'gc': gc_values['Cn'],
+	'ccc': 0,
+	'sc': sc_values['Zzzz'],
+	'use': use_values['O'],
+	'indic': indic_value ('X', 'END'),
+}
+
+# Bit layout of the palette entries.
+fields = []
+shift = 0
+for name, values in columns:
+	bits = max (max (values), 1).bit_length ()
+	fields.append ((name, shift, (1 << bits) - 1))
+	shift += bits
+palette_type = 'uint32_t' if shift <= 32 else 'uint64_t'
+
+def encode (values):
+	v = 0
+	for (_, shift, _), x in zip (fields, values):
+		v |= x << shift
+	return v
+
+palette = [encode (defaults[name] for name, _, _ in fields)]
+palette_index = {palette[0]: 0}
+index = []
+for values in zip (*(values for _, values in columns)):
+	v = encode (values)
+	i = palette_index.get (v)
+	if i is None:
+		i = palette_index[v] = len (palette)
+		palette.append (v)
+	index.append (i)
+del columns
+
+logging.info ('  %d code points, %d distinct combinations, %d bits' % (len (index), len (palette), shift))
+
+
+DEFAULT = 5
+COMPACT = 9
+
+def accessors (prefix, palette_name, sc_map_name):
+	"""Returns the C functions returning the palette entry of a code point
+	and the fields of an entry."""
+	lines = [
+		'static inline %s' % palette_type,
+		'%s_get (unsigned u)' % prefix,
+		'{',
+		'  return %s[%s_index (u)];' % (palette_name, prefix),
+		'}',
+	]
+	for name, shift, mask in fields:
+		value = '(v >> %d) & 0x%Xu' % (shift, mask)
+		retType = 'unsigned'
+		if name == 'gc':
+			retType, value = 'hb_unicode_general_category_t', '(hb_unicode_general_category_t) (%s)' % value
+		elif name == 'sc':
+			retType, value = 'hb_script_t', '%s[%s]' % (sc_map_name, value)
+		lines.extend ([
+			'static inline %s' % retType,
+			'%s_%s (%s v)' % (prefix, name, palette_type),
+			'{',
+			'  return %s;' % value,
+			'}',
+		])
+	return '\n'.join (lines)
+
+def print_table ():
+	logging.info ('Generating output...')
+	print ("/* == Start of generated table == */")
+	print ("/*")
+	print (" * The following table is generated by running:")
+	print (" *")
+	print (" *   ./gen-fused-table.py ucd.nounihan.grouped.xml IndicSyllabicCategory.txt IndicPositionalCategory.txt ArabicShaping.txt DerivedCoreProperties.txt UnicodeData.txt Blocks.txt Scripts.txt IndicSyllabicCategory-Additional.txt IndicPositionalCategory-Additional.txt")
+	print (" *")
+	print (" * on file with this description:", ucd.description)
+	print (" * and files with these headers:")
+	print (" *")
+	for h in use['headers']:
+		for l in h:
+			print (" * %s" % (l.strip ()))
+	print (" */")
+	print ()
+	print ("#ifndef HB_OT_SHAPER_FUSED_TABLE_HH")
+	print ("#define HB_OT_SHAPER_FUSED_TABLE_HH")
+	print ()
+	print ('#include "hb.hh"')
+	print ()
+	print ("/*")
+	print (" * Palette entries are bitfields of:")
+	print (" *")
+	for name, shift, mask in fields:
+		print (" *   %-6s bits %2d..%2d" % (name, shift, shift + mask.bit_length () - 1))
+	print (" *")
+	print (" * The use value is a USE() category and the indic value is as")
+	print (" * returned by hb_indic_get_categories(), with the numbering of the")
+	print (" * ragel machines and ot_position_t at generation time.")
+	print (" */")
+	print ()
+
+	code = packTab.Code ('_hb_fused')
+	sc_map_name, _ = code.addArray ('hb_script_t', 'sc_map', sc_array)
+	palette_name, _ = code.addArray (palette_type, 'palette', ['0x%Xu' % v for v in palette])
+	code.print_c (linkage='static inline')
+
+	for compression in (DEFAULT, COMPACT):
+
+		logging.info ('  Compression=%d:' % compression)
+		print ()
+		if compression == DEFAULT:
+			print ('#ifndef HB_OPTIMIZE_SIZE')
+		elif compression == COMPACT:
+			print ('#else')
+		else:
+			assert False
+		print ()
+
+		code = packTab.Code ('_hb_fused')
+		sol = packTab.pack_table (index, 0, compression=compression)
+		logging.info ('      FullCost=%d' % (sol.fullCost))
+		sol.genCode (code, 'index')
+		code.print_c (linkage='static inline')
+		print ()
+
+	print ('#endif')
+	print ()
+	print (accessors ('_hb_fused', palette_name, sc_map_name))
+	print ()
+	print ("#endif /* HB_OT_SHAPER_FUSED_TABLE_HH */")
+	print ()
+	print ("/* == End of generated table == */")
+	logging.info ('Done.')
+
+
+HARNESS = r'''
+#include "hb.hh"
+#include "hb-ucd-table.hh"
+#include "hb-ot-shaper-use-machine.hh"
+#include "hb-ot-shaper-use-table.hh"
+#include "hb-ot-shaper-indic-table.cc"
+#include "hb-ot-shaper-fused-table.hh"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+static unsigned long
+run_separate (const unsigned *u, unsigned n)
+{
+  unsigned long acc = 0;
+  for (unsigned i = 0; i < n; i++)
+    acc += _hb_ucd_gc (u[i]) + _hb_ucd_ccc (u[i]) + _hb_ucd_sc_map[_hb_ucd_sc (u[i])] +
+	   hb_use_get_category (u[i]) + hb_indic_get_categories (u[i]);
+  return acc;
+}
+
+static unsigned long
+run_fused (const unsigned *u, unsigned n)
+{
+  unsigned long acc = 0;
+  for (unsigned i = 0; i < n; i++)
+  {
+    auto v = _hb_fused_get (u[i]);
+    acc += _hb_fused_gc (v) + _hb_fused_ccc (v) + _hb_fused_sc (v) + _hb_fused_use (v) + _hb_fused_indic (v);
+  }
+  return acc;
+}
+
+static double
+best_ns (unsigned long (*run) (const unsigned *, unsigned), const unsigned *u, unsigned n, unsigned reps)
+{
+  double best = 1e30;
+  volatile unsigned long acc = 0;
+  for (unsigned r = 0; r < 5; r++)
+  {
+    struct timespec t0, t1;
+    clock_gettime (CLOCK_MONOTONIC, &t0);
+    for (unsigned i = 0; i < reps; i++)
+      acc += run (u, n);
+    clock_gettime (CLOCK_MONOTONIC, &t1);
+    double ns = ((t1.tv_sec - t0.tv_sec) * 1e9 + (t1.tv_nsec - t0.tv_nsec)) / ((double) reps * n);
+    if (ns < best) best = ns;
+  }
+  return best;
+}
+
+#define CHECK(name, fused, separate) \
+  if ((unsigned) (fused) != (unsigned) (separate)) \
+  { \
+    fprintf (stderr, "Mismatch of %s at U+%04X: fused %u, separate %u\n", \
+	     name, u, (unsigned) (fused), (unsigned) (separate)); \
+    return 1; \
+  }
+
+int
+main (int argc, char **argv)
+{
+  for (unsigned u = 0; u < 0x110000u; u++)
+  {
+    auto v = _hb_fused_get (u);
+    CHECK ("gc", _hb_fused_gc (v), _hb_ucd_gc (u));
+    CHECK ("ccc", _hb_fused_ccc (v), _hb_ucd_ccc (u));
+    CHECK ("sc", _hb_fused_sc (v), _hb_ucd_sc_map[_hb_ucd_sc (u)]);
+    CHECK ("use", _hb_fused_use (v), hb_use_get_category (u));
+    CHECK ("indic", _hb_fused_indic (v), hb_indic_get_categories (u));
+  }
+
+  if (argc < 2)
+    return 0;
+  unsigned reps = atoi (argv[1]);
+  for (int arg = 2; arg < argc; arg++)
+  {
+    FILE *f = fopen (argv[arg], "rb");
+    if (!f) return 1;
+    fseek (f, 0, SEEK_END);
+    unsigned n = ftell (f) / 4;
+    fseek (f, 0, SEEK_SET);
+    unsigned *u = (unsigned *) malloc (n * 4);
+    if (fread (u, 4, n, f) != n) return 1;
+    fclose (f);
+
+    printf ("%f %f\n", best_ns (run_separate, u, n, reps), best_ns (run_fused, u, n, reps));
+    free (u);
+  }
+  return 0;
+}
+'''
+
+def build (tmpdir, extra_cxxflags=()):
+	"""Generates the fused table, and the separate tables from the same
+	input files, in tmpdir and compiles them into the harness there;
+	returns its path."""
+	cxx = shlex.split (os.environ.get ('CXX', 'c++'))
+	cxxflags = shlex.split (os.environ.get ('CXXFLAGS', '-O2')) + list (extra_cxxflags)
+
+	tables = (
+		('hb-ot-shaper-fused-table.hh', 'gen-fused-table.py', args),
+		('hb-ucd-table.hh', 'gen-ucd-table.py', (args[0], hb_common_h)),
+		('hb-ot-shaper-use-table.hh', 'gen-use-table.py', args[1:10]),
+		('hb-ot-shaper-indic-table.cc', 'gen-indic-table.py', (args[1], args[2], args[6])),
+	)
+	for table, script, script_args in tables:
+		path = os.path.join (tmpdir, table)
+		if os.path.exists (path):
+			continue
+		logging.info ('Running %s...' % script)
+		with open (path, 'w') as f:
+			subprocess.run ([sys.executable, os.path.join (srcdir, script)] + list (script_args), check=True, stdout=f)
+
+	src = os.path.join (tmpdir, 'fused.cc')
+	exe = os.path.join (tmpdir, 'fused')
+	with open (src, 'w') as f:
+		f.write (HARNESS)
+	# The generated tables in tmpdir take precedence over those of srcdir.
+	subprocess.run (cxx + cxxflags + ['-I', tmpdir, '-I', srcdir, '-o', exe, src], check=True)
+	return exe
+
+def run_verify ():
+	with tempfile.TemporaryDirectory () as tmpdir:
+		for name, flags in (('default', []), ('HB_OPTIMIZE_SIZE', ['-DHB_OPTIMIZE_SIZE'])):
+			exe = build (tmpdir, flags)
+			if subprocess.run ([exe]).returncode:
+				sys.exit ('The fused and separate tables disagree (%s).' % name)
+			print ('%s: the fused and separate tables agree on all code points.' % name)
+
+def run_benchmark ():
+	texts = sorted (glob.glob (os.path.join (srcdir, '..', 'perf', 'texts', '*.txt')))
+
+	with tempfile.TemporaryDirectory () as tmpdir:
+
+		exe = build (tmpdir)
+		print ('%-30s %12s %12s' % ('text', 'separate ns', 'fused ns'))
+		for text in texts:
+			with open (text, encoding='utf-8') as f:
+				cps = [ord (c) for c in f.read ()]
+			path = os.path.join (tmpdir, 'text.u32')
+			with open (path, 'wb') as f:
+				f.write (struct.pack ('<%dI' % len (cps), *cps))
+			# Aim for roughly ten million lookups per text.
+			reps = max (1, 10000000 // max (1, len (cps)))
+			p = subprocess.run ([exe, str (reps), path], stdout=subprocess.PIPE, universal_newlines=True)
+			if p.returncode:
+				sys.exit ('The fused and separate tables disagree.')
+			separate_ns, fused_ns = (float (x) for x in p.stdout.split ())
+			print ('%-30s %12.3f %12.3f' % (os.path.basename (text), separate_ns, fused_ns))
+
+
+if verify:
+	run_verify ()
+elif benchmark:
+	run_benchmark ()
+else:
+	print_table ()
@@ -1,6 +1,16 @@
 #!/usr/bin/env python3
 
-"""usage: ./gen-indic-table.py IndicSyllabicCategory.txt IndicPositionalCategory.txt Blocks.txt
+"""usage: ./gen-indic-table.py [--packtab | --benchmark] IndicSyllabicCategory.txt IndicPositionalCategory.txt Blocks.txt
+
+By default, the categories are stored in a flat table of the Indic blocks,
+looked up through a switch on the code point.  With --packtab, they are
+packed with packTab instead.
+
+With --benchmark, both layouts are generated and compiled into a small
+benchmark that checks they agree, then prints their table size and the
+nanoseconds per hb_indic_get_categories() call over the perf texts.
+The C++ compiler and flags are taken from $CXX and $CXXFLAGS (default:
+c++ -O2).
 
 Input files:
 * https://unicode.org/Public/UCD/latest/ucd/IndicSyllabicCategory.txt
@@ -10,9 +20,112 @@ Input files:
 
 import sys
 
-if len (sys.argv) != 4:
+packtab = '--packtab' in sys.argv[1:]
+benchmark = '--benchmark' in sys.argv[1:]
+args = [arg for arg in sys.argv[1:] if arg not in ('--packtab', '--benchmark')]
+
+if len (args) != 3 or packtab and benchmark:
 	sys.exit (__doc__)
 
+HARNESS = r'''
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+int
+main (int argc, char **argv)
+{
+  /* Checksum of all values, to compare layouts. */
+  unsigned long h = 0;
+  for (unsigned u = 0; u < 0x110000u; u++)
+    h = h * 31 + hb_indic_get_categories (u);
+  printf ("%lu\n", h);
+
+  unsigned reps = atoi (argv[1]);
+  for (int arg = 2; arg < argc; arg++)
+  {
+    FILE *f = fopen (argv[arg], "rb");
+    if (!f) return 1;
+    fseek (f, 0, SEEK_END);
+    unsigned n = ftell (f) / 4;
+    fseek (f, 0, SEEK_SET);
+    unsigned *u = (unsigned *) malloc (n * 4);
+    if (fread (u, 4, n, f) != n) return 1;
+    fclose (f);
+
+    double best = 1e30;
+    unsigned long acc = 0;
+    for (unsigned run = 0; run < 5; run++)
+    {
+      struct timespec t0, t1;
+      clock_gettime (CLOCK_MONOTONIC, &t0);
+      for (unsigned r = 0; r < reps; r++)
+	for (unsigned i = 0; i < n; i++)
+	  acc += hb_indic_get_categories (u[i]);
+      clock_gettime (CLOCK_MONOTONIC, &t1);
+      double ns = ((t1.tv_sec - t0.tv_sec) * 1e9 + (t1.tv_nsec - t0.tv_nsec)) / ((double) reps * n);
+      if (ns < best) best = ns;
+    }
+    printf ("%f %lu\n", best, acc);
+    free (u);
+  }
+  return 0;
+}
+'''
+
+def run_benchmark ():
+	import glob, os, re, shlex, struct, subprocess, tempfile
+
+	srcdir = os.path.dirname (os.path.abspath (__file__))
+	texts = sorted (glob.glob (os.path.join (srcdir, '..', 'perf', 'texts', '*.txt')))
+	cxx = shlex.split (os.environ.get ('CXX', 'c++'))
+	cxxflags = shlex.split (os.environ.get ('CXXFLAGS', '-O2'))
+
+	with tempfile.TemporaryDirectory () as tmpdir:
+
+		inputs = []
+		for text in texts:
+			with open (text, encoding='utf-8') as f:
+				cps = [ord (c) for c in f.read ()]
+			path = os.path.join (tmpdir, os.path.basename (text) + '.u32')
+			with open (path, 'wb') as f:
+				f.write (struct.pack ('<%dI' % len (cps), *cps))
+			inputs.append ((path, len (cps)))
+
+		results = []
+		for layout, options in (('switch', []), ('packtab', ['--packtab'])):
+			table = os.path.join (tmpdir, 'indic-table-%s.cc' % layout)
+			with open (table, 'w') as f:
+				subprocess.run ([sys.executable, os.path.abspath (__file__)] + options + args, check=True, stdout=f)
+			with open (table) as f:
+				generated = f.read ()
+			m = re.search (r'Table items: (\d+)', generated)
+			size = 2 * int (m.group (1)) if m else int (re.search (r'Table bytes: (\d+)', generated).group (1))
+
+			src = os.path.join (tmpdir, 'bench-%s.cc' % layout)
+			exe = os.path.join (tmpdir, 'bench-%s' % layout)
+			with open (src, 'w') as f:
+				f.write ('#include "%s"\n' % table)
+				f.write (HARNESS)
+			subprocess.run (cxx + cxxflags + ['-I', srcdir, '-o', exe, src], check=True)
+
+			# Aim for roughly ten million lookups per text.
+			reps = max (1, 10000000 // max (1, max (n for _, n in inputs)))
+			out = subprocess.run ([exe, str (reps)] + [p for p, _ in inputs], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.split ('\n')
+			results.append ((layout, size, out[0], [float (l.split ()[0]) for l in out[1:] if l]))
+
+	if results[0][2] != results[1][2]:
+		sys.exit ('The two layouts disagree.')
+
+	names = [os.path.splitext (os.path.basename (t))[0] for t in texts]
+	print ('%-8s %8s %s' % ('layout', 'bytes', ' '.join ('%12s' % n[:12] for n in names)))
+	for layout, size, _, times in results:
+		print ('%-8s %8d %s' % (layout, size, ' '.join ('%12.3f' % t for t in times)))
+
+if benchmark:
+	run_benchmark ()
+	sys.exit (0)
+
 ALLOWED_SINGLES = [0x00A0, 0x25CC]
 ALLOWED_BLOCKS = [
 	'Basic Latin',
@@ -36,44 +149,15 @@ ALLOWED_BLOCKS = [
 	'Myanmar Extended-A',
 ]
 
-files = [open (x, encoding='utf-8') for x in sys.argv[1:]]
-
-headers = [[f.readline () for i in range (2)] for f in files]
+import ucd_loader
 
-unicode_data = [{} for _ in files]
-for i, f in enumerate (files):
-	for line in f:
-
-		j = line.find ('#')
-		if j >= 0:
-			line = line[:j]
-
-		fields = [x.strip () for x in line.split (';')]
-		if len (fields) == 1:
-			continue
-
-		uu = fields[0].split ('..')
-		start = int (uu[0], 16)
-		if len (uu) == 1:
-			end = start
-		else:
-			end = int (uu[1], 16)
+unicode_data = [ucd_loader.load (x) for x in args]
 
-		t = fields[1]
-
-		for u in range (start, end + 1):
-			unicode_data[i][u] = t
+headers = [p.header[:2] for p in unicode_data]
 
 # Merge data into one dict:
 defaults = ('Other', 'Not_Applicable', 'No_Block')
-combined = {}
-for i,d in enumerate (unicode_data):
-	for u,v in d.items ():
-		if i == 2 and not u in combined:
-			continue
-		if not u in combined:
-			combined[u] = list (defaults)
-		combined[u][i] = v
+combined = ucd_loader.combine (unicode_data, defaults, 2)
 combined = {k:v for k,v in combined.items() if k in ALLOWED_SINGLES or v[2] in ALLOWED_BLOCKS}
 
 
@@ -489,7 +573,7 @@ print ("/* == Start of generated table == */")
 print ("/*")
 print (" * The following table is generated by running:")
 print (" *")
-print (" *   ./gen-indic-table.py IndicSyllabicCategory.txt IndicPositionalCategory.txt Blocks.txt")
+print (" *   ./gen-indic-table.py%s IndicSyllabicCategory.txt IndicPositionalCategory.txt Blocks.txt" % (" --packtab" if packtab else ""))
 print (" *")
 print (" * on files with these headers:")
 print (" *")
@@ -591,96 +675,149 @@ print ("#define _(S,M) INDIC_COMBINE_CATEGORIES (%s_##S, %s_##M)" % tuple(what_s
 print ()
 print ()
 
-total = 0
-used = 0
-last_block = None
-def print_block (block, start, end, data):
-	global total, used, last_block
-	if block and block != last_block:
-		print ()
-		print ()
-		print ("  /* %s */" % block)
-	num = 0
-	assert start % 8 == 0
-	assert (end+1) % 8 == 0
-	for u in range (start, end+1):
-		if u % 8 == 0:
+if packtab:
+
+	import packTab
+
+	data = dict (indic_data)
+	data.update (singles)
+	palette = [defaults[:2]] + sorted (set (v[:2] for v in data.values ()) - {defaults[:2]})
+	palette_index = {v: i for i, v in enumerate (palette)}
+	data = {u: palette_index[v[:2]] for u, v in data.items ()}
+
+	print ("static const uint16_t indic_values[] = {")
+	for i, d in enumerate (palette):
+		if i % 8 == 0:
 			print ()
-			print ("  /* %04X */" % u, end="")
-		if u in data:
-			num += 1
-		d = data.get (u, defaults)
+			print ("  /* %3d */" % i, end="")
 		print ("%9s" % ("_(%s,%s)," % (short[0][d[0]], short[1][d[1]])), end="")
+	print ()
+	print ()
+	print ("};")
 
-	total += end - start + 1
-	used += num
-	if block:
-		last_block = block
-
-uu = sorted (indic_data)
-
-last = -100000
-num = 0
-offset = 0
-starts = []
-ends = []
-print ("static const uint16_t indic_table[] = {")
-for u in uu:
-	if u <= last:
-		continue
-	block = indic_data[u][2]
-
-	start = u//8*8
-	end = start+1
-	while end in uu and block == indic_data[end][2]:
-		end += 1
-	end = (end-1)//8*8 + 7
-
-	if start != last + 1:
-		if start - last <= 1+16*2:
-			print_block (None, last+1, start-1, indic_data)
+	DEFAULT = 5
+	COMPACT = 9
+	for compression in (DEFAULT, COMPACT):
+		print ()
+		if compression == DEFAULT:
+			print ('#ifndef HB_OPTIMIZE_SIZE')
+		elif compression == COMPACT:
+			print ('#else')
 		else:
-			if last >= 0:
-				ends.append (last + 1)
-				offset += ends[-1] - starts[-1]
+			assert False
+		print ()
+
+		code = packTab.Code ('_hb_indic')
+		sol = packTab.pack_table (data, 0, compression=compression)
+		sol.genCode (code, 'index')
+		# file is passed explicitly so that redirecting sys.stdout, as
+		# gen-fused-table.py does, also silences the table.
+		code.print_c (file=sys.stdout, linkage='static inline')
+		print ()
+		print ("/* Table bytes: %d */" % (sol.cost + 2 * len (palette)))
+		print ()
+
+	print ('#endif')
+	print ()
+	print ("uint16_t")
+	print ("hb_indic_get_categories (hb_codepoint_t u)")
+	print ("{")
+	print ("  return indic_values[_hb_indic_index (u)];")
+	print ("}")
+	print ()
+
+else:
+
+	total = 0
+	used = 0
+	last_block = None
+	def print_block (block, start, end, data):
+		global total, used, last_block
+		if block and block != last_block:
 			print ()
 			print ()
-			print ("#define indic_offset_0x%04xu %d" % (start, offset))
-			starts.append (start)
-
-	print_block (block, start, end, indic_data)
-	last = end
-ends.append (last + 1)
-offset += ends[-1] - starts[-1]
-print ()
-print ()
-occupancy = used * 100. / total
-page_bits = 12
-print ("}; /* Table items: %d; occupancy: %d%% */" % (offset, occupancy))
-print ()
-print ("uint16_t")
-print ("hb_indic_get_categories (hb_codepoint_t u)")
-print ("{")
-print ("  switch (u >> %d)" % page_bits)
-print ("  {")
-pages = set ([u>>page_bits for u in starts+ends+list (singles.keys ())])
-for p in sorted(pages):
-	print ("    case 0x%0Xu:" % p)
-	for u,d in singles.items ():
-		if p != u>>page_bits: continue
-		print ("      if (unlikely (u == 0x%04Xu)) return _(%s,%s);" % (u, short[0][d[0]], short[1][d[1]]))
-	for (start,end) in zip (starts, ends):
-		if p not in [start>>page_bits, end>>page_bits]: continue
-		offset = "indic_offset_0x%04xu" % start
-		print ("      if (hb_in_range<hb_codepoint_t> (u, 0x%04Xu, 0x%04Xu)) return indic_table[u - 0x%04Xu + %s];" % (start, end-1, start, offset))
+			print ("  /* %s */" % block)
+		num = 0
+		assert start % 8 == 0
+		assert (end+1) % 8 == 0
+		for u in range (start, end+1):
+			if u % 8 == 0:
+				print ()
+				print ("  /* %04X */" % u, end="")
+			if u in data:
+				num += 1
+			d = data.get (u, defaults)
+			print ("%9s" % ("_(%s,%s)," % (short[0][d[0]], short[1][d[1]])), end="")
+
+		total += end - start + 1
+		used += num
+		if block:
+			last_block = block
+
+	uu = sorted (indic_data)
+
+	last = -100000
+	num = 0
+	offset = 0
+	starts = []
+	ends = []
+	print ("static const uint16_t indic_table[] = {")
+	for u in uu:
+		if u <= last:
+			continue
+		block = indic_data[u][2]
+
+		start = u//8*8
+		end = start+1
+		while end in indic_data and block == indic_data[end][2]:
+			end += 1
+		end = (end-1)//8*8 + 7
+
+		if start != last + 1:
+			if start - last <= 1+16*2:
+				print_block (None, last+1, start-1, indic_data)
+			else:
+				if last >= 0:
+					ends.append (last + 1)
+					offset += ends[-1] - starts[-1]
+				print ()
+				print ()
+				print ("#define indic_offset_0x%04xu %d" % (start, offset))
+				starts.append (start)
+
+		print_block (block, start, end, indic_data)
+		last = end
+	ends.append (last + 1)
+	offset += ends[-1] - starts[-1]
+	print ()
+	print ()
+	occupancy = used * 100. / total
+	page_bits = 12
+	print ("}; /* Table items: %d; occupancy: %d%% */" % (offset, occupancy))
+	print ()
+	print ("uint16_t")
+	print ("hb_indic_get_categories (hb_codepoint_t u)")
+	print ("{")
+	print ("  switch (u >> %d)" % page_bits)
+	print ("  {")
+	pages = set ([u>>page_bits for u in starts+ends+list (singles.keys ())])
+	for p in sorted(pages):
+		print ("    case 0x%0Xu:" % p)
+		for u,d in singles.items ():
+			if p != u>>page_bits: continue
+			print ("      if (unlikely (u == 0x%04Xu)) return _(%s,%s);" % (u, short[0][d[0]], short[1][d[1]]))
+		for (start,end) in zip (starts, ends):
+			if p not in [start>>page_bits, end>>page_bits]: continue
+			offset = "indic_offset_0x%04xu" % start
+			print ("      if (hb_in_range<hb_codepoint_t> (u, 0x%04Xu, 0x%04Xu)) return indic_table[u - 0x%04Xu + %s];" % (start, end-1, start, offset))
+		print ("      break;")
+		print ("")
+	print ("    default:")
 	print ("      break;")
-	print ("")
-print ("    default:")
-print ("      break;")
-print ("  }")
-print ("  return _(X,X);")
-print ("}")
-print ()
+	print ("  }")
+	print ("  return _(X,X);")
+	print ("}")
+	print ()
 print ("#undef _")
 print ("#undef INDIC_COMBINE_CATEGORIES")
 for i in range (2):
@@ -695,5 +832,5 @@ print ()
 print ("/* == End of generated table == */")
 
 # Maintain at least 50% occupancy in the table */
-if occupancy < 50:
+if not packtab and occupancy < 50:
 	raise Exception ("Table too sparse, please investigate: ", occupancy)
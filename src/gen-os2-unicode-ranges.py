@@ -3,13 +3,19 @@
 """Generates the code for a sorted unicode range array as used in hb-ot-os2-unicode-ranges.hh
 Input is a tab separated list of unicode ranges from the otspec
 (https://docs.microsoft.com/en-us/typography/opentype/spec/os2#ur).
+
+Besides the array, which is binary-searched when optimizing for size, a
+packTab table mapping each codepoint directly to its bit is generated.
 """
 
 import re
 import sys
 
+# https://github.com/harfbuzz/packtab
+import packTab
+
 
-print ("""static OS2Range _hb_os2_unicode_ranges[] =
+print ("""static const OS2Range _hb_os2_unicode_ranges[] =
 {""")
 
 args = sys.argv[1:]
@@ -48,3 +54,21 @@ for ranges in all_ranges:
   print ("  {%s, %s, %s}, // %s" % (start, end, bit, ranges[3]))
 
 print ("""};""")
+
+# Codepoints in no range map to 0xFF, which is not a valid bit.  The
+# lowest compression gives the fewest lookups: the subsetter looks up
+# every retained codepoint.
+data = {}
+for start, end, bit, _ in all_ranges:
+  for u in range(start, end + 1):
+    data[u] = bit
+
+print ()
+print ("#ifndef HB_OPTIMIZE_SIZE")
+print ()
+code = packTab.Code('_hb_os2_unicode_range')
+sol = packTab.pack_table(data, 0xFF, compression=1)
+sol.genCode(code, 'bit')
+code.print_c(linkage='static inline')
+print ()
+print ("#endif")
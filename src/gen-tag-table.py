@@ -17,14 +17,34 @@ multiple BCP 47 tags) are listed here, except when the alphabetically
 first BCP 47 tag happens to be the chosen disambiguated tag. In that
 case, the fallback behavior will choose the right tag anyway.
 
-usage: ./gen-tag-table.py languagetags language-subtag-registry
+usage: ./gen-tag-table.py [--trie] [--hash] languagetags language-subtag-registry
+       ./gen-tag-table.py --benchmark languagetags language-subtag-registry
+
+By default, ``hb_ot_tags_from_complex_language`` switches on the first
+letter of the tag and then tries each complex tag starting with it in
+turn. With --trie, it instead walks a character trie of the language
+subtags, so that only the complex tags with the same language subtag are
+tried.
+
+With --hash, collision-free hashes of the languages of ``ot_languages2``
+and ``ot_languages3`` are generated too, and ``hb-ot-tag.cc`` finds
+languages with them instead of with a binary search. Every language is
+checked to give the same OpenType tags with either lookup.
+
+With --benchmark, both variants of ``hb_ot_tags_from_complex_language``
+are generated and compiled into a small benchmark that checks they
+return the same tags for every tag in the registries, then prints the
+nanoseconds per call for simple and complex tags. The C++ compiler and
+flags are taken from $CXX and $CXXFLAGS (default: c++ -O2).
 
 Input files:
 * https://docs.microsoft.com/en-us/typography/opentype/spec/languagetags
 * https://www.iana.org/assignments/language-subtag-registry/language-subtag-registry
 """
 
+import bisect
 import collections
+import functools
 import html
 from html.parser import HTMLParser
 import itertools
@@ -32,7 +52,12 @@ import re
 import sys
 import unicodedata
 
-if len (sys.argv) != 3:
+trie = '--trie' in sys.argv[1:]
+hash_table = '--hash' in sys.argv[1:]
+benchmark = '--benchmark' in sys.argv[1:]
+args = [arg for arg in sys.argv[1:] if arg not in ('--trie', '--hash', '--benchmark')]
+
+if len (args) != 2 or benchmark and (trie or hash_table):
 	sys.exit (__doc__)
 
 def expect (condition, message=None):
@@ -45,6 +70,143 @@ def write (s):
 	sys.stdout.flush ()
 	sys.stdout.buffer.write (s.encode ('utf-8'))
 
+HARNESS = r'''
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+static char **
+load_tags (const char *path, unsigned *n)
+{
+  FILE *f = fopen (path, "rb");
+  if (!f) exit (1);
+  fseek (f, 0, SEEK_END);
+  long size = ftell (f);
+  fseek (f, 0, SEEK_SET);
+  char *text = (char *) malloc (size + 1);
+  if (fread (text, 1, size, f) != (size_t) size) exit (1);
+  fclose (f);
+  text[size] = '\0';
+
+  char **tags = (char **) malloc ((size + 1) * sizeof (char *));
+  *n = 0;
+  for (char *s = text; *s; )
+  {
+    char *e = strchr (s, '\n');
+    *e = '\0';
+    tags[(*n)++] = s;
+    s = e + 1;
+  }
+  return tags;
+}
+
+int
+main (int argc, char **argv)
+{
+  /* The tags retrieved for each tag, to compare the variants. */
+  unsigned n;
+  char **tags = load_tags (argv[2], &n);
+  for (unsigned i = 0; i < n; i++)
+  {
+    hb_tag_t ot_tags[4];
+    unsigned count = 4;
+    bool ret = hb_ot_tags_from_complex_language (tags[i], tags[i] + strlen (tags[i]), &count, ot_tags);
+    printf ("%s %d", tags[i], ret);
+    for (unsigned j = 0; ret && j < count; j++)
+      printf (" %08x", ot_tags[j]);
+    printf ("\n");
+  }
+
+  unsigned reps = atoi (argv[1]);
+  for (int arg = 3; arg < argc; arg++)
+  {
+    tags = load_tags (argv[arg], &n);
+    const char **limits = (const char **) malloc (n * sizeof (char *));
+    for (unsigned i = 0; i < n; i++)
+      limits[i] = tags[i] + strlen (tags[i]);
+
+    double best = 1e30;
+    unsigned long acc = 0;
+    for (unsigned run = 0; run < 5; run++)
+    {
+      struct timespec t0, t1;
+      clock_gettime (CLOCK_MONOTONIC, &t0);
+      for (unsigned r = 0; r < reps; r++)
+	for (unsigned i = 0; i < n; i++)
+	{
+	  hb_tag_t ot_tags[4];
+	  unsigned count = 4;
+	  if (hb_ot_tags_from_complex_language (tags[i], limits[i], &count, ot_tags))
+	    acc += count + ot_tags[0];
+	}
+      clock_gettime (CLOCK_MONOTONIC, &t1);
+      double ns = ((t1.tv_sec - t0.tv_sec) * 1e9 + (t1.tv_nsec - t0.tv_nsec)) / ((double) reps * n);
+      if (ns < best) best = ns;
+    }
+    printf ("%f %lu\n", best, acc);
+  }
+  return 0;
+}
+'''
+
+def run_benchmark (corpora):
+	"""Compiles both variants of ``hb_ot_tags_from_complex_language``
+	into the benchmark harness, checks that they agree on the tags of
+	the first corpus, and times them on the other ones.
+
+	Args:
+		corpora (List[Tuple[str, List[str]]]): Named lists of
+			lowercase BCP 47 tags.
+	"""
+	import os, shlex, subprocess, tempfile
+
+	srcdir = os.path.dirname (os.path.abspath (__file__))
+	cxx = shlex.split (os.environ.get ('CXX', 'c++'))
+	cxxflags = shlex.split (os.environ.get ('CXXFLAGS', '-O2'))
+
+	# The helpers the generated code uses, from hb-ot-tag.cc.
+	with open (os.path.join (srcdir, 'hb-ot-tag.cc'), encoding='utf-8') as f:
+		helpers = re.search (r'/\* hb_language_t \*/\n(.*?)#include "hb-ot-tag-table.hh"', f.read (), re.S).group (1)
+
+	with tempfile.TemporaryDirectory () as tmpdir:
+
+		inputs = []
+		for name, tags in corpora:
+			path = os.path.join (tmpdir, name + '.txt')
+			with open (path, 'w', encoding='utf-8') as f:
+				f.write (''.join (tag + '\n' for tag in tags))
+			inputs.append ((path, len (tags)))
+
+		results = []
+		for variant, options in (('switch', []), ('trie', ['--trie'])):
+			table = os.path.join (tmpdir, 'tag-table-%s.hh' % variant)
+			with open (table, 'w') as f:
+				subprocess.run ([sys.executable, os.path.abspath (__file__)] + options + args, check=True, stdout=f)
+
+			src = os.path.join (tmpdir, 'bench-%s.cc' % variant)
+			exe = os.path.join (tmpdir, 'bench-%s' % variant)
+			with open (src, 'w', encoding='utf-8') as f:
+				f.write ('#include "hb.hh"\n')
+				f.write (helpers)
+				f.write ('#include "%s"\n' % table)
+				f.write (HARNESS)
+			subprocess.run (cxx + cxxflags + ['-I', srcdir, '-o', exe, src], check=True)
+
+			# Aim for roughly ten million calls per corpus.
+			reps = max (1, 10000000 // max (n for _, n in inputs[1:]))
+			out = subprocess.run ([exe, str (reps)] + [p for p, _ in inputs], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.split ('\n')
+			checked = inputs[0][1]
+			results.append ((variant, out[:checked], [float (l.split ()[0]) for l in out[checked:] if l]))
+
+	for a, b in zip (results[0][1], results[1][1]):
+		if a != b:
+			sys.exit ('The two variants disagree: %s vs. %s' % (a, b))
+
+	names = [name for name, _ in corpora[1:]]
+	print ('%-8s %s' % ('variant', ' '.join ('%12s' % n[:12] for n in names)))
+	for variant, _, times in results:
+		print ('%-8s %s' % (variant, ' '.join ('%12.3f' % t for t in times)))
+
 DEFAULT_LANGUAGE_SYSTEM = ''
 
 # from https://www-01.sil.org/iso639-3/iso-639-3.tab
@@ -683,8 +845,46 @@ class BCP47Parser (object):
 
 bcp_47 = BCP47Parser ()
 
-ot.parse (sys.argv[1])
-bcp_47.parse (sys.argv[2])
+def parse_registries (ot_filename, bcp_47_filename):
+	"""Parse the two registries into ``ot`` and ``bcp_47``.
+
+	The parsed registries are cached like the UCD files of the other
+	generators (see ``ucd_loader``), keyed by the contents of both files
+	and by the part of this script above the manual adjustments, which
+	holds the parsers. Parsing the BCP 47 registry depends on the
+	OpenType one, so both are cached together.
+
+	Args:
+		ot_filename (str): The file name of the OpenType registry.
+		bcp_47_filename (str): The file name of the BCP 47 registry.
+	"""
+	import hashlib
+	import ucd_loader
+
+	h = hashlib.sha256 ()
+	for filename in (ot_filename, bcp_47_filename, __file__):
+		with open (filename, 'rb') as f:
+			data = f.read ()
+		if filename == __file__:
+			# Only the parsers matter, not the manual adjustments below.
+			data = data[:data.index (b'\nbcp_47 = BCP47Parser ()\n')]
+		h.update (data)
+	cache = ucd_loader.cache_path (h.hexdigest (), 'gen-tag-table')
+
+	ot_attributes = ('header', 'names', 'ranks', 'to_bcp_47', 'from_bcp_47')
+	state = ucd_loader.cache_read (cache)
+	if state is None:
+		ot.parse (ot_filename)
+		bcp_47.parse (bcp_47_filename)
+		state = ({a: getattr (ot, a) for a in ot_attributes}, vars (bcp_47))
+		ucd_loader.cache_write (cache, state)
+	else:
+		ot_state, bcp_47_state = state
+		for a in ot_attributes:
+			setattr (ot, a, ot_state[a])
+		vars (bcp_47).update (bcp_47_state)
+
+parse_registries (args[0], args[1])
 
 ot.add_language ('ary', 'MOR')
 
@@ -879,11 +1079,25 @@ for tricky_ot_tag in filter (lambda tag: re.match ('[A-Z]{3}$', tag), ot.names):
 		bcp_47.macrolanguages[possible_bcp_47_tag] = set ()
 ot.sort_languages ()
 
+if benchmark:
+	complex_languages = sorted (language.lower () for language in ot.from_bcp_47 if '-' in language)
+	simple_languages = sorted (language for language in ot.from_bcp_47 if language and '-' not in language)
+	run_benchmark ([
+		# Every tag, every proper prefix of the complex ones, and
+		# the simple ones with a region.
+		('check', sorted (set (language.lower () for language in ot.from_bcp_47 if language)
+			| set (language[:i] for language in complex_languages for i in range (1, len (language)))
+			| set (language + '-us' for language in simple_languages))),
+		('simple', [language + '-us' for language in simple_languages]),
+		('complex', complex_languages),
+	])
+	sys.exit (0)
+
 print ('/* == Start of generated table == */')
 print ('/*')
 print (' * The following table is generated by running:')
 print (' *')
-print (' *   %s languagetags language-subtag-registry' % sys.argv[0])
+print (' *   %s%s%s languagetags language-subtag-registry' % (sys.argv[0], ' --trie' if trie else '', ' --hash' if hash_table else ''))
 print (' *')
 print (' * on files with these headers:')
 print (' *')
@@ -908,6 +1122,7 @@ def hb_tag (tag):
 		return 'HB_TAG_NONE\t       '
 	return "HB_TAG('%s','%s','%s','%s')" % tuple (('%-4s' % tag)[:4])
 
+@functools.lru_cache (maxsize=None)
 def get_variant_set (name):
 	"""Return a set of variant language names from a name.
 
@@ -916,9 +1131,9 @@ def get_variant_set (name):
 			joined on ``'\\n'``.
 
 	Returns:
-		A set of normalized language names.
+		A frozen set of normalized language names.
 	"""
-	return set (unicodedata.normalize ('NFD', n.replace ('\u2019', "'"))
+	return frozenset (unicodedata.normalize ('NFD', n.replace ('\u2019', "'"))
 			.encode ('ASCII', 'ignore')
 			.strip ()
 			for n in re.split ('[\n(),]', name) if n)
@@ -943,16 +1158,112 @@ def get_matching_language_name (intersection, candidates):
 def same_tag (bcp_47_tag, ot_tags):
 	return len (bcp_47_tag) == 3 and len (ot_tags) == 1 and bcp_47_tag == ot_tags[0].lower ()
 
+def tag_value (tag):
+	"""Return the ``hb_tag_t`` value of a tag, padded with spaces."""
+	return int.from_bytes (('%-4s' % tag)[:4].encode ('ascii'), 'big')
+
+def make_language_hash (languages):
+	"""Return a collision-free hash of some language tags.
+
+	A language's value ``h`` is multiplied by a constant; the top bits
+	of the product select a displacement and the next bits, plus that
+	displacement, select a slot. The displacements are chosen so that
+	every language gets its own slot, which holds its position in
+	``languages``. Slots left empty hold 0, so callers must compare the
+	language found with the one looked up.
+
+	Args:
+		languages (List[int]): Sorted ``hb_tag_t`` values of the
+			language tags, possibly repeated.
+
+	Returns:
+		A ``(multiplier, displacement_bits, displacements, slot_bits,
+		slots)`` tuple.
+	"""
+	first = {}
+	for i, language in enumerate (languages):
+		first.setdefault (language, i)
+	slot_bits = max (1, (len (first) - 1).bit_length ())
+	for displacement_bits in range (max (1, slot_bits - 2), slot_bits + 1):
+		multiplier = 0x9E3779B1
+		for attempt in range (256):
+			multiplier = (multiplier * 0x2C9277B5 + 0xAC564B05) & 0xFFFFFFFF | 1
+			buckets = collections.defaultdict (list)
+			for language in first:
+				h = language * multiplier & 0xFFFFFFFF
+				buckets[h >> (32 - displacement_bits)].append (h >> (32 - displacement_bits - slot_bits) & ((1 << slot_bits) - 1))
+			if any (len (set (bases)) != len (bases) for bases in buckets.values ()):
+				continue
+			displacements = [0] * (1 << displacement_bits)
+			used = set ()
+			for bucket, bases in sorted (buckets.items (), key=lambda b: (-len (b[1]), b[0])):
+				for d in range (1 << slot_bits):
+					slots = set ((base + d) & ((1 << slot_bits) - 1) for base in bases)
+					if used.isdisjoint (slots):
+						displacements[bucket] = d
+						used |= slots
+						break
+				else:
+					break
+			else:
+				slots = [0] * (1 << slot_bits)
+				for language, i in first.items ():
+					slots[language_hash_slot (language, multiplier, displacement_bits, displacements, slot_bits)] = i
+				return multiplier, displacement_bits, displacements, slot_bits, slots
+	raise AssertionError ('no collision-free hash found')
+
+def language_hash_slot (language, multiplier, displacement_bits, displacements, slot_bits):
+	"""Return the slot of a language in a hash from ``make_language_hash``,
+	computed the same way as the generated code."""
+	h = language * multiplier & 0xFFFFFFFF
+	return ((h >> (32 - displacement_bits - slot_bits)) + displacements[h >> (32 - displacement_bits)]) & ((1 << slot_bits) - 1)
+
+def verify_language_hash (languages, tags, language_hash):
+	"""Verify that looking up every language in a hash from
+	``make_language_hash`` gives the same OpenType tags as a binary
+	search of the sorted table.
+
+	Args:
+		languages (List[int]): The ``language`` column of the table.
+		tags (List[str]): The ``tag`` column of the table.
+		language_hash: The hash of ``languages``.
+
+	Raises:
+		AssertionError: Verification failed.
+	"""
+	multiplier, displacement_bits, displacements, slot_bits, slots = language_hash
+	for language in set (languages):
+		i = bisect.bisect_left (languages, language)
+		j = slots[language_hash_slot (language, multiplier, displacement_bits, displacements, slot_bits)]
+		expect (languages[j] == language and (j == 0 or languages[j - 1] != language),
+				'hash lookup of %08x gives index %d' % (language, j))
+		end = bisect.bisect_right (languages, language)
+		expect (tags[i:end] == tags[j:j + end - i], 'hash lookup of %08x gives different tags' % language)
+
+def print_language_hash (language_len, language_hash):
+	"""Print the arrays of a hash from ``make_language_hash``."""
+	multiplier, displacement_bits, displacements, slot_bits, slots = language_hash
+	for name, values in (('displacements', displacements), ('slots', slots)):
+		print ('static const uint16_t ot_languages%d_hash_%s[%d] = {' % (language_len, name, len (values)))
+		for i in range (0, len (values), 16):
+			print ('  %s' % ''.join ('%5d,' % v for v in values[i:i + 16]))
+		print ('};')
+	print ('/* Hash bytes: %d */' % (2 * (len (displacements) + len (slots))))
+
+language_hashes = {}
 for language_len in (2, 3):
 	if language_len == 3:
 		print ('#ifndef HB_NO_LANGUAGE_LONG')
 	print ('static const LangTag ot_languages%d[] = {' % language_len)
+	rows = []
 	for language, tags in sorted (ot.from_bcp_47.items ()):
 		if language == '' or '-' in language:
 			continue
 		if len(language) != language_len: continue
 		commented_out = same_tag (language, tags)
 		for i, tag in enumerate (tags, start=1):
+			if not commented_out:
+				rows.append ((tag_value (language), tag))
 			print ('%s{%s,\t%s},' % ('/*' if commented_out else '  ', hb_tag (language), hb_tag (tag)), end='')
 			if commented_out:
 				print ('*/', end='')
@@ -973,10 +1284,49 @@ for language_len in (2, 3):
 					write ('%s%s' % (name if len (name) > len (ot_name) else ot_name, scope))
 			print (' */')
 	print ('};')
+	if hash_table:
+		languages = [language for language, _ in rows]
+		language_hashes[language_len] = make_language_hash (languages)
+		verify_language_hash (languages, [tag for _, tag in rows], language_hashes[language_len])
+		print ()
+		print_language_hash (language_len, language_hashes[language_len])
 	if language_len == 3:
 		print ('#endif')
 	print ()
 
+if hash_table:
+	print ('#define HB_OT_TAG_TABLE_HASH 1')
+	print ()
+	print ('/* Finds the first entry of @language in ot_languages2 or ot_languages3,')
+	print (' * depending on @language_len, using the collision-free hashes above. */')
+	print ('static inline bool')
+	print ('ot_languages_hash_find (unsigned  language_len,')
+	print ('\t\t\thb_tag_t  language,')
+	print ('\t\t\tunsigned *tag_idx)')
+	print ('{')
+	print ('  uint32_t h = language;')
+	print ('  unsigned i;')
+	print ('  switch (language_len)')
+	print ('  {')
+	for language_len, (multiplier, displacement_bits, _, slot_bits, _) in sorted (language_hashes.items ()):
+		if language_len == 3:
+			print ('#ifndef HB_NO_LANGUAGE_LONG')
+		print ('  case %d:' % language_len)
+		print ('    h *= 0x%08Xu;' % multiplier)
+		print ('    i = ot_languages%d_hash_slots[((h >> %d) + ot_languages%d_hash_displacements[h >> %d]) & %du];' %
+		       (language_len, 32 - displacement_bits - slot_bits, language_len, 32 - displacement_bits, (1 << slot_bits) - 1))
+		print ('    if (ot_languages%d[i].language != language) return false;' % language_len)
+		print ('    break;')
+		if language_len == 3:
+			print ('#endif')
+	print ('  default:')
+	print ('    return false;')
+	print ('  }')
+	print ('  *tag_idx = i;')
+	print ('  return true;')
+	print ('}')
+	print ()
+
 print ('/**')
 print (' * hb_ot_tags_from_complex_language:')
 print (' * @lang_str: a BCP 47 language tag to convert.')
@@ -1067,58 +1417,178 @@ for initial, items in sorted (complex_tags.items ()):
 print ('  }')
 print ('out:')
 
-print ('  switch (lang_str[0])')
-print ('  {')
-for initial, items in sorted (complex_tags.items ()):
-	if initial == 'und':
-		continue
-	print ("  case '%s':" % initial)
-	for lt, tags in items:
-		if not tags:
-			continue
-		print ('    if (', end='')
-		script = lt.script
-		region = lt.region
-		if lt.grandfathered:
-			print ('0 == strcmp (&lang_str[1], "%s")' % lt.language[1:], end='')
+def indentation (n):
+	"""Return ``n`` columns of indentation, using tabs for every eight."""
+	return '\t' * (n // 8) + ' ' * (n % 8)
+
+def print_complex_entry (lt, tags, conditions, n):
+	"""Print the code returning the OpenType tags of a complex tag.
+
+	Args:
+		lt (LanguageTag): A complex BCP 47 language tag.
+		tags (List[str]): Its OpenType tags.
+		conditions (List[str]): The C++ conditions under which
+			``lang_str`` matches ``lt``.
+		n (int): The indentation, in columns.
+	"""
+	i = indentation (n)
+	j = indentation (n + 2)
+	k = indentation (n + 4)
+	print ('%sif (%s)' % (i, ('\n%s&& ' % k).join (conditions)))
+	print ('%s{' % i)
+	write ('%s/* %s */' % (j, bcp_47.get_name (lt)))
+	print ()
+	if len (tags) == 1:
+		write ('%stags[0] = %s;  /* %s */' % (j, hb_tag (tags[0]), ot.names[tags[0]]))
+		print ()
+		print ('%s*count = 1;' % j)
+	else:
+		print ('%sunsigned int i;' % j)
+		print ('%shb_tag_t possible_tags[] = {' % j)
+		for tag in tags:
+			write ('%s%s,  /* %s */' % (k, hb_tag (tag), ot.names[tag]))
+			print ()
+		print ('%s};' % j)
+		print ('%sfor (i = 0; i < %s && i < *count; i++)' % (j, len (tags)))
+		print ('%stags[i] = possible_tags[i];' % k)
+		print ('%s*count = i;' % j)
+	print ('%sreturn true;' % j)
+	print ('%s}' % i)
+
+def print_trie_node (node, depth, n):
+	"""Print the code matching the rest of a language subtag.
+
+	Args:
+		node (Dict[Optional[str], Any]): A trie node, mapping each
+			next character to a child node and ``None`` to the complex
+			tags whose language subtag ends here.
+		depth (int): The index in ``lang_str`` of the next character.
+		n (int): The indentation, in columns.
+	"""
+	if None in node:
+		for lt, tags, conditions in node[None]:
+			print_complex_entry (lt, tags, conditions, n)
+		return
+	i = indentation (n)
+	if len (node) == 1:
+		chain = ''
+		while len (node) == 1 and None not in node:
+			c, node = next (iter (node.items ()))
+			chain += c
+		if len (chain) == 1:
+			print ("%sif (lang_str[%d] == '%s')" % (i, depth, chain))
 		else:
-			string_literal = lt.language[1:] + '-'
-			if script:
-				string_literal += script
+			print ('%sif (0 == strncmp (&lang_str[%d], "%s", %d))' % (i, depth, chain, len (chain)))
+		print ('%s{' % i)
+		print_trie_node (node, depth + len (chain), n + 2)
+		print ('%s}' % i)
+		return
+	print ('%sswitch (lang_str[%d])' % (i, depth))
+	print ('%s{' % i)
+	for c, child in sorted (node.items ()):
+		print ("%scase '%s':" % (i, c))
+		print_trie_node (child, depth + 1, n + 2)
+		print ('%sbreak;' % indentation (n + 2))
+	print ('%s}' % i)
+
+def print_complex_trie (complex_tags):
+	"""Print the matching of the complex tags outside the ``'und'``
+	group, as a trie of their language subtags followed by a ``'-'``.
+
+	Tags with different language subtags cannot both match, so trying
+	only the tags of the matched language subtag, in their original
+	order, gives the same results as trying all of them.
+
+	Args:
+		complex_tags (Mapping[str, List[Tuple[LanguageTag, List[str]]]]):
+			The complex tags, grouped by ``get_group``.
+	"""
+	root = {}
+	for initial, items in sorted (complex_tags.items ()):
+		if initial == 'und':
+			continue
+		for lt, tags in items:
+			if not tags:
+				continue
+			language = lt.language.split ('-')[0] if lt.grandfathered else lt.language
+			start = len (language) + 1
+			script = lt.script
+			region = lt.region
+			conditions = []
+			if lt.grandfathered:
+				conditions.append ('0 == strcmp (&lang_str[%d], "%s")' % (start, lt.language[start:]))
+			elif script:
+				string_literal = script
 				script = None
 				if region:
 					string_literal += '-' + region
 					region = None
-			if string_literal[-1] == '-':
-				print ('0 == strncmp (&lang_str[1], "%s", %i)' % (string_literal, len (string_literal)), end='')
+				conditions.append ('lang_matches (&lang_str[%d], limit, "%s", %i)' % (start, string_literal, len (string_literal)))
+			for subtag in (script, region, lt.variant):
+				if subtag:
+					conditions.append ('subtag_matches (lang_str, limit, "-%s", %i)' % (subtag, 1 + len (subtag)))
+			expect (conditions, 'complex tag without subtags: %s' % lt)
+			node = root
+			for c in language + '-':
+				node = node.setdefault (c, {})
+			node.setdefault (None, []).append ((lt, tags, conditions))
+	print_trie_node (root, 0, 2)
+
+if trie:
+	print_complex_trie (complex_tags)
+else:
+	print ('  switch (lang_str[0])')
+	print ('  {')
+	for initial, items in sorted (complex_tags.items ()):
+		if initial == 'und':
+			continue
+		print ("  case '%s':" % initial)
+		for lt, tags in items:
+			if not tags:
+				continue
+			print ('    if (', end='')
+			script = lt.script
+			region = lt.region
+			if lt.grandfathered:
+				print ('0 == strcmp (&lang_str[1], "%s")' % lt.language[1:], end='')
 			else:
-				print ('lang_matches (&lang_str[1], limit, "%s", %i)' % (string_literal, len (string_literal)), end='')
-		print_subtag_matches (script, 'lang_str', True)
-		print_subtag_matches (region, 'lang_str', True)
-		print_subtag_matches (lt.variant, 'lang_str', True)
-		print (')')
-		print ('    {')
-		write ('      /* %s */' % bcp_47.get_name (lt))
-		print ()
-		if len (tags) == 1:
-			write ('      tags[0] = %s;  /* %s */' % (hb_tag (tags[0]), ot.names[tags[0]]))
+				string_literal = lt.language[1:] + '-'
+				if script:
+					string_literal += script
+					script = None
+					if region:
+						string_literal += '-' + region
+						region = None
+				if string_literal[-1] == '-':
+					print ('0 == strncmp (&lang_str[1], "%s", %i)' % (string_literal, len (string_literal)), end='')
+				else:
+					print ('lang_matches (&lang_str[1], limit, "%s", %i)' % (string_literal, len (string_literal)), end='')
+			print_subtag_matches (script, 'lang_str', True)
+			print_subtag_matches (region, 'lang_str', True)
+			print_subtag_matches (lt.variant, 'lang_str', True)
+			print (')')
+			print ('    {')
+			write ('      /* %s */' % bcp_47.get_name (lt))
 			print ()
-			print ('      *count = 1;')
-		else:
-			print ('      unsigned int i;')
-			print ('      hb_tag_t possible_tags[] = {')
-			for tag in tags:
-				write ('\t%s,  /* %s */' % (hb_tag (tag), ot.names[tag]))
+			if len (tags) == 1:
+				write ('      tags[0] = %s;  /* %s */' % (hb_tag (tags[0]), ot.names[tags[0]]))
 				print ()
-			print ('      };')
-			print ('      for (i = 0; i < %s && i < *count; i++)' % len (tags))
-			print ('\ttags[i] = possible_tags[i];')
-			print ('      *count = i;')
-		print ('      return true;')
-		print ('    }')
-	print ('    break;')
-
-print ('  }')
+				print ('      *count = 1;')
+			else:
+				print ('      unsigned int i;')
+				print ('      hb_tag_t possible_tags[] = {')
+				for tag in tags:
+					write ('\t%s,  /* %s */' % (hb_tag (tag), ot.names[tag]))
+					print ()
+				print ('      };')
+				print ('      for (i = 0; i < %s && i < *count; i++)' % len (tags))
+				print ('\ttags[i] = possible_tags[i];')
+				print ('      *count = i;')
+			print ('      return true;')
+			print ('    }')
+		print ('    break;')
+
+	print ('  }')
 print ('  return false;')
 print ('}')
 print ()
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
-"""usage: ./gen-ucd-table ucd.nounihan.grouped.xml [/path/to/hb-common.h]
+"""usage: ./gen-ucd-table [--direct=N] ucd.nounihan.grouped.xml [/path/to/hb-common.h]
+
+With --direct=N, the default (speed-optimized) tables also get flat
+arrays holding the values of the first N code points, which the lookup
+functions check before going through the packed tables.
 
 Input file:
 * https://unicode.org/Public/UCD/latest/ucdxml/ucd.nounihan.grouped.zip
@@ -8,20 +12,29 @@ Input file:
 
 import sys, re
 import logging
+import hashlib, os, pickle
+import concurrent.futures, multiprocessing
 logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
-if len (sys.argv) not in (2, 3):
+direct = 0
+args = []
+for arg in sys.argv[1:]:
+	if arg.startswith ('--direct='):
+		direct = int (arg[len ('--direct='):])
+	else:
+		args.append (arg)
+
+if len (args) not in (1, 2):
 	sys.exit (__doc__)
 
 # https://github.com/harfbuzz/packtab
 import packTab
-import packTab.ucdxml
+import ucd_loader
 
 logging.info('Loading UCDXML...')
-ucdxml = packTab.ucdxml.load_ucdxml(sys.argv[1])
-ucd = packTab.ucdxml.ucdxml_get_repertoire(ucdxml)
+ucd = ucd_loader.load_ucdxml(args[0], ('gc', 'ccc', 'bmg', 'sc', 'dm', 'dt', 'Comp_Ex'))
 
-hb_common_h = 'hb-common.h' if len (sys.argv) < 3 else sys.argv[2]
+hb_common_h = 'hb-common.h' if len (args) < 2 else args[1]
 
 logging.info('Preparing data tables...')
 
@@ -37,19 +50,23 @@ logging.info('Preparing data tables...')
 # Composition & Decomposition (dm) are encoded elaborately,
 # as discussed below.
 
-gc = [u['gc'] for u in ucd]
-ccc = [int(u['ccc']) for u in ucd]
-bmg = [int(v, 16) - int(u) if v else 0 for u,v in enumerate(u['bmg'] for u in ucd)]
-sc = [u['sc'] for u in ucd]
+gc = ucd['gc'].tolist()
+ccc = ucd['ccc'].map(int).tolist()
+bmg = [int(v, 16) - int(u) if v else 0 for u,v in enumerate(ucd['bmg'].tolist())]
+sc = ucd['sc'].tolist()
 
 
 # Prepare Compose / Decompose data
 #
 # This code is very dense.  See hb_ucd_compose() / hb_ucd_decompose() for the logic.
 
-dm = {i:tuple(int(v, 16) for v in u['dm'].split()) for i,u in enumerate(ucd)
-      if u['dm'] != '#' and u['dt'] == 'can' and not (0xAC00 <= i < 0xAC00+11172)}
-ce = {i for i,u in enumerate(ucd) if u['Comp_Ex'] == 'Y'}
+dt = ucd['dt']
+dm = {i:tuple(int(v, 16) for v in u.split())
+      for start,end,u in ucd['dm'].ranges() if u != '#'
+      for i in range(start, end + 1)
+      if dt[i] == 'can' and not (0xAC00 <= i < 0xAC00+11172)}
+ce = {i for start,end,u in ucd['Comp_Ex'].ranges() if u == 'Y'
+      for i in range(start, end + 1)}
 
 assert not any(v for v in dm.values() if len(v) not in (1,2))
 dm1 = sorted(set(v for v in dm.values() if len(v) == 1))
@@ -118,9 +135,9 @@ print("/* == Start of generated table == */")
 print("/*")
 print(" * The following table is generated by running:")
 print(" *")
-print(" *   ./gen-ucd-table.py ucd.nounihan.grouped.xml")
+print(" *   ./gen-ucd-table.py%s ucd.nounihan.grouped.xml" % (" --direct=%d" % direct if direct else ""))
 print(" *")
-print(" * on file with this description:", ucdxml.description)
+print(" * on file with this description:", ucd.description)
 print(" */")
 print()
 print("#ifndef HB_UCD_TABLE_HH")
@@ -140,6 +157,19 @@ dm2_u32_array, _ = code.addArray('uint32_t', 'dm2_u32_map', dm2_u32_array)
 dm2_u64_array, _ = code.addArray('uint64_t', 'dm2_u64_map', dm2_u64_array)
 code.print_c(linkage='static inline')
 
+# For the SLOPPY step, unassigned code points take the value of their
+# neighbors within each 128-code-point block.
+
+def sloppy(data, unassigned):
+    data = list(data)
+    for i in range(len(data)):
+        if (i % 128) and data[i] == unassigned:
+            data[i] = data[i - 1]
+    for i in range(len(data) - 2, -1, -1):
+        if ((i + 1) % 128) and data[i] == unassigned:
+            data[i] = data[i + 1]
+    return data
+
 datasets = [
     ('gc', gc, 'Cn', gc_order),
     ('ccc', ccc, 0, None),
@@ -147,11 +177,66 @@ datasets = [
     ('sc', sc, 'Zzzz', sc_order),
     ('dm', dm, None, dm_order),
 ]
+sloppy_datasets = [
+    ('gc', sloppy(gc, 'Cn'), 'Cn', gc_order),
+    ('ccc', ccc, 0, None),
+    ('bmg', bmg, 0, None),
+    ('sc', sloppy(sc, 'Zzzz'), 'Zzzz', sc_order),
+    ('dm', dm, None, dm_order),
+]
+steps = [
+    (DEFAULT, datasets),
+    (COMPACT, datasets),
+    (SLOPPY, sloppy_datasets),
+]
+
+
+# Solve all tables up front.  Solves with identical inputs are only run
+# once (eg. ccc, bmg and dm do not change between COMPACT and SLOPPY),
+# and the rest run in parallel when fork() is available.
+
+def solve_key(data, default, mapping, compression):
+    return hashlib.sha256(pickle.dumps((data, default, mapping, compression))).digest()
+
+solves = {}
+for step, step_datasets in steps:
+    compression = compression_level[step]
+    for name,data,default,mapping in step_datasets:
+        key = solve_key(data, default, mapping, compression)
+        if key not in solves:
+            solves[key] = (data, default, mapping, compression)
+
+jobs = min(os.cpu_count() or 1, len(solves))
+if jobs > 1 and 'fork' in multiprocessing.get_all_start_methods():
+    with concurrent.futures.ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+        futures = {key: executor.submit(packTab.pack_table, data, default, mapping=mapping, compression=compression)
+                   for key,(data,default,mapping,compression) in solves.items()}
+        solves = {key: f.result() for key,f in futures.items()}
+else:
+    solves = {key: packTab.pack_table(data, default, mapping=mapping, compression=compression)
+              for key,(data,default,mapping,compression) in solves.items()}
 
 
 # Write main data
 
-for step in (DEFAULT, COMPACT, SLOPPY):
+def c_type(values):
+    lo, hi = min(values), max(values)
+    for typ, tlo, thi in (('uint8_t', 0, 0xFF), ('int8_t', -0x80, 0x7F),
+                          ('uint16_t', 0, 0xFFFF), ('int16_t', -0x8000, 0x7FFF)):
+        if tlo <= lo and hi <= thi:
+            return typ
+    return 'int32_t'
+
+def direct_values(data, default, mapping):
+    if isinstance(data, dict):
+        values = [data.get(u, default) for u in range(direct)]
+    else:
+        values = [data[u] if u < len(data) else default for u in range(direct)]
+    if mapping is not None:
+        values = [mapping[v] for v in values]
+    return values
+
+for step, step_datasets in steps:
     compression = compression_level[step]
     logging.info('  Compression=%d:' % compression)
     print()
@@ -165,30 +250,29 @@ for step in (DEFAULT, COMPACT, SLOPPY):
         assert False
     print()
 
-    if step == SLOPPY:
-        for i in range(len(gc)):
-            if (i % 128) and gc[i] == 'Cn':
-                gc[i] = gc[i - 1]
-        for i in range(len(gc) - 2, -1, -1):
-            if ((i + 1) % 128) and gc[i] == 'Cn':
-                gc[i] = gc[i + 1]
-        for i in range(len(sc)):
-            if (i % 128) and sc[i] == 'Zzzz':
-                sc[i] = sc[i - 1]
-        for i in range(len(sc) - 2, -1, -1):
-            if ((i + 1) % 128) and sc[i] == 'Zzzz':
-                sc[i] = sc[i + 1]
-
-
     code = packTab.Code('_hb_ucd')
 
-    for name,data,default,mapping in datasets:
-        sol = packTab.pack_table(data, default, mapping=mapping, compression=compression)
+    wrappers = []
+    for name,data,default,mapping in step_datasets:
+        sol = solves[solve_key(data, default, mapping, compression)]
         logging.info('      Dataset=%-8s FullCost=%d' % (name, sol.fullCost))
-        sol.genCode(code, name)
+        if direct and step == DEFAULT:
+            values = direct_values(data, default, mapping)
+            array, _ = code.addArray(c_type(values), name + '_direct', values)
+            retType, _ = sol.genCode(code, name + '_packed')
+            wrappers.append((retType, name, array))
+        else:
+            sol.genCode(code, name)
 
     code.print_c(linkage='static inline')
 
+    for retType, name, array in wrappers:
+        print('static inline %s' % retType)
+        print('_hb_ucd_%s (unsigned u)' % name)
+        print('{')
+        print('  return u<%du?%s[u]:_hb_ucd_%s_packed (u);' % (direct, array, name))
+        print('}')
+
     print()
 
 
@@ -31,67 +31,35 @@ DISABLED_SCRIPTS = {
 	'Thai',
 }
 
-files = [open (x, encoding='utf-8') for x in sys.argv[1:]]
-
-headers = [[f.readline () for i in range (2)] for j,f in enumerate(files) if j != 4]
-for j in range(7, 9):
-	for line in files[j]:
-		line = line.rstrip()
-		if not line:
-			break
-		headers[j - 1].append(line)
-headers.append (["UnicodeData.txt does not have a header."])
-
-unicode_data = [{} for _ in files]
-values = [{} for _ in files]
-for i, f in enumerate (files):
-	for line in f:
-
-		j = line.find ('#')
-		if j >= 0:
-			line = line[:j]
-
-		fields = [x.strip () for x in line.split (';')]
-		if len (fields) == 1:
-			continue
-
-		uu = fields[0].split ('..')
-		start = int (uu[0], 16)
-		if len (uu) == 1:
-			end = start
-		else:
-			end = int (uu[1], 16)
-
-		t = fields[1 if i not in [2, 4] else 2]
+import ucd_loader
+
+files = sys.argv[1:]
+
+# Indic_Syllabic_Category, Indic_Positional_Category, Joining_Type,
+# Default_Ignorable_Code_Point, General_Category, Block, Script.
+unicode_data = [
+	ucd_loader.load (files[0]),
+	ucd_loader.load (files[1]),
+	ucd_loader.load (files[2], 2).map (lambda t: 'jt_' + t),
+	ucd_loader.load (files[3], only='Default_Ignorable_Code_Point'),
+	ucd_loader.load (files[4], 2),
+	ucd_loader.load (files[5]),
+	ucd_loader.load (files[6]),
+]
+additional = [ucd_loader.load (files[7]), ucd_loader.load (files[8])]
 
-		if i == 2:
-			t = 'jt_' + t
-		elif i == 3 and t != 'Default_Ignorable_Code_Point':
-			continue
-		elif i == 7 and t == 'Consonant_Final_Modifier':
-			# TODO: https://github.com/MicrosoftDocs/typography-issues/issues/336
-			t = 'Syllable_Modifier'
-		elif i == 8 and t == 'NA':
-			t = 'Not_Applicable'
+headers = [p.header[:2] for i, p in enumerate (unicode_data) if i != 4]
+headers.extend ([l.rstrip () for l in p.header] for p in additional)
+headers.append (["UnicodeData.txt does not have a header."])
 
-		i0 = i if i < 7 else i - 7
-		for u in range (start, end + 1):
-			unicode_data[i0][u] = t
-		values[i0][t] = values[i0].get (t, 0) + end - start + 1
+# TODO: https://github.com/MicrosoftDocs/typography-issues/issues/336
+unicode_data[0].update (additional[0].map (lambda t: 'Syllable_Modifier' if t == 'Consonant_Final_Modifier' else t))
+unicode_data[1].update (additional[1].map (lambda t: 'Not_Applicable' if t == 'NA' else t))
 
 defaults = ('Other', 'Not_Applicable', 'jt_X', '', 'Cn', 'No_Block', 'Unknown')
 
 # Merge data into one dict:
-for i,v in enumerate (defaults):
-	values[i][v] = values[i].get (v, 0) + 1
-combined = {}
-for i,d in enumerate (unicode_data):
-	for u,v in d.items ():
-		if not u in combined:
-			if i >= 4:
-				continue
-			combined[u] = list (defaults)
-		combined[u][i] = v
+combined = ucd_loader.combine (unicode_data, defaults, 4)
 combined = {k: v for k, v in combined.items() if v[6] not in DISABLED_SCRIPTS}
 
 
@@ -191,40 +159,95 @@ for name in property_names:
 globals().update(property_values)
 
 
+# The is_* predicates below are evaluated over all code points at once:
+# each argument is a Column of integer-coded values, comparisons return
+# a Mask of the matching rows, and masks combine with &, | and ~.
+
+class Mask(object):
+	"""A set of rows, as the bits of an int."""
+	__slots__ = ('bits', 'full')
+	def __init__(self, bits, full):
+		self.bits = bits
+		self.full = full
+	def __and__(self, other):
+		return Mask(self.bits & other.bits, self.full)
+	def __or__(self, other):
+		return Mask(self.bits | other.bits, self.full)
+	def __invert__(self):
+		return Mask(self.full ^ self.bits, self.full)
+	def rows(self):
+		return [i for i, b in enumerate(reversed(bin(self.bits)[2:])) if b == '1']
+
+class Column(object):
+	"""The values of one property for every row, coded as integers."""
+	def __init__(self, values):
+		codes = {}
+		rows = []
+		for i, v in enumerate(values):
+			c = codes.get(v)
+			if c is None:
+				c = codes[v] = len(rows)
+				rows.append([])
+			rows[c].append(i)
+		self.codes = codes
+		self.rows = rows
+		self.bits = {}
+		self.full = (1 << len(values)) - 1
+	def _bits(self, c):
+		bits = self.bits.get(c)
+		if bits is None:
+			bitmap = bytearray((self.full.bit_length() + 7) // 8)
+			for i in self.rows[c]:
+				bitmap[i >> 3] |= 1 << (i & 7)
+			bits = self.bits[c] = int.from_bytes(bitmap, 'little')
+		return bits
+	def isin(self, values):
+		bits = 0
+		for v in values:
+			c = self.codes.get(v if isinstance(v, int) else str(v))
+			if c is not None:
+				bits |= self._bits(c)
+		return Mask(bits, self.full)
+	def __eq__(self, value):
+		return self.isin([value])
+	def __ne__(self, value):
+		return ~self.isin([value])
+
+
 def is_BASE(U, UISC, UDI, UGC, AJT):
-	return (UISC in [Number, Consonant, Consonant_Head_Letter,
+	return (UISC.isin([Number, Consonant, Consonant_Head_Letter,
 			Tone_Letter,
 			Vowel_Independent,
-			] or
+			]) |
 		# TODO: https://github.com/MicrosoftDocs/typography-issues/issues/484
-		AJT in [jt_C, jt_D, jt_L, jt_R] and UISC != Joiner or
-		(UGC == Lo and UISC in [Avagraha, Bindu, Consonant_Final, Consonant_Medial,
-					Consonant_Subjoined, Vowel, Vowel_Dependent]))
+		AJT.isin([jt_C, jt_D, jt_L, jt_R]) & (UISC != Joiner) |
+		(UGC == Lo) & UISC.isin([Avagraha, Bindu, Consonant_Final, Consonant_Medial,
+					 Consonant_Subjoined, Vowel, Vowel_Dependent]))
 def is_BASE_NUM(U, UISC, UDI, UGC, AJT):
 	return UISC == Brahmi_Joining_Number
 def is_BASE_OTHER(U, UISC, UDI, UGC, AJT):
-	if UISC == Consonant_Placeholder: return True
-	return U in [0x2015, 0x2022, 0x25FB, 0x25FC, 0x25FD, 0x25FE]
+	return ((UISC == Consonant_Placeholder) |
+		U.isin([0x2015, 0x2022, 0x25FB, 0x25FC, 0x25FD, 0x25FE]))
 def is_CGJ(U, UISC, UDI, UGC, AJT):
 	# Also includes VARIATION_SELECTOR and ZWJ
-	return UISC == Joiner or UDI and UGC in [Mc, Me, Mn]
+	return (UISC == Joiner) | UDI & UGC.isin([Mc, Me, Mn])
 def is_CONS_FINAL(U, UISC, UDI, UGC, AJT):
-	return ((UISC == Consonant_Final and UGC != Lo) or
-		UISC == Consonant_Succeeding_Repha)
+	return ((UISC == Consonant_Final) & (UGC != Lo) |
+		(UISC == Consonant_Succeeding_Repha))
 def is_CONS_FINAL_MOD(U, UISC, UDI, UGC, AJT):
 	return UISC == Syllable_Modifier
 def is_CONS_MED(U, UISC, UDI, UGC, AJT):
 	# Consonant_Initial_Postfixed is new in Unicode 11; not in the spec.
-	return (UISC == Consonant_Medial and UGC != Lo or
-		UISC == Consonant_Initial_Postfixed)
+	return ((UISC == Consonant_Medial) & (UGC != Lo) |
+		(UISC == Consonant_Initial_Postfixed))
 def is_CONS_MOD(U, UISC, UDI, UGC, AJT):
-	return UISC in [Nukta, Gemination_Mark, Consonant_Killer]
+	return UISC.isin([Nukta, Gemination_Mark, Consonant_Killer])
 def is_CONS_SUB(U, UISC, UDI, UGC, AJT):
-	return UISC == Consonant_Subjoined and UGC != Lo
+	return (UISC == Consonant_Subjoined) & (UGC != Lo)
 def is_CONS_WITH_STACKER(U, UISC, UDI, UGC, AJT):
 	return UISC == Consonant_With_Stacker
 def is_HALANT(U, UISC, UDI, UGC, AJT):
-	return UISC == Virama and not is_HALANT_OR_VOWEL_MODIFIER(U, UISC, UDI, UGC, AJT)
+	return (UISC == Virama) & ~is_HALANT_OR_VOWEL_MODIFIER(U, UISC, UDI, UGC, AJT)
 def is_HALANT_OR_VOWEL_MODIFIER(U, UISC, UDI, UGC, AJT):
 	# Split off of HALANT
 	return U == 0x0DCA
@@ -240,39 +263,39 @@ def is_HIEROGLYPH_SEGMENT_END(U, UISC, UDI, UGC, AJT):
 	return UISC == Hieroglyph_Segment_End
 def is_INVISIBLE_STACKER(U, UISC, UDI, UGC, AJT):
 	# Split off of HALANT
-	return (UISC == Invisible_Stacker
-		and not is_SAKOT(U, UISC, UDI, UGC, AJT)
+	return ((UISC == Invisible_Stacker)
+		& ~is_SAKOT(U, UISC, UDI, UGC, AJT)
 	)
 def is_ZWNJ(U, UISC, UDI, UGC, AJT):
 	return UISC == Non_Joiner
 def is_OTHER(U, UISC, UDI, UGC, AJT):
 	# Also includes BASE_IND and SYM
-	return ((UGC == Po or UISC in [Consonant_Dead, Joiner, Modifying_Letter, Other])
-		and not is_BASE(U, UISC, UDI, UGC, AJT)
-		and not is_BASE_OTHER(U, UISC, UDI, UGC, AJT)
-		and not is_CGJ(U, UISC, UDI, UGC, AJT)
-		and not is_SYM_MOD(U, UISC, UDI, UGC, AJT)
-		and not is_Word_Joiner(U, UISC, UDI, UGC, AJT)
+	return (((UGC == Po) | UISC.isin([Consonant_Dead, Joiner, Modifying_Letter, Other]))
+		& ~is_BASE(U, UISC, UDI, UGC, AJT)
+		& ~is_BASE_OTHER(U, UISC, UDI, UGC, AJT)
+		& ~is_CGJ(U, UISC, UDI, UGC, AJT)
+		& ~is_SYM_MOD(U, UISC, UDI, UGC, AJT)
+		& ~is_Word_Joiner(U, UISC, UDI, UGC, AJT)
 	)
 def is_REPHA(U, UISC, UDI, UGC, AJT):
-	return UISC in [Consonant_Preceding_Repha, Consonant_Prefixed]
+	return UISC.isin([Consonant_Preceding_Repha, Consonant_Prefixed])
 def is_SAKOT(U, UISC, UDI, UGC, AJT):
 	# Split off of HALANT
 	return U == 0x1A60
 def is_SYM_MOD(U, UISC, UDI, UGC, AJT):
 	return UISC == Symbol_Modifier
 def is_VOWEL(U, UISC, UDI, UGC, AJT):
-	return (UISC == Pure_Killer or
-		UGC != Lo and UISC in [Vowel, Vowel_Dependent])
+	return ((UISC == Pure_Killer) |
+		(UGC != Lo) & UISC.isin([Vowel, Vowel_Dependent]))
 def is_VOWEL_MOD(U, UISC, UDI, UGC, AJT):
-	return (UISC in [Tone_Mark, Cantillation_Mark, Register_Shifter, Visarga] or
-		UGC != Lo and UISC == Bindu)
+	return (UISC.isin([Tone_Mark, Cantillation_Mark, Register_Shifter, Visarga]) |
+		(UGC != Lo) & (UISC == Bindu))
 def is_Word_Joiner(U, UISC, UDI, UGC, AJT):
 	# Also includes Rsv
-	return (UDI and U not in [0x115F, 0x1160, 0x3164, 0xFFA0, 0x1BCA0, 0x1BCA1, 0x1BCA2, 0x1BCA3]
-		and UISC == Other
-		and not is_CGJ(U, UISC, UDI, UGC, AJT)
-	) or UGC == Cn
+	return (UDI & ~U.isin([0x115F, 0x1160, 0x3164, 0xFFA0, 0x1BCA0, 0x1BCA1, 0x1BCA2, 0x1BCA3])
+		& (UISC == Other)
+		& ~is_CGJ(U, UISC, UDI, UGC, AJT)
+	) | (UGC == Cn)
 
 use_mapping = {
 	'B':	is_BASE,
@@ -349,9 +372,10 @@ use_positions = {
 }
 
 def map_to_use(data):
-	out = {}
-	items = use_mapping.items()
-	for U, (UISC, UIPC, AJT, UDI, UGC, UBlock, _) in data.items():
+	rows = list(data.items())
+	UU = [U for U, _ in rows]
+	UISCs = []
+	for U, (UISC, UIPC, AJT, UDI, UGC, UBlock, _) in rows:
 
 		# Resolve Indic_Syllabic_Category
 
@@ -366,9 +390,31 @@ def map_to_use(data):
 		# the nasalization marks, maybe only for U+1CE9..U+1CF1.
 		if U == 0x1CED: UISC = Tone_Mark
 
-		values = [k for k,v in items if v(U, UISC, UDI, UGC, AJT)]
-		assert len(values) == 1, "%s %s %s %s %s %s" % (hex(U), UISC, UDI, UGC, AJT, values)
-		USE = values[0]
+		UISCs.append(str(UISC))
+
+	columns = (Column(UU),
+		   Column(UISCs),
+		   Column([bool(v[3]) for _, v in rows]) == True,
+		   Column([v[4] for _, v in rows]),
+		   Column([v[2] for _, v in rows]))
+
+	# Every row must match exactly one category.
+	masks = {k: v(*columns).bits for k, v in use_mapping.items()}
+	uses = [None] * len(rows)
+	seen = 0
+	multiple = 0
+	for k, mask in masks.items():
+		multiple |= seen & mask
+		seen |= mask
+		for i in Mask(mask, 0).rows():
+			uses[i] = k
+	for i in Mask((seen ^ columns[0].full) | multiple, 0).rows():
+		U, (_, UIPC, AJT, UDI, UGC, _, _) = rows[i]
+		values = [k for k, mask in masks.items() if mask >> i & 1]
+		assert len(values) == 1, "%s %s %s %s %s %s" % (hex(U), UISCs[i], UDI, UGC, AJT, values)
+
+	out = {}
+	for (U, (_, UIPC, AJT, UDI, UGC, UBlock, _)), UISC, USE in zip(rows, UISCs, uses):
 
 		# Resolve Indic_Positional_Category
 
@@ -487,7 +533,9 @@ for compression in (DEFAULT, COMPACT):
     sol = packTab.pack_table(data, compression=compression, default='O')
     logging.info('      FullCost=%d' % (sol.fullCost))
     sol.genCode(code, f'get_category')
-    code.print_c(linkage='static inline')
+    # file is passed explicitly so that redirecting sys.stdout, as
+    # gen-fused-table.py does, also silences the table.
+    code.print_c(file=sys.stdout, linkage='static inline')
     print ()
 
 print('#endif')
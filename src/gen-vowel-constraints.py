@@ -7,7 +7,24 @@ circles into sequences prohibited by the USE script development spec.
 This function should be used as the ``preprocess_text`` of an
 ``hb_ot_shaper_t``.
 
-usage: ./gen-vowel-constraints.py ms-use/IndicShapingInvalidCluster.txt Scripts.txt
+usage: ./gen-vowel-constraints.py [--dfa | --verify | --benchmark] ms-use/IndicShapingInvalidCluster.txt Scripts.txt [TEXT...]
+
+By default, the sequences of each script are matched by nested switches on
+the code points following each position.  With --dfa, they are compiled
+into a minimized DFA per script instead, which reads every character once.
+
+With --verify, both backends are generated and compiled, together with the
+rest of HarfBuzz, into a program that runs them on every sequence of the
+code points of each script, plus one other code point, up to a length
+bounded by the size of that alphabet, and checks that they produce the
+same buffers.  The C++ compiler and flags are taken from $CXX and
+$CXXFLAGS (default: c++ -O1).
+
+With --benchmark, the same program times both backends instead, calling
+them directly on buffers of the code points of each TEXT (default:
+../perf/texts/hi-words.txt): line by line, as a whole, and line by line
+with a prohibited sequence of the script of the text after each line.
+The default flags are -O2 there.
 
 Input file:
 * https://unicode.org/Public/UCD/latest/ucd/Scripts.txt
@@ -19,31 +36,270 @@ def write (s):
 	sys.stdout.buffer.write (s.encode ('utf-8'))
 import sys
 
-if len (sys.argv) != 3:
+dfa = '--dfa' in sys.argv[1:]
+verify = '--verify' in sys.argv[1:]
+benchmark = '--benchmark' in sys.argv[1:]
+args = [arg for arg in sys.argv[1:] if arg not in ('--dfa', '--verify', '--benchmark')]
+
+if len (args) < 2 or len (args) > 2 and not benchmark or dfa + verify + benchmark > 1:
 	sys.exit (__doc__)
+args, texts = args[:2], args[2:]
 
-with open (sys.argv[2], encoding='utf-8') as f:
-	scripts_header = [f.readline () for i in range (2)]
-	scripts = {}
-	script_order = {}
-	for line in f:
-		j = line.find ('#')
-		if j >= 0:
-			line = line[:j]
-		fields = [x.strip () for x in line.split (';')]
-		if len (fields) == 1:
-			continue
-		uu = fields[0].split ('..')
-		start = int (uu[0], 16)
-		if len (uu) == 1:
-			end = start
-		else:
-			end = int (uu[1], 16)
-		script = fields[1]
-		for u in range (start, end + 1):
-			scripts[u] = script
-		if script not in script_order:
-			script_order[script] = start
+VERIFY_HARNESS = r'''
+typedef void (*preprocess_text_func_t) (const hb_ot_shape_plan_t *, hb_buffer_t *, hb_font_t *);
+
+static void
+run (preprocess_text_func_t func, hb_buffer_t *buffer, hb_script_t script,
+     const hb_codepoint_t *text, unsigned len)
+{
+  hb_buffer_clear_contents (buffer);
+  hb_buffer_add_codepoints (buffer, text, len, 0, len);
+  hb_buffer_set_script (buffer, script);
+  func (nullptr, buffer, nullptr);
+}
+
+int
+main ()
+{
+  hb_buffer_t *a = hb_buffer_create ();
+  hb_buffer_t *b = hb_buffer_create ();
+  unsigned long checked = 0;
+  for (const script_t &s : scripts)
+  {
+    for (unsigned len = 1; len <= s.max_length; len++)
+    {
+      unsigned digits[MAX_LENGTH] = {0};
+      hb_codepoint_t text[MAX_LENGTH];
+      do
+      {
+	for (unsigned i = 0; i < len; i++)
+	  text[i] = s.codepoints[digits[i]];
+	run (switches::_hb_preprocess_text_vowel_constraints, a, s.script, text, len);
+	run (dfa::_hb_preprocess_text_vowel_constraints, b, s.script, text, len);
+	if (a->len != b->len || memcmp (a->info, b->info, a->len * sizeof (a->info[0])))
+	{
+	  printf ("Mismatch on");
+	  for (unsigned i = 0; i < len; i++)
+	    printf (" U+%04X", text[i]);
+	  printf ("\n");
+	  return 1;
+	}
+	checked++;
+	unsigned i = 0;
+	while (i < len && ++digits[i] == s.num_codepoints)
+	  digits[i++] = 0;
+	if (i == len)
+	  break;
+      } while (true);
+    }
+  }
+  hb_buffer_destroy (a);
+  hb_buffer_destroy (b);
+  printf ("%lu sequences checked.\n", checked);
+  return 0;
+}
+'''
+
+BENCHMARK_HARNESS = r'''
+#include <chrono>
+#include <vector>
+
+typedef void (*preprocess_text_func_t) (const hb_ot_shape_plan_t *, hb_buffer_t *, hb_font_t *);
+typedef std::vector<std::vector<hb_codepoint_t>> lines_t;
+
+static void
+no_preprocess_text (const hb_ot_shape_plan_t *, hb_buffer_t *, hb_font_t *) {}
+
+/* Returns the best time of seven runs over the lines, in nanoseconds. */
+static double
+best_time (preprocess_text_func_t func, hb_buffer_t *buffer, hb_script_t script,
+	   const lines_t &lines, unsigned repeat)
+{
+  double best = 0;
+  for (unsigned run = 0; run < 7; run++)
+  {
+    auto start = std::chrono::steady_clock::now ();
+    for (unsigned r = 0; r < repeat; r++)
+      for (const auto &line : lines)
+      {
+	hb_buffer_clear_contents (buffer);
+	hb_buffer_add_codepoints (buffer, line.data (), line.size (), 0, line.size ());
+	hb_buffer_set_script (buffer, script);
+	func (nullptr, buffer, nullptr);
+      }
+    double t = std::chrono::duration<double, std::nano> (std::chrono::steady_clock::now () - start).count ();
+    if (!run || t < best)
+      best = t;
+  }
+  return best;
+}
+
+/* Prints the nanoseconds per character of both backends over the lines,
+ * less the time of filling the buffers. */
+static void
+time_backends (const char *name, hb_buffer_t *buffer, hb_script_t script, const lines_t &lines)
+{
+  unsigned long length = 0;
+  for (const auto &line : lines)
+    length += line.size ();
+  unsigned repeat = 1 + 2000000 / (length + 1);
+  double base = best_time (no_preprocess_text, buffer, script, lines, repeat);
+  double switches_time = best_time (switches::_hb_preprocess_text_vowel_constraints, buffer, script, lines, repeat);
+  double dfa_time = best_time (dfa::_hb_preprocess_text_vowel_constraints, buffer, script, lines, repeat);
+  printf ("  %-12s switches %6.2f ns/char   dfa %6.2f ns/char\n", name,
+	  (switches_time - base) / repeat / length,
+	  (dfa_time - base) / repeat / length);
+}
+
+int
+main (int argc, char **argv)
+{
+  hb_buffer_t *buffer = hb_buffer_create ();
+  for (int i = 1; i < argc; i++)
+  {
+    hb_blob_t *blob = hb_blob_create_from_file_or_fail (argv[i]);
+    if (!blob)
+    {
+      fprintf (stderr, "%s: cannot read file\n", argv[i]);
+      return 1;
+    }
+    unsigned length;
+    const char *data = hb_blob_get_data (blob, &length);
+    hb_buffer_clear_contents (buffer);
+    hb_buffer_add_utf8 (buffer, data, length, 0, length);
+    hb_buffer_guess_segment_properties (buffer);
+    hb_script_t script = hb_buffer_get_script (buffer);
+    hb_blob_destroy (blob);
+
+    const prohibited_t *prohibited = nullptr;
+    for (const prohibited_t &p : prohibited_sequences)
+      if (p.script == script)
+	prohibited = &p;
+
+    unsigned count;
+    const hb_glyph_info_t *info = hb_buffer_get_glyph_infos (buffer, &count);
+    lines_t lines (1), text (1), lines_prohibited (1);
+    for (unsigned j = 0; j < count; j++)
+    {
+      hb_codepoint_t u = info[j].codepoint;
+      text[0].push_back (u);
+      if (u != '\n')
+      {
+	lines.back ().push_back (u);
+	lines_prohibited.back ().push_back (u);
+	continue;
+      }
+      lines.emplace_back ();
+      if (prohibited)
+	lines_prohibited.back ().insert (lines_prohibited.back ().end (),
+					 prohibited->codepoints, prohibited->codepoints + prohibited->length);
+      lines_prohibited.emplace_back ();
+    }
+
+    char tag[5] = {0};
+    hb_tag_to_string (hb_script_to_iso15924_tag (script), tag);
+    printf ("%s (%s, %u characters)\n", argv[i], tag, count);
+    time_backends ("lines", buffer, script, lines);
+    time_backends ("text", buffer, script, text);
+    if (prohibited)
+      time_backends ("prohibited", buffer, script, lines_prohibited);
+  }
+  hb_buffer_destroy (buffer);
+  return 0;
+}
+'''
+
+def build (tmpdir, definitions, harness, default_cxxflags):
+	"""Compiles all of HarfBuzz, both backends and harness into a
+	program, and returns its path.  The backends are included in
+	namespaces of their own, switches and dfa, instead of the vowel
+	constraints of the tree; definitions are written before harness."""
+	import os, shlex, subprocess
+
+	srcdir = os.path.dirname (os.path.abspath (__file__))
+	cxx = shlex.split (os.environ.get ('CXX', 'c++'))
+	cxxflags = shlex.split (os.environ.get ('CXXFLAGS', default_cxxflags))
+
+	for backend, options in (('switches', []), ('dfa', ['--dfa'])):
+		with open (os.path.join (tmpdir, 'vowel-constraints-%s.cc' % backend), 'w') as f:
+			subprocess.run ([sys.executable, os.path.abspath (__file__)] + options + args, check=True, stdout=f)
+	src = os.path.join (tmpdir, 'harness.cc')
+	exe = os.path.join (tmpdir, 'harness')
+	with open (src, 'w') as f:
+		with open (os.path.join (srcdir, 'harfbuzz.cc')) as harfbuzz:
+			f.write (''.join (line for line in harfbuzz if 'hb-ot-shaper-vowel-constraints.cc' not in line))
+		for backend in ('switches', 'dfa'):
+			f.write ('namespace %s {\n' % backend)
+			f.write ('void _hb_preprocess_text_vowel_constraints (const hb_ot_shape_plan_t *, hb_buffer_t *, hb_font_t *);\n')
+			f.write ('#include "vowel-constraints-%s.cc"\n' % backend)
+			f.write ('}\n')
+		f.write ('void _hb_preprocess_text_vowel_constraints (const hb_ot_shape_plan_t *plan, hb_buffer_t *buffer, hb_font_t *font)\n')
+		f.write ('{ dfa::_hb_preprocess_text_vowel_constraints (plan, buffer, font); }\n')
+		f.write (definitions)
+		f.write (harness)
+	subprocess.run (cxx + cxxflags + ['-I', srcdir, '-I', tmpdir, '-o', exe, src, '-lm'], check=True)
+	return exe
+
+def sorted_constraints ():
+	return sorted (constraints.items (), key=lambda s_c: script_order[s_c[0]])
+
+def run_verify ():
+	import subprocess, tempfile
+
+	# The sequences are tried up to the longest length that has no more
+	# than four million of them, but at least up to one code point more
+	# than the longest prohibited sequence.  U+25CC stands for the code
+	# points that are in no prohibited sequence.
+	scripts = []
+	for script, constraint_set in sorted_constraints ():
+		sequences = list (constraint_set.sequences ())
+		alphabet = sorted ({cp for sequence in sequences for cp in sequence}) + [0x25CC]
+		max_length = max (len (sequence) for sequence in sequences) + 1
+		while len (alphabet) ** (max_length + 1) <= 4000000:
+			max_length += 1
+		scripts.append ((script, alphabet, max_length))
+
+	definitions = ['#define MAX_LENGTH %d\n' % max (max_length for _, _, max_length in scripts)]
+	definitions.append ('struct script_t { hb_script_t script; unsigned num_codepoints; const hb_codepoint_t *codepoints; unsigned max_length; };\n')
+	for script, alphabet, max_length in scripts:
+		definitions.append ('static const hb_codepoint_t %s_codepoints[] = {%s};\n' % (script.lower (), ', '.join ('0x%04Xu' % cp for cp in alphabet)))
+	definitions.append ('static const script_t scripts[] = {\n')
+	for script, alphabet, max_length in scripts:
+		definitions.append ('  {HB_SCRIPT_%s, %d, %s_codepoints, %d},\n' % (script.upper (), len (alphabet), script.lower (), max_length))
+	definitions.append ('};\n')
+
+	with tempfile.TemporaryDirectory () as tmpdir:
+		exe = build (tmpdir, ''.join (definitions), VERIFY_HARNESS, '-O1')
+		for script, alphabet, max_length in scripts:
+			print ('%-16s %3d code points, sequences up to %d long' % (script, len (alphabet), max_length))
+		sys.stdout.flush ()
+		sys.exit (subprocess.run ([exe]).returncode)
+
+def run_benchmark ():
+	import os, subprocess, tempfile
+
+	srcdir = os.path.dirname (os.path.abspath (__file__))
+	paths = [os.path.abspath (text) for text in texts] or [os.path.normpath (os.path.join (srcdir, '..', 'perf', 'texts', 'hi-words.txt'))]
+
+	# The first prohibited sequence of each script is the one put after
+	# the lines.
+	prohibited = [(script, min (constraint_set.sequences ())) for script, constraint_set in sorted_constraints ()]
+	definitions = ['struct prohibited_t { hb_script_t script; unsigned length; hb_codepoint_t codepoints[%d]; };\n' % max (len (sequence) for _, sequence in prohibited)]
+	definitions.append ('static const prohibited_t prohibited_sequences[] = {\n')
+	for script, sequence in prohibited:
+		definitions.append ('  {HB_SCRIPT_%s, %d, {%s}},\n' % (script.upper (), len (sequence), ', '.join ('0x%04Xu' % cp for cp in sequence)))
+	definitions.append ('};\n')
+
+	with tempfile.TemporaryDirectory () as tmpdir:
+		exe = build (tmpdir, ''.join (definitions), BENCHMARK_HARNESS, '-O2')
+		sys.stdout.flush ()
+		sys.exit (subprocess.run ([exe] + paths).returncode)
+
+import ucd_loader
+
+scripts = ucd_loader.load (args[1])
+scripts_header = scripts.header[:2]
+script_order = scripts.first_codepoints ()
 
 class ConstraintSet (object):
 	"""A set of prohibited code point sequences.
@@ -78,6 +334,14 @@ class ConstraintSet (object):
 			else:
 				self._c[first] = ConstraintSet (rest)
 
+	def sequences (self, prefix=()):
+		"""Yield the prohibited sequences in this set, prefixed by prefix."""
+		if isinstance (self._c, list):
+			yield prefix + tuple (self._c)
+		else:
+			for first, rest in sorted (self._c.items ()):
+				yield from rest.sequences (prefix + (first,))
+
 	@staticmethod
 	def _indent (depth):
 		return ('  ' * depth).replace ('        ', '\t')
@@ -124,8 +388,83 @@ class ConstraintSet (object):
 			s.append ('{}}}\n'.format (indent))
 		return ''.join (s)
 
+def build_dfa (sequences):
+	"""Compile prohibited sequences into a minimized DFA.
+
+	Like the switches, the DFA finds the leftmost prohibited sequence,
+	inserts a dotted circle before its last code point, and resumes
+	after it.
+
+	Returns:
+		A dictionary from code point to input class, where class 0
+		stands for all the other code points, and the transitions,
+		indexed by state and class, as (next state, insert) pairs;
+		insert tells whether a dotted circle goes before the current
+		character.  The start state is 0.
+
+	"""
+	sequences = set (sequences)
+	prefixes = {sequence[:i] for sequence in sequences for i in range (1, len (sequence) + 1)}
+	symbols = [None] + sorted ({cp for sequence in sequences for cp in sequence})
+
+	# A state is the tuple of the prefixes matched by the attempts still
+	# pending, the oldest first.
+	def step (pending, cp):
+		if cp is None:
+			return (), False
+		pending = [p + (cp,) for p in pending + ((),) if p + (cp,) in prefixes]
+		for i, p in enumerate (pending):
+			if p in sequences:
+				assert i == 0, 'Cannot match {} before {} fails; the general case has not been implemented'.format (p, pending[0])
+				return (), True
+		return tuple (pending), False
+
+	states = [()]
+	numbers = {(): 0}
+	transitions = []
+	for pending in states:
+		row = []
+		for cp in symbols:
+			target, insert = step (pending, cp)
+			if target not in numbers:
+				numbers[target] = len (states)
+				states.append (target)
+			row.append ((numbers[target], insert))
+		transitions.append (row)
+
+	# Moore's algorithm: split the blocks of states until all the states
+	# of a block insert dotted circles before the same symbols and move
+	# to the same blocks on them.  Blocks are numbered in order of their
+	# first state, so the start state stays 0.
+	blocks = [0] * len (states)
+	while True:
+		signatures = {}
+		refined = [signatures.setdefault ((blocks[s], tuple ((blocks[t], insert) for t, insert in row)), len (signatures))
+			   for s, row in enumerate (transitions)]
+		if len (signatures) == len (set (blocks)):
+			break
+		blocks = refined
+	first = {}
+	for s, b in enumerate (blocks):
+		first.setdefault (b, s)
+	transitions = [[(blocks[t], insert) for t, insert in transitions[first[b]]] for b in sorted (first)]
+
+	# Code points whose columns are the same are merged into one class.
+	columns = {}
+	classes = {}
+	representatives = []
+	for i, cp in enumerate (symbols):
+		column = tuple (row[i] for row in transitions)
+		if column not in columns:
+			columns[column] = len (columns)
+			representatives.append (i)
+		if cp is not None and columns[column]:
+			classes[cp] = columns[column]
+	transitions = [[row[i] for i in representatives] for row in transitions]
+	return classes, transitions
+
 constraints = {}
-with open (sys.argv[1], encoding='utf-8') as f:
+with open (args[0], encoding='utf-8') as f:
 	constraints_header = []
 	while True:
 		line = f.readline ().strip ()
@@ -146,11 +485,16 @@ with open (sys.argv[1], encoding='utf-8') as f:
 			constraints[script] = ConstraintSet (constraint)
 		assert constraints, 'No constraints found'
 
+if verify:
+	run_verify ()
+if benchmark:
+	run_benchmark ()
+
 print ('/* == Start of generated functions == */')
 print ('/*')
 print (' * The following functions are generated by running:')
 print (' *')
-print (' *   %s ms-use/IndicShapingInvalidCluster.txt Scripts.txt' % sys.argv[0])
+print (' *   %s%s ms-use/IndicShapingInvalidCluster.txt Scripts.txt' % (sys.argv[0], ' --dfa' if dfa else ''))
 print (' *')
 print (' * on files with these headers:')
 print (' *')
@@ -175,13 +519,68 @@ print ('  (void) buffer->output_glyph (0x25CCu);')
 print ('  _hb_glyph_info_reset_continuation (&buffer->prev());')
 print ('}')
 print ()
-print ('static void')
-print ('_output_with_dotted_circle (hb_buffer_t *buffer)')
-print ('{')
-print ('  _output_dotted_circle (buffer);')
-print ('  (void) buffer->next_glyph ();')
-print ('}')
-print ()
+if not dfa:
+	print ('static void')
+	print ('_output_with_dotted_circle (hb_buffer_t *buffer)')
+	print ('{')
+	print ('  _output_dotted_circle (buffer);')
+	print ('  (void) buffer->next_glyph ();')
+	print ('}')
+	print ()
+
+script_constraints = sorted_constraints ()
+
+if dfa:
+	dfas = {script: build_dfa (constraint_set.sequences ()) for script, constraint_set in script_constraints}
+	for script, _ in script_constraints:
+		classes, transitions = dfas[script]
+		assert len (transitions) <= 128, 'Too many states for {}'.format (script)
+		name = '_vowel_constraints_{}'.format (script.lower ())
+		first = min (classes)
+		last = max (classes)
+		print ('static const uint8_t {}_classes[0x{:04X}u - 0x{:04X}u + 1] ='.format (name, last, first))
+		print ('{')
+		for start in range (first, last + 1, 16):
+			print ('  /* {:04X} */ {}'.format (start, ' '.join ('{},'.format (classes.get (cp, 0)) for cp in range (start, min (start + 16, last + 1)))))
+		print ('};')
+		print ()
+		print ('static const uint8_t {}_transitions[{}][{}] ='.format (name, len (transitions), len (transitions[0])))
+		print ('{')
+		for row in transitions:
+			print ('  {{{}}},'.format (', '.join (str (target << 1 | insert) for target, insert in row)))
+		print ('};')
+		print ()
+
+	print ('/* Runs the DFA of a script over the buffer.  The code points from first')
+	print (' * on are mapped to input classes through classes; the others are in')
+	print (' * class 0.  Each transition is the next state, shifted left by one, with')
+	print (' * the low bit set if a dotted circle goes before the current character. */')
+	print ('static void')
+	print ('_apply_vowel_constraints (hb_buffer_t    *buffer,')
+	print ('\t\t\t  hb_codepoint_t  first,')
+	print ('\t\t\t  unsigned int    num_codepoints,')
+	print ('\t\t\t  const uint8_t  *classes,')
+	print ('\t\t\t  const uint8_t  *transitions,')
+	print ('\t\t\t  unsigned int    num_classes)')
+	print ('{')
+	print ('  unsigned int count = buffer->len;')
+	print ('  unsigned int state = 0;')
+	print ('  buffer->idx = 0;')
+	print ('  for (unsigned int i = 0; i < count; i++)')
+	print ('  {')
+	print ('    unsigned int u = buffer->info[i].codepoint - first;')
+	print ('    unsigned int t = transitions[state * num_classes + (u < num_codepoints ? classes[u] : 0)];')
+	print ('    state = t >> 1;')
+	print ('    if (t & 1)')
+	print ('    {')
+	print ('      (void) buffer->next_glyphs (i - buffer->idx);')
+	print ('      _output_dotted_circle (buffer);')
+	print ('      if (unlikely (!buffer->successful))')
+	print ('\treturn;')
+	print ('    }')
+	print ('  }')
+	print ('}')
+	print ()
 
 print ('void')
 print ('_hb_preprocess_text_vowel_constraints (const hb_ot_shape_plan_t *plan HB_UNUSED,')
@@ -201,16 +600,24 @@ print ('   *')
 print ('   * https://github.com/harfbuzz/harfbuzz/issues/1019')
 print ('   */')
 print ('  buffer->clear_output ();')
-print ('  unsigned int count = buffer->len;')
+if not dfa:
+	print ('  unsigned int count = buffer->len;')
 print ('  switch ((unsigned) buffer->props.script)')
 print ('  {')
 
-for script, constraints in sorted (constraints.items (), key=lambda s_c: script_order[s_c[0]]):
+for script, constraint_set in script_constraints:
 	print ('    case HB_SCRIPT_{}:'.format (script.upper ()))
+	if dfa:
+		name = '_vowel_constraints_{}'.format (script.lower ())
+		print ('      _apply_vowel_constraints (buffer, 0x{:04X}u, ARRAY_LENGTH ({}_classes), {}_classes,'.format (min (dfas[script][0]), name, name))
+		print ('\t\t\t\t&{}_transitions[0][0], ARRAY_LENGTH ({}_transitions[0]));'.format (name, name))
+		print ('      break;')
+		print ()
+		continue
 	print ('      for (buffer->idx = 0; buffer->idx + 1 < count && buffer->successful;)')
 	print ('      {')
 	print ('\tbool matched = false;')
-	write (str (constraints))
+	write (str (constraint_set))
 	print ('\t(void) buffer->next_glyph ();')
 	print ('\tif (matched) _output_with_dotted_circle (buffer);')
 	print ('      }')
@@ -330,7 +330,11 @@ hb_ot_tags_from_language (const char   *lang_str,
     unsigned tag_idx = last_tag_idx;
 
     if (likely (tag_idx < ot_languages_len && ot_languages[tag_idx].language == lang_tag) ||
+#ifdef HB_OT_TAG_TABLE_HASH
+	ot_languages_hash_find (first_len, lang_tag, &tag_idx))
+#else
 	hb_sorted_array (ot_languages, ot_languages_len).bfind (lang_tag, &tag_idx))
+#endif
     {
       last_tag_idx = tag_idx;
       unsigned int i;
@@ -645,10 +649,37 @@ test_langs_sorted ()
 #endif
 }
 
+#ifdef HB_OT_TAG_TABLE_HASH
+static inline void
+test_langs_hashed (const LangTag *ot_languages,
+		   unsigned       ot_languages_len,
+		   unsigned       language_len)
+{
+  for (unsigned int i = 0; i < ot_languages_len; i++)
+  {
+    unsigned tag_idx;
+    if (!ot_languages_hash_find (language_len, ot_languages[i].language, &tag_idx) ||
+	ot_languages[tag_idx].language != ot_languages[i].language ||
+	(tag_idx && ot_languages[tag_idx - 1].language == ot_languages[i].language))
+    {
+      fprintf (stderr, "ot_languages%u hash lookup wrong for index %d: %08x\n",
+	       language_len, i, ot_languages[i].language);
+      abort();
+    }
+  }
+}
+#endif
+
 int
 main ()
 {
   test_langs_sorted ();
+#ifdef HB_OT_TAG_TABLE_HASH
+  test_langs_hashed (ot_languages2, ARRAY_LENGTH (ot_languages2), 2);
+#ifndef HB_NO_LANGUAGE_LONG
+  test_langs_hashed (ot_languages3, ARRAY_LENGTH (ot_languages3), 3);
+#endif
+#endif
   return 0;
 }
 
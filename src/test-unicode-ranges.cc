@@ -58,9 +58,20 @@ test_get_unicode_range_bit ()
   test (0x110000, -1);
 }
 
+static void
+test_get_unicode_range_bit_all ()
+{
+  for (hb_codepoint_t cp = 0; cp <= 0x110000; cp++)
+  {
+    auto *range = hb_sorted_array (OT::_hb_os2_unicode_ranges).bsearch (cp);
+    test (cp, range ? range->bit : -1);
+  }
+}
+
 int
 main ()
 {
   test_get_unicode_range_bit ();
+  test_get_unicode_range_bit_all ();
   return 0;
 }
@@ -0,0 +1,332 @@
+"""Shared loader for the UCD files used by the gen-*.py table generators:
+the semicolon-separated ones (Scripts.txt, Blocks.txt, UnicodeData.txt,
+...) and the UCDXML repertoire.
+
+Each requested field of a file is parsed once into a dense array over the
+whole code space, holding an index into a small list of values.  Parsed
+data is cached on disk, keyed by the hash of their contents, in
+$HB_UCD_CACHE_DIR (default: $XDG_CACHE_HOME/harfbuzz/ucd).  Set
+HB_UCD_CACHE_DIR to the empty string to disable the cache.
+"""
+
+import array, hashlib, itertools, os, pickle, tempfile
+
+MAX_UNICODE = 0x110000
+
+# Bump when the parsed representation changes.
+CACHE_VERSION = 1
+
+
+class Property (object):
+	"""The values of one field of a UCD file, for every code point.
+
+	Code points that are not listed in the file have no value; ``p[u]``
+	returns None for them and ``u in p`` is False."""
+
+	__slots__ = ('values', 'index', 'header')
+
+	def __init__ (self, values, index, header=()):
+		# values[0] is always None; index[u] is the position of the
+		# value of u in values.
+		self.values = values
+		self.index = index
+		self.header = list (header)
+
+	def __getitem__ (self, u):
+		return self.values[self.index[u]]
+
+	def get (self, u, default=None):
+		v = self.values[self.index[u]]
+		return default if v is None else v
+
+	def __contains__ (self, u):
+		return self.values[self.index[u]] is not None
+
+	def ranges (self):
+		"""Yields (start, end, value) for each run of code points with
+		the same value, skipping code points without a value."""
+		values = self.values
+		start = 0
+		for i, run in itertools.groupby (self.index):
+			end = start + sum (1 for _ in run)
+			v = values[i]
+			if v is not None:
+				yield start, end - 1, v
+			start = end
+
+	def items (self):
+		"""Yields (u, value) for every code point with a value."""
+		for start, end, v in self.ranges ():
+			for u in range (start, end + 1):
+				yield u, v
+
+	def keys (self):
+		for u, _ in self.items ():
+			yield u
+
+	def tolist (self):
+		"""Returns the values of all code points as a list."""
+		return list (map (self.values.__getitem__, self.index))
+
+	def first_codepoints (self):
+		"""Returns a dict from each value to the first code point having it."""
+		first = {}
+		for start, _, v in self.ranges ():
+			first.setdefault (v, start)
+		return first
+
+	def map (self, f):
+		"""Returns a new Property with f applied to every value.  Code
+		points for which f returns None lose their value."""
+		values = [None] + [f (v) for v in self.values[1:]]
+		return Property (values, self.index[:], self.header)
+
+	def update (self, other):
+		"""Overrides values with those listed in other, in place."""
+		positions = {v: i for i, v in enumerate (self.values)}
+		for start, end, v in other.ranges ():
+			if v not in positions:
+				positions[v] = len (self.values)
+				self.values.append (v)
+			self.index[start:end + 1] = _fill (self.index.typecode, positions[v], end - start + 1)
+		self.index = _fit (self.index, len (self.values))
+
+
+def _typecode (n):
+	return 'H' if n <= 0xFFFF else 'L'
+
+def _fill (typecode, i, n):
+	return array.array (typecode, [i]) * n
+
+def _fit (index, n):
+	typecode = _typecode (n)
+	if index.typecode == typecode:
+		return index
+	return array.array (typecode, index)
+
+
+def _parse_range (s):
+	uu = s.split ('..')
+	start = int (uu[0], 16)
+	end = start if len (uu) == 1 else int (uu[1], 16)
+	return start, end
+
+def _parse (lines, fields, only):
+	header = []
+	for line in lines:
+		if not line.startswith ('#'):
+			break
+		header.append (line)
+
+	values = [[None] for _ in fields]
+	positions = [{} for _ in fields]
+	spans = [[] for _ in fields]
+	first = None
+	for line in lines:
+
+		j = line.find ('#')
+		if j >= 0:
+			line = line[:j]
+
+		cols = [x.strip () for x in line.split (';')]
+		if len (cols) == 1:
+			continue
+
+		start, end = _parse_range (cols[0])
+
+		# UnicodeData.txt lists large ranges as a pair of
+		# <..., First> and <..., Last> lines.
+		if cols[1].endswith (', First>'):
+			first = start
+			continue
+		if cols[1].endswith (', Last>'):
+			start, first = first, None
+
+		if only is not None and cols[1] not in only:
+			continue
+
+		for k, field in enumerate (fields):
+			t = cols[field]
+			i = positions[k].get (t)
+			if i is None:
+				i = positions[k][t] = len (values[k])
+				values[k].append (t)
+			spans[k].append ((start, end, i))
+
+	props = []
+	for k in range (len (fields)):
+		typecode = _typecode (len (values[k]))
+		index = array.array (typecode, bytes (MAX_UNICODE * array.array (typecode).itemsize))
+		for start, end, i in spans[k]:
+			index[start:end + 1] = _fill (typecode, i, end - start + 1)
+		props.append (Property (values[k], index, header))
+	return props
+
+
+def cache_dir ():
+	d = os.environ.get ('HB_UCD_CACHE_DIR')
+	if d is not None:
+		return d
+	base = os.environ.get ('XDG_CACHE_HOME') or os.path.join (os.path.expanduser ('~'), '.cache')
+	return os.path.join (base, 'harfbuzz', 'ucd')
+
+def digest (data):
+	return hashlib.sha256 (data).hexdigest ()
+
+def cache_path (data_digest, *key):
+	"""Returns the cache file for the given file digest and parse
+	options, or None if caching is disabled."""
+	d = cache_dir ()
+	if not d:
+		return None
+	h = hashlib.sha256 (data_digest.encode ('ascii'))
+	h.update (repr ((CACHE_VERSION,) + key).encode ('utf-8'))
+	return os.path.join (d, h.hexdigest () + '.pickle')
+
+def cache_read (path):
+	if path is None:
+		return None
+	try:
+		with open (path, 'rb') as f:
+			return pickle.load (f)
+	except (OSError, EOFError, pickle.UnpicklingError):
+		return None
+
+def cache_write (path, obj):
+	if path is None:
+		return
+	try:
+		os.makedirs (os.path.dirname (path), exist_ok=True)
+		fd, tmp = tempfile.mkstemp (dir=os.path.dirname (path))
+		try:
+			with os.fdopen (fd, 'wb') as f:
+				pickle.dump (obj, f, pickle.HIGHEST_PROTOCOL)
+			os.replace (tmp, path)
+		except BaseException:
+			os.unlink (tmp)
+			raise
+	except OSError:
+		pass
+
+
+def load_fields (path, fields, only=None):
+	"""Returns a list of Property objects, one for each of the given field
+	numbers of the UCD file at path.
+
+	If only is given, lines whose first value field is not in it are
+	ignored; this is for files like DerivedCoreProperties.txt that list
+	several overlapping properties."""
+	fields = tuple (fields)
+	if only is not None:
+		only = frozenset ([only] if isinstance (only, str) else only)
+
+	with open (path, 'rb') as f:
+		data = f.read ()
+	cache = cache_path (digest (data), fields, sorted (only) if only is not None else None)
+
+	props = cache_read (cache)
+	if props is None:
+		props = _parse (data.decode ('utf-8').splitlines (True), fields, only)
+		cache_write (cache, props)
+	return props
+
+def load (path, field=1, only=None):
+	"""Returns a Property for one field of the UCD file at path."""
+	return load_fields (path, (field,), only)[0]
+
+
+def combine (properties, defaults, primary):
+	"""Returns a dict from code point to the list of values of the given
+	properties, for code points that have a value in any of the first
+	`primary` properties.  Missing values are taken from defaults."""
+	combined = {}
+	for p in properties[:primary]:
+		for start, end, _ in p.ranges ():
+			for u in range (start, end + 1):
+				combined[u] = None
+	for u in combined:
+		combined[u] = [p.get (u, d) for p, d in zip (properties, defaults)]
+	return combined
+
+
+class UcdXml (object):
+	"""Columns of a UCDXML file, as read by packTab.ucdxml.
+
+	Each column is a Property over the code space.  Columns are loaded
+	from the cache on first use; only if one of them is missing is the
+	XML parsed, in which case all of the given columns are extracted
+	and cached together."""
+
+	def __init__ (self, path, columns):
+		with open (path, 'rb') as f:
+			self.digest = digest (f.read ())
+		self.path = path
+		self.column_names = tuple (columns)
+		self.columns = {}
+		self._description = None
+
+	@property
+	def description (self):
+		if self._description is None:
+			self._description = cache_read (cache_path (self.digest, 'ucdxml', None))
+			if self._description is None:
+				self._parse ()
+		return self._description
+
+	def __getitem__ (self, name):
+		prop = self.columns.get (name)
+		if prop is None:
+			prop = cache_read (cache_path (self.digest, 'ucdxml', name))
+			if prop is None:
+				self._parse ()
+				prop = self.columns[name]
+			self.columns[name] = prop
+		return prop
+
+	def _parse (self):
+		import packTab.ucdxml
+
+		ucdxml = packTab.ucdxml.load_ucdxml (self.path)
+		names = self.column_names
+		values = [[None] for _ in names]
+		positions = [{} for _ in names]
+		indices = [array.array ('L', bytes (MAX_UNICODE * array.array ('L').itemsize)) for _ in names]
+
+		def process (elt, attrs):
+			tag = elt.tag.split ('}')[1]
+			if tag == 'group':
+				group = dict (elt.attrib)
+				for child in elt.getchildren ():
+					process (child, group)
+				return
+			if tag not in ('char', 'noncharacter', 'reserved', 'surrogate'):
+				return
+			u = elt.attrib
+			if 'cp' in u:
+				start = end = int (u['cp'], 16)
+			else:
+				start, end = int (u['first-cp'], 16), int (u['last-cp'], 16)
+			for k, name in enumerate (names):
+				v = u.get (name)
+				if v is None:
+					v = attrs.get (name)
+				i = positions[k].get (v)
+				if i is None:
+					i = positions[k][v] = len (values[k])
+					values[k].append (v)
+				indices[k][start:end + 1] = _fill ('L', i, end - start + 1)
+
+		for elt in ucdxml.repertoire.getchildren ():
+			process (elt, {})
+
+		self._description = str (ucdxml.description)
+		cache_write (cache_path (self.digest, 'ucdxml', None), self._description)
+		for k, name in enumerate (names):
+			prop = Property (values[k], _fit (indices[k], len (values[k])))
+			if name not in self.columns:
+				self.columns[name] = prop
+			cache_write (cache_path (self.digest, 'ucdxml', name), prop)
+
+def load_ucdxml (path, columns):
+	"""Returns a UcdXml for the given UCDXML file (or zip of it)."""
+	return UcdXml (path, columns)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+"""usage: ./update-unicode-tables.py [-jN] [--force] [--data-dir=DIR] [OUTPUT...]
+
+Regenerates the tables built by the gen-*.py scripts, like
+update-unicode-tables.make, but only reruns the generators whose inputs
+changed since their last run, and runs them in parallel (-jN, default:
+one job per CPU).
+
+A generator is stale if the digest of its script, the local modules it
+imports, its input files and the installed packTab differs from the one
+recorded on its last successful run, or if any of its outputs is missing
+or differs from what that run wrote.  Digests are recorded in the cache
+directory of ucd_loader.py ($HB_UCD_CACHE_DIR).  --force reruns every
+generator.
+
+Each generator runs in a scratch directory laid out like the source
+tree, in which its inputs are linked under their usual names, so that it
+is invoked exactly as by the makefile.  Its outputs are then copied back
+atomically, and only if their content changed, so that the sources
+including them are not rebuilt for nothing.
+
+The downloaded input files (see update-unicode-tables.make) are looked
+up in --data-dir first, then in this directory.  If OUTPUTs are given,
+only their generators are considered.
+"""
+
+import sys, os, re, hashlib, shutil, subprocess, tempfile
+import concurrent.futures
+
+import ucd_loader
+
+srcdir = os.path.dirname (os.path.abspath (__file__))
+
+class Generator (object):
+	"""A gen-*.py script writing output on its standard output, and any
+	side outputs itself; paths are relative to srcdir.  deps are the
+	local modules and scripts it uses, extra_inputs the files it reads
+	without being given them as arguments."""
+
+	def __init__ (self, output, script, args=(), deps=(), extra_inputs=(), side_outputs=()):
+		self.output = output
+		self.script = script
+		self.args = list (args)
+		self.inputs = [script] + list (deps) + list (args) + list (extra_inputs)
+		self.outputs = [output] + list (side_outputs)
+
+UCD_LOADER = ('ucd_loader.py',)
+USE_INPUTS = ('IndicSyllabicCategory.txt', 'IndicPositionalCategory.txt', 'ArabicShaping.txt',
+	      'DerivedCoreProperties.txt', 'UnicodeData.txt', 'Blocks.txt', 'Scripts.txt',
+	      'ms-use/IndicSyllabicCategory-Additional.txt', 'ms-use/IndicPositionalCategory-Additional.txt')
+
+# Keep in sync with the all target of update-unicode-tables.make.
+GENERATORS = [
+	Generator ('hb-ot-shaper-arabic-joining-list.hh', 'gen-arabic-joining-list.py',
+		   ('ArabicShaping.txt', 'Scripts.txt'), UCD_LOADER),
+	Generator ('hb-ot-shaper-arabic-table.hh', 'gen-arabic-table.py',
+		   ('ArabicShaping.txt', 'UnicodeData.txt', 'Blocks.txt'), UCD_LOADER),
+	Generator ('hb-ot-shaper-arabic-pua.hh', 'gen-arabic-pua.py',
+		   extra_inputs=('ArabicPUASimplified.txt', 'ArabicPUATraditional.txt')),
+	Generator ('hb-unicode-emoji-table.hh', 'gen-emoji-table.py',
+		   ('emoji-data.txt', 'emoji-test.txt'),
+		   side_outputs=('../test/shape/data/in-house/tests/emoji-clusters.tests',
+				 '../perf/texts/emoji-sequences.txt')),
+	Generator ('hb-ot-shaper-indic-table.cc', 'gen-indic-table.py',
+		   ('IndicSyllabicCategory.txt', 'IndicPositionalCategory.txt', 'Blocks.txt'), UCD_LOADER),
+	Generator ('hb-ot-tag-table.hh', 'gen-tag-table.py',
+		   ('languagetags', 'language-subtag-registry'), UCD_LOADER),
+	Generator ('hb-ucd-table.hh', 'gen-ucd-table.py',
+		   ('ucd.nounihan.grouped.zip', 'hb-common.h'), UCD_LOADER),
+	Generator ('hb-ot-shaper-use-table.hh', 'gen-use-table.py', USE_INPUTS, UCD_LOADER),
+	Generator ('hb-ot-shaper-vowel-constraints.cc', 'gen-vowel-constraints.py',
+		   ('ms-use/IndicShapingInvalidCluster.txt', 'Scripts.txt'), UCD_LOADER),
+]
+
+
+def file_digest (path):
+	"""Returns the digest of the file at path, or None if it is missing."""
+	try:
+		with open (path, 'rb') as f:
+			return ucd_loader.digest (f.read ())
+	except FileNotFoundError:
+		return None
+
+def write_if_changed (path, data):
+	"""Atomically replaces the file at path with data, unless it already
+	has that content.  Returns whether the file was written."""
+	try:
+		with open (path, 'rb') as f:
+			if f.read () == data:
+				return False
+	except FileNotFoundError:
+		pass
+	d = os.path.dirname (path)
+	fd, tmp = tempfile.mkstemp (dir=d, prefix='.' + os.path.basename (path) + '.')
+	try:
+		with os.fdopen (fd, 'wb') as f:
+			f.write (data)
+		if os.path.exists (path):
+			shutil.copymode (path, tmp)
+		else:
+			umask = os.umask (0)
+			os.umask (umask)
+			os.chmod (tmp, 0o666 & ~umask)
+		os.replace (tmp, path)
+	except BaseException:
+		os.unlink (tmp)
+		raise
+	return True
+
+
+def packtab_digest ():
+	"""Returns a digest of the installed packTab, whose version the packed
+	tables depend on too, or None if it is missing."""
+	try:
+		import packTab
+	except ImportError:
+		return None
+	h = hashlib.sha256 (str (getattr (packTab, '__version__', None)).encode ('utf-8'))
+	d = os.path.dirname (os.path.abspath (packTab.__file__))
+	for name in sorted (os.listdir (d)):
+		if name.endswith ('.py'):
+			h.update (('%s %s\n' % (name, file_digest (os.path.join (d, name)))).encode ('utf-8'))
+	return h.hexdigest ()
+
+def resolve (name, data_dir):
+	if data_dir:
+		path = os.path.join (data_dir, name)
+		if os.path.exists (path):
+			return path
+	return os.path.join (srcdir, name)
+
+def stamp (gen, paths, packtab):
+	"""Returns the digest of everything gen's output depends on, or None
+	if an input is missing."""
+	h = hashlib.sha256 (repr ((gen.script, gen.args, packtab)).encode ('utf-8'))
+	for name in gen.inputs:
+		d = file_digest (paths[name])
+		if d is None:
+			return None
+		h.update (('%s %s\n' % (name, d)).encode ('utf-8'))
+	return h.hexdigest ()
+
+def run (gen, paths):
+	"""Runs gen in a scratch tree and returns (returncode, stderr,
+	{output: data})."""
+	with tempfile.TemporaryDirectory () as tmpdir:
+		cwd = os.path.join (tmpdir, 'src')
+		for name in gen.inputs:
+			link = os.path.join (cwd, name)
+			os.makedirs (os.path.dirname (link), exist_ok=True)
+			os.symlink (os.path.abspath (paths[name]), link)
+		for name in gen.outputs[1:]:
+			os.makedirs (os.path.dirname (os.path.normpath (os.path.join (cwd, name))), exist_ok=True)
+
+		p = subprocess.run ([sys.executable, './' + gen.script] + gen.args, cwd=cwd,
+				    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		if p.returncode:
+			return p.returncode, p.stderr, None
+
+		data = {gen.output: p.stdout}
+		for name in gen.outputs[1:]:
+			with open (os.path.join (cwd, name), 'rb') as f:
+				data[name] = f.read ()
+		return 0, p.stderr, data
+
+
+def main (argv):
+	jobs = os.cpu_count () or 1
+	force = False
+	data_dir = None
+	selected = []
+	for arg in argv:
+		m = re.fullmatch (r'-j(\d*)|--jobs=(\d+)', arg)
+		if m:
+			n = m.group (1) or m.group (2)
+			if n:
+				jobs = int (n)
+			if not jobs:
+				sys.exit (__doc__)
+		elif arg == '--force':
+			force = True
+		elif arg.startswith ('--data-dir='):
+			data_dir = arg[len ('--data-dir='):]
+		elif arg.startswith ('-'):
+			sys.exit (__doc__)
+		else:
+			selected.append (arg)
+
+	generators = GENERATORS
+	if selected:
+		known = {gen.output: gen for gen in GENERATORS}
+		unknown = [name for name in selected if name not in known]
+		if unknown:
+			sys.exit ('Unknown outputs: %s' % ' '.join (unknown))
+		generators = [known[name] for name in selected]
+
+	cache = ucd_loader.cache_path (ucd_loader.digest (srcdir.encode ('utf-8')), 'update-unicode-tables')
+	stamps = ucd_loader.cache_read (cache) or {}
+
+	packtab = packtab_digest ()
+	failed = False
+	stale = []
+	for gen in generators:
+		paths = {name: resolve (name, data_dir) for name in gen.inputs}
+		missing = [name for name in gen.inputs if not os.path.exists (paths[name])]
+		if missing:
+			print ('%s: missing %s' % (gen.output, ' '.join (missing)))
+			failed = True
+			continue
+		key = stamp (gen, paths, packtab)
+		outputs = {name: file_digest (os.path.join (srcdir, name)) for name in gen.outputs}
+		if not force and stamps.get (gen.output) == (key, outputs):
+			print ('%s: up to date' % gen.output)
+			continue
+		stale.append ((gen, paths, key))
+
+	with concurrent.futures.ThreadPoolExecutor (max (1, min (jobs, len (stale)))) as executor:
+		futures = {executor.submit (run, gen, paths): (gen, key) for gen, paths, key in stale}
+		for future in concurrent.futures.as_completed (futures):
+			gen, key = futures[future]
+			returncode, stderr, data = future.result ()
+			if returncode:
+				sys.stderr.write (stderr.decode ('utf-8', 'replace'))
+				print ('%s: %s failed with status %d' % (gen.output, gen.script, returncode))
+				failed = True
+				continue
+			changed = [name for name in gen.outputs if write_if_changed (os.path.join (srcdir, name), data[name])]
+			print ('%s: %s' % (gen.output, 'updated ' + ' '.join (changed) if changed else 'unchanged'))
+			stamps[gen.output] = (key, {name: ucd_loader.digest (data[name]) for name in gen.outputs})
+
+	ucd_loader.cache_write (cache, stamps)
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit (main (sys.argv[1:]))
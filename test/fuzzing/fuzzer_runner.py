@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Shared helpers for the run-*-fuzzer-tests.py scripts.  Runs a fuzzer
+# binary on one input and records the peak RSS and page-fault counts of
+# the child, so that inputs blowing up memory can be flagged.
+#
+# Environment variables:
+#
+#   HB_FUZZER_MAX_RSS        Fail inputs whose peak RSS exceeds this many KiB.
+#   HB_FUZZER_RSS_BASELINE   Directory of per-input peak RSS (KiB), one
+#                            <fuzzer>.json file per fuzzer binary.  If the
+#                            file of a fuzzer does not exist, it is written
+#                            at the end of its run; otherwise inputs are
+#                            checked against it.
+#   HB_FUZZER_RSS_TOLERANCE  Allowed growth over the baseline, as a ratio.
+#                            Defaults to 0.25.
+
+import sys, os, subprocess, tempfile, json
+
+# Inputs are keyed by their path relative to the source root, as the same
+# file name can appear in several input directories.
+top_srcdir = os.path.normpath (os.path.join (os.path.dirname (os.path.abspath (__file__)), '..', '..'))
+
+
+def _wait (p):
+	# os.wait4 is not available everywhere (eg. Windows); fall back to a
+	# plain wait without resource accounting there.
+	if not hasattr (os, 'wait4'):
+		return p.wait (), None
+
+	_, status, rusage = os.wait4 (p.pid, 0)
+	p.returncode = os.waitstatus_to_exitcode (status)
+	return p.returncode, rusage
+
+
+def cmd (command):
+	# https://stackoverflow.com/a/4408409 as we might have huge output sometimes
+	with tempfile.TemporaryFile () as tempf:
+		p = subprocess.Popen (command, stderr=tempf)
+
+		returncode, rusage = _wait (p)
+		tempf.seek (0)
+		text = tempf.read ()
+
+		#TODO: Detect debug mode with a better way
+		is_debug_mode = b"SANITIZE" in text
+
+		return ("" if is_debug_mode else text.decode ("utf-8").strip ()), returncode, rusage
+
+
+def _maxrss_kib (rusage):
+	# ru_maxrss is in bytes on macOS and in KiB elsewhere.
+	if sys.platform == 'darwin':
+		return rusage.ru_maxrss // 1024
+	return rusage.ru_maxrss
+
+
+class MemoryCheck:
+
+	# fuzzer is the path of the fuzzer binary; each binary has its own
+	# baseline, as they all run the same inputs.
+	def __init__ (self, fuzzer):
+		max_rss = os.getenv ('HB_FUZZER_MAX_RSS', '')
+		self.max_rss = int (max_rss) if max_rss else None
+		self.tolerance = float (os.getenv ('HB_FUZZER_RSS_TOLERANCE', '0.25'))
+		baseline_dir = os.getenv ('HB_FUZZER_RSS_BASELINE', '')
+		self.baseline_path = None
+		if baseline_dir:
+			name = os.path.splitext (os.path.basename (fuzzer))[0]
+			self.baseline_path = os.path.join (baseline_dir, name + '.json')
+		self.baseline = None
+		if self.baseline_path and os.path.exists (self.baseline_path):
+			with open (self.baseline_path, encoding='utf-8') as f:
+				self.baseline = json.load (f)
+		self.results = {}
+
+	# Returns a list of messages describing why the input is flagged;
+	# empty if it is within limits.
+	def check (self, path, rusage):
+		if rusage is None:
+			return []
+
+		key = os.path.relpath (os.path.abspath (path), top_srcdir).replace (os.sep, '/')
+		rss = _maxrss_kib (rusage)
+		self.results[key] = rss
+		print ('%s: peak rss %d KiB, page faults %d major / %d minor' %
+		       (key, rss, rusage.ru_majflt, rusage.ru_minflt))
+
+		problems = []
+		if self.max_rss is not None and rss > self.max_rss:
+			problems.append ('peak rss %d KiB exceeds limit of %d KiB' %
+					 (rss, self.max_rss))
+		if self.baseline is not None and key in self.baseline:
+			base = self.baseline[key]
+			if rss > base * (1 + self.tolerance):
+				problems.append ('peak rss %d KiB regressed from baseline %d KiB' %
+						 (rss, base))
+		return problems
+
+	def finish (self):
+		if not self.results:
+			return
+		rss = sorted (self.results.items (), key=lambda kv: kv[1], reverse=True)
+		print ('largest peak rss: %s (%d KiB)' % rss[0])
+		if self.baseline_path and self.baseline is None:
+			os.makedirs (os.path.dirname (self.baseline_path), exist_ok=True)
+			with open (self.baseline_path, 'w', encoding='utf-8') as f:
+				json.dump (self.results, f, indent=1, sort_keys=True)
+			print ('wrote rss baseline to %s' % self.baseline_path)
@@ -1,24 +1,8 @@
 #!/usr/bin/env python3
 
-import sys, os, subprocess, tempfile, shutil
+import sys, os, shutil
 
-
-def cmd (command):
-	# https://stackoverflow.com/a/4408409 as we might have huge output sometimes
-	with tempfile.TemporaryFile () as tempf:
-		p = subprocess.Popen (command, stderr=tempf)
-
-		try:
-			p.wait ()
-			tempf.seek (0)
-			text = tempf.read ()
-
-			#TODO: Detect debug mode with a better way
-			is_debug_mode = b"SANITIZE" in text
-
-			return ("" if is_debug_mode else text.decode ("utf-8").strip ()), p.returncode
-		except subprocess.TimeoutExpired:
-			return 'error: timeout, ' + ' '.join (command), 1
+from fuzzer_runner import cmd, MemoryCheck
 
 
 srcdir = os.getenv ("srcdir", ".")
@@ -42,21 +26,29 @@ if os.getenv ('RUN_VALGRIND', ''):
 	if valgrind is None:
 		sys.exit ("""Valgrind requested but not found.""")
 
+memory = MemoryCheck (hb_repacker_fuzzer)
+
 def run_dir (parent_path):
 	global fails
 	for file in os.listdir (parent_path):
 		path = os.path.join(parent_path, file)
 		print ("running repacker fuzzer against %s" % path)
 		if valgrind:
-			text, returncode = cmd ([valgrind, '--leak-check=full', '--error-exitcode=1', hb_repacker_fuzzer, path])
+			text, returncode, _ = cmd ([valgrind, '--leak-check=full', '--error-exitcode=1', hb_repacker_fuzzer, path])
+			# Memory use under valgrind is valgrind's, not the fuzzer's.
+			rusage = None
 		else:
-			text, returncode = cmd ([hb_repacker_fuzzer, path])
+			text, returncode, rusage = cmd ([hb_repacker_fuzzer, path])
 			if 'error' in text:
 				returncode = 1
 
 		if (not valgrind or returncode) and text.strip ():
 			print (text)
 
+		for problem in memory.check (path, rusage):
+			print (problem)
+			returncode = 1
+
 		if returncode != 0:
 			print ("failed for %s" % path)
 			fails = fails + 1
@@ -64,5 +56,7 @@ def run_dir (parent_path):
 
 run_dir (os.path.join (srcdir, "graphs"))
 
+memory.finish ()
+
 if fails:
 	sys.exit ("%d repacker fuzzer related tests failed." % fails)
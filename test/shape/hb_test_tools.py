@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
-import sys, os, re, difflib, unicodedata, errno, cgi, itertools
+import sys, os, re, unicodedata, errno, cgi, itertools, array, heapq, collections, functools, json
+import shutil, tempfile
+import multiprocessing, concurrent.futures
 from itertools import *
 
 diff_symbols = "-+=*&^%$#@!~/"
@@ -67,6 +69,93 @@ class ColorFormatter:
 		return format
 
 
+class TokenDiffer:
+
+	@staticmethod
+	def diff (a, b, max_cost=1024):
+		'''Returns a list of (op, tokens) pairs, op being ' ', '-' or '+',
+		   turning token list a into b.  Uses Myers' O(ND) algorithm after
+		   trimming the common prefix and suffix.  Gives up on finding a
+		   minimal script for very dissimilar inputs.'''
+
+		n, m = len (a), len (b)
+		pre = 0
+		while pre < n and pre < m and a[pre] == b[pre]:
+			pre += 1
+		suf = 0
+		while suf < n - pre and suf < m - pre and a[n - 1 - suf] == b[m - 1 - suf]:
+			suf += 1
+
+		ops = []
+		def emit (op, tokens):
+			if not tokens:
+				return
+			if ops and ops[-1][0] == op:
+				ops[-1][1].extend (tokens)
+			else:
+				ops.append ((op, list (tokens)))
+
+		emit (' ', a[:pre])
+		A, B = a[pre:n - suf], b[pre:m - suf]
+		N, M = len (A), len (B)
+
+		# Forward pass, keeping the frontier of every round for backtracking.
+		v = {1: 0}
+		trace = []
+		found = N == 0 or M == 0
+		d = 0
+		while not found:
+			if d > max_cost:
+				break
+			trace.append (v.copy ())
+			for k in range (-d, d + 1, 2):
+				if k == -d or (k != d and v[k - 1] < v[k + 1]):
+					x = v[k + 1]
+				else:
+					x = v[k - 1] + 1
+				y = x - k
+				while x < N and y < M and A[x] == B[y]:
+					x += 1
+					y += 1
+				v[k] = x
+				if x >= N and y >= M:
+					found = True
+					break
+			d += 1
+
+		if not found or N == 0 or M == 0:
+			emit ('-', A)
+			emit ('+', B)
+		else:
+			# Backtrack from (N, M) to (0, 0).
+			script = []
+			x, y = N, M
+			for d in range (len (trace) - 1, -1, -1):
+				v = trace[d]
+				k = x - y
+				if k == -d or (k != d and v[k - 1] < v[k + 1]):
+					prev_k = k + 1
+				else:
+					prev_k = k - 1
+				prev_x = v[prev_k]
+				prev_y = prev_x - prev_k
+				while x > prev_x and y > prev_y:
+					x -= 1
+					y -= 1
+					script.append ((' ', A[x]))
+				if d > 0:
+					if x == prev_x:
+						script.append (('+', B[prev_y]))
+					else:
+						script.append (('-', A[prev_x]))
+				x, y = prev_x, prev_y
+			for op, token in reversed (script):
+				emit (op, (token,))
+
+		emit (' ', a[n - suf:])
+		return ops
+
+
 class DiffColorizer:
 
 	diff_regex = re.compile ('([a-za-z0-9_]*)([^a-za-z0-9_]?)')
@@ -78,31 +167,28 @@ class DiffColorizer:
 
 	def colorize_lines (self, lines):
 		lines = (l if l else '' for l in lines)
-		ss = [self.diff_regex.sub (r'\1\n\2\n', l).splitlines (True) for l in lines]
+		ss = [[t for t in chain.from_iterable (self.diff_regex.findall (l)) if t and t != '\n']
+		      for l in lines]
 		oo = ["",""]
 		st = [False, False]
-		for l in difflib.Differ().compare (*ss):
-			if l[0] == '?':
-				continue
-			if l[0] == ' ':
+		for op, tokens in TokenDiffer.diff (*ss):
+			text = self.formatter.escape (''.join (tokens))
+			if op == ' ':
 				for i in range(2):
 					if st[i]:
 						oo[i] += self.formatter.end_color ()
 						st[i] = False
-				oo = [o + self.formatter.escape (l[2:]) for o in oo]
-				continue
-			if l[0] in self.symbols:
-				i = self.symbols.index (l[0])
-				if not st[i]:
-					oo[i] += self.formatter.start_color (self.colors[i])
-					st[i] = True
-				oo[i] += self.formatter.escape (l[2:])
+				oo = [o + text for o in oo]
 				continue
+			i = self.symbols.index (op)
+			if not st[i]:
+				oo[i] += self.formatter.start_color (self.colors[i])
+				st[i] = True
+			oo[i] += text
 		for i in range(2):
 			if st[i]:
 				oo[i] += self.formatter.end_color ()
 				st[i] = False
-		oo = [o.replace ('\n', '') for o in oo]
 		return [s1+s2+self.formatter.newline () for (s1,s2) in zip (self.symbols, oo) if s2]
 
 	def colorize_diff (self, f):
@@ -132,21 +218,86 @@ class DiffColorizer:
 class ZipDiffer:
 
 	@staticmethod
-	def diff_files (files, symbols=diff_symbols):
+	def diff_files (files, symbols=diff_symbols, window=0, out=None):
+		"""Writes the lines all files agree on prefixed with a space, and
+		   the differing lines prefixed with the symbol of their file.
+		   Lines are compared pairwise unless window is set and there are
+		   two files; then up to window lines are searched ahead to
+		   resynchronize after inserted or removed lines."""
 		files = tuple (files) # in case it's a generator, copy it
+		out = out or sys.stdout
+		buf = []
 		try:
-			for lines in itertools.zip_longest (*files):
+			if window and len (files) == 2:
+				zipped = ZipDiffer.resync_lines (files[0], files[1], window)
+			else:
+				zipped = itertools.zip_longest (*files)
+			for lines in zipped:
 				if all (lines[0] == line for line in lines[1:]):
-					sys.stdout.writelines ([" ", lines[0]])
-					continue
-
-				for i, l in enumerate (lines):
-					if l:
-						sys.stdout.writelines ([symbols[i], l])
+					buf.append (" ")
+					buf.append (lines[0])
+				else:
+					for i, l in enumerate (lines):
+						if l:
+							buf.append (symbols[i])
+							buf.append (l)
+				if len (buf) >= 16384:
+					out.write (''.join (buf))
+					buf.clear ()
+			out.write (''.join (buf))
 		except IOError as e:
 			if e.errno != errno.EPIPE:
 				sys.exit ("%s: %s: %s" % (sys.argv[0], e.filename, e.strerror))
 
+	@staticmethod
+	def resync_lines (a, b, window):
+		"""Yields (line_a, line_b) pairs, either being None for lines only
+		   present in one file.  Keeps at most window + 1 lines of each file
+		   in memory."""
+		a, b = iter (a), iter (b)
+		qa, qb = collections.deque (), collections.deque ()
+
+		def fill (q, f, n):
+			while len (q) < n:
+				l = next (f, None)
+				if l is None:
+					return
+				q.append (l)
+
+		while True:
+			fill (qa, a, 1)
+			fill (qb, b, 1)
+			if not qa and not qb:
+				return
+			if qa and qb and qa[0] == qb[0]:
+				yield qa.popleft (), qb.popleft ()
+				continue
+
+			fill (qa, a, window + 1)
+			fill (qb, b, window + 1)
+			# Find the closest pair of equal lines; i and j lines are
+			# then skipped in a and b respectively.
+			first = {}
+			for j, l in enumerate (qb):
+				first.setdefault (l, j)
+			best = None
+			for i, l in enumerate (qa):
+				j = first.get (l)
+				if j is not None and (best is None or i + j < sum (best)):
+					best = (i, j)
+
+			if best is None:
+				yield (qa.popleft () if qa else None), (qb.popleft () if qb else None)
+				continue
+			i, j = best
+			common = min (i, j)
+			for _ in range (common):
+				yield qa.popleft (), qb.popleft ()
+			for _ in range (i - common):
+				yield qa.popleft (), None
+			for _ in range (j - common):
+				yield None, qb.popleft ()
+
 
 class DiffFilters:
 
@@ -159,6 +310,8 @@ class DiffFilters:
 
 class Stat:
 
+	__slots__ = ('count', 'freq')
+
 	def __init__ (self):
 		self.count = 0
 		self.freq = 0
@@ -167,19 +320,28 @@ class Stat:
 		self.count += 1
 		self.freq += test.freq
 
+	def add_result (self, freq = 1):
+		self.count += 1
+		self.freq += freq
+
 class Stats:
 
+	__slots__ = ('passed', 'failed', 'total')
+
 	def __init__ (self):
 		self.passed = Stat ()
 		self.failed = Stat ()
 		self.total  = Stat ()
 
 	def add (self, test):
-		self.total.add (test)
-		if test.passed:
-			self.passed.add (test)
+		self.add_result (test.passed, test.freq)
+
+	def add_result (self, passed, freq = 1):
+		self.total.add_result (freq)
+		if passed:
+			self.passed.add_result (freq)
 		else:
-			self.failed.add (test)
+			self.failed.add_result (freq)
 
 	def mean (self):
 		return float (self.passed.count) / self.total.count
@@ -207,51 +369,107 @@ class Stats:
 class DiffSinks:
 
 	@staticmethod
-	def print_stat (f):
-		passed = 0
-		failed = 0
-		# XXX port to Stats, but that would really slow us down here
+	def collect_stats (f, by_identifier = False):
+		"""Streams the test cases of f once, returning the overall Stats
+		   and, if by_identifier is set, a dict of Stats per identifier.
+		   Only one test case is held in memory at a time."""
+		stats = Stats ()
+		identifiers = {}
 		for key, lines in DiffHelpers.separate_test_cases (f):
-			if DiffHelpers.test_passed (lines):
-				passed += 1
-			else:
-				failed += 1
-		total = passed + failed
+			passed = DiffHelpers.test_passed (lines)
+			stats.add_result (passed)
+			if by_identifier:
+				if key not in identifiers:
+					identifiers[key] = Stats ()
+				identifiers[key].add_result (passed)
+		return stats, identifiers
+
+	@staticmethod
+	def print_stat_summary (stats):
+		passed, failed, total = stats.passed.count, stats.failed.count, stats.total.count
 		print ("%d out of %d tests passed.  %d failed (%g%%)" % (passed, total, failed, 100. * failed / total))
 
+	@staticmethod
+	def print_stat (f):
+		stats, _ = DiffSinks.collect_stats (f)
+		DiffSinks.print_stat_summary (stats)
+
+	@staticmethod
+	def print_ngram_stat (f):
+		# The tests are read twice; see NgramStats.
+		if not f.seekable ():
+			spool = tempfile.TemporaryFile ('w+')
+			shutil.copyfileobj (f, spool)
+			spool.seek (0)
+			f = spool
+		start = f.tell ()
+		def tests ():
+			f.seek (start)
+			for key, lines in DiffHelpers.separate_test_cases (f):
+				lines = list (lines)
+				unicodes = Test (lines).unicodes
+				if unicodes:
+					yield unicodes, DiffHelpers.test_passed (lines)
+		ngrams = NgramStats ()
+		for unicodes, passed in tests ():
+			ngrams.add (unicodes, passed)
+		for unicodes, passed in tests ():
+			ngrams.recount (unicodes, passed)
+		for z, ngram, stats in ngrams.anomalies ():
+			print ("%8.2f %6d/%-6d %-32s %s" % (z, stats.failed.count, stats.total.count,
+							   ','.join ("U+%04X" % u for u in ngram),
+							   ' + '.join (Unicode.pretty_name (chr (u)) for u in ngram)))
+		DiffSinks.print_stat_summary (ngrams.population)
+
+	@staticmethod
+	def print_identifier_stat (f):
+		stats, identifiers = DiffSinks.collect_stats (f, by_identifier = True)
+		for key, s in sorted (identifiers.items (), key = lambda kv: -kv[1].failed.count):
+			if not s.failed.count:
+				break
+			print ("%s: %d out of %d tests failed" % (key.rstrip ('\n'), s.failed.count, s.total.count))
+		DiffSinks.print_stat_summary (stats)
+
 
 class Test:
 
+	__slots__ = ('freq', 'passed', 'identifier', 'text', '_unicodes', 'glyphs')
+
 	def __init__ (self, lines):
 		self.freq = 1
 		self.passed = True
 		self.identifier = None
 		self.text = None
-		self.unicodes = None
+		self._unicodes = None
 		self.glyphs = None
 		for l in lines:
-			symbol = l[0]
-			if symbol != ' ':
+			if l[0] != ' ':
 				self.passed = False
-			i = 1
-			if ':' in l:
-				i = l.index (':')
+			i = l.find (':')
+			if i < 0:
+				i = 1
+			else:
 				if not self.identifier:
 					self.identifier = l[1:i]
 				i = i + 2 # Skip colon and space
-			j = -1
-			if l[j] == '\n':
-				j -= 1
+			j = -2 if l[-1] == '\n' else -1
 			brackets = l[i] + l[j]
 			l = l[i+1:-2]
 			if brackets == '()':
 				self.text = l
 			elif brackets == '<>':
-				self.unicodes = Unicode.parse (l)
+				self._unicodes = l
 			elif brackets == '[]':
 				# XXX we don't handle failed tests here
 				self.glyphs = l
 
+	@property
+	def unicodes (self):
+		# Parsed on first use; most consumers only need pass/fail.
+		if isinstance (self._unicodes, str):
+			self._unicodes = Unicode.parse (self._unicodes)
+		return self._unicodes
+
 
 class DiffHelpers:
 
@@ -267,17 +485,20 @@ class DiffHelpers:
 			return l
 		return groupby (f, key=identifier)
 
+	# XXX This is a hack, but does the job for now.
+	ignored_failures = ("space+0|space+0", "uni25CC", "dottedcircle", "glyph0", "gid0", "notdef")
+
 	@staticmethod
 	def test_passed (lines):
-		lines = list (lines)
-		# XXX This is a hack, but does the job for now.
-		if any (l.find("space+0|space+0") >= 0 for l in lines if l[0] == '+'): return True
-		if any (l.find("uni25CC") >= 0 for l in lines if l[0] == '+'): return True
-		if any (l.find("dottedcircle") >= 0 for l in lines if l[0] == '+'): return True
-		if any (l.find("glyph0") >= 0 for l in lines if l[0] == '+'): return True
-		if any (l.find("gid0") >= 0 for l in lines if l[0] == '+'): return True
-		if any (l.find("notdef") >= 0 for l in lines if l[0] == '+'): return True
-		return all (l[0] == ' ' for l in lines)
+		# Single pass over the lines of the test case.
+		passed = True
+		for l in lines:
+			if l[0] == ' ':
+				continue
+			if l[0] == '+' and any (p in l for p in DiffHelpers.ignored_failures):
+				return True
+			passed = False
+		return passed
 
 
 class FilterHelpers:
@@ -296,6 +517,53 @@ class FilterHelpers:
 				sys.stdout.writelines ([line])
 		return printer
 
+	@staticmethod
+	def split_test_cases (f, chunk_lines = 50000):
+		"""Yields lists of about chunk_lines lines from f, never splitting
+		   a test case across two lists.  Lines without an identifier are
+		   test cases of their own, but colorize_diff pairs them with their
+		   neighbours, so lists only end between two test cases that have
+		   identifiers; input without any is yielded as one list."""
+		chunk = []
+		previous = False
+		for key, lines in DiffHelpers.separate_test_cases (f):
+			lines = list (lines)
+			identified = ':' in lines[0][1:]
+			if previous and identified and len (chunk) >= chunk_lines:
+				yield chunk
+				chunk = []
+			chunk.extend (lines)
+			previous = identified
+		if chunk:
+			yield chunk
+
+	@staticmethod
+	def filter_chunk (filter_callback, lines):
+		return list (filter_callback (lines))
+
+	@staticmethod
+	def parallel_filter_function (filter_callback, jobs = None):
+		"""Wraps a filter that works test case by test case so that it runs
+		   on chunks of the input in a pool of jobs processes.  Output is
+		   yielded in input order, and only a few chunks per job are in
+		   flight at any time.  filter_callback must be picklable."""
+		if 'fork' not in multiprocessing.get_all_start_methods ():
+			# The hb-* scripts are not safe to re-import in workers.
+			return filter_callback
+
+		def filter (f):
+			jobs_ = jobs or os.cpu_count () or 1
+			context = multiprocessing.get_context ('fork')
+			with concurrent.futures.ProcessPoolExecutor (jobs_, mp_context=context) as executor:
+				pending = collections.deque ()
+				for chunk in FilterHelpers.split_test_cases (f):
+					pending.append (executor.submit (FilterHelpers.filter_chunk, filter_callback, chunk))
+					if len (pending) >= 2 * jobs_:
+						yield from pending.popleft ().result ()
+				while pending:
+					yield from pending.popleft ().result ()
+		return filter
+
 
 class Ngram:
 
@@ -314,8 +582,85 @@ class Ngram:
 		return gen
 
 
+class NgramStats:
+
+	"""Counts how many passing and failing tests contain each codepoint
+	   n-gram.  The tests are given twice: add () counts n-grams hashed
+	   into a fixed number of buckets, which can only over-count, to rule
+	   out those that fail too rarely to be reported; recount () then
+	   counts the remaining ones exactly."""
+
+	def __init__ (self, ns = (1, 2, 3, 4), bits = 20, min_count = 10):
+		self.generators = [Ngram.generator (n) for n in ns]
+		self.mask = (1 << bits) - 1
+		self.min_count = min_count
+		self.total = array.array ('L', [0]) * (1 << bits)
+		self.failed = array.array ('L', [0]) * (1 << bits)
+		self.counts = {}
+		self.population = Stats ()
+
+	def ngrams (self, unicodes):
+		seen = set ()
+		for gen in self.generators:
+			seen.update (gen (unicodes))
+		return seen
+
+	def add (self, unicodes, passed):
+		self.population.add_result (passed)
+		mask = self.mask
+		for ngram in self.ngrams (unicodes):
+			h = hash (ngram) & mask
+			self.total[h] += 1
+			if not passed:
+				self.failed[h] += 1
+
+	def recount (self, unicodes, passed):
+		"""Counts the n-grams of a test exactly, after all tests were
+		   given to add ()."""
+		mask = self.mask
+		counts = self.counts
+		for ngram in self.ngrams (unicodes):
+			h = hash (ngram) & mask
+			if not self.failed[h] or self.total[h] < self.min_count:
+				continue
+			c = counts.get (ngram)
+			if c is None:
+				c = counts[ngram] = [0, 0]
+			c[0 if passed else 1] += 1
+
+	def anomalies (self, limit = 50):
+		"""Returns up to limit (zscore, ngram, Stats) tuples for the n-grams
+		   whose tests fail most unexpectedly often, most anomalous first.
+		   The zscore is scaled by the square root of the sample size."""
+		population = self.population
+		if not population.passed.count or not population.failed.count:
+			return []
+		results = []
+		for ngram, (passed, failed) in self.counts.items ():
+			if not failed or passed + failed < self.min_count:
+				continue
+			stats = Stats ()
+			stats.passed.count = passed
+			stats.failed.count = failed
+			stats.total.count = passed + failed
+			results.append ((stats.zscore (population) * stats.total.count ** .5, ngram, stats))
+		return heapq.nsmallest (limit, results, key = lambda r: r[0])
+
+
 class UtilMains:
 
+	@staticmethod
+	def jobs_from_argv (argv = sys.argv):
+		"""Removes a -jN / --jobs=N option from argv and returns N, 0 meaning
+		   one job per CPU.  Returns 1 if the option is not present."""
+		for arg in argv[1:]:
+			m = re.fullmatch (r"-j(\d*)|--jobs=(\d+)", arg)
+			if m:
+				argv.remove (arg)
+				n = m.group (1) or m.group (2)
+				return int (n) if n else 0
+		return 1
+
 	@staticmethod
 	def process_multiple_files (callback, mnemonic = "FILE"):
 
@@ -381,10 +726,13 @@ class Unicode:
 	def decode (s):
 		return ','.join ("U+%04X" % cp for cp in codepoints (s))
 
+	# Punctuation and letters of the U+, \u, &#x; and uni notations;
+	# translated to spaces in one pass, after removing 0x prefixes.
+	parse_separators = str.maketrans (dict.fromkeys ("<+->{},;&#\\xXuUnNiI\n\t", " "))
+
 	@staticmethod
 	def parse (s):
-		s = re.sub (r"0[xX]", " ", s)
-		s = re.sub (r"[<+\->{},;&#\\xXuUnNiI\n\t]", " ", s)
+		s = s.replace ("0x", " ").replace ("0X", " ").translate (Unicode.parse_separators)
 		return [int (x, 16) for x in s.split ()]
 
 	@staticmethod
@@ -405,43 +753,54 @@ class Unicode:
 		"RIGHT-TO-LEFT OVERRIDE": "RLO",
 	}
 
+	pretty_name_subs = [
+		(re.compile (".* LETTER "), ""),
+		(re.compile (".* VOWEL SIGN (.*)"), r"\1-MATRA"),
+		(re.compile (".* SIGN "), ""),
+		(re.compile (".* COMBINING "), ""),
+	]
+	pretty_name_virama = re.compile (".* VIRAMA")
+
+	# Names only depend on the unicodedata version, which is fixed for
+	# the process, so they are cached across calls.
 	@staticmethod
+	@functools.lru_cache (maxsize = 1 << 16)
 	def pretty_name (u):
 		try:
 			s = unicodedata.name (u)
 		except ValueError:
 			return "XXX"
-		s = re.sub (".* LETTER ", "", s)
-		s = re.sub (".* VOWEL SIGN (.*)", r"\1-MATRA", s)
-		s = re.sub (".* SIGN ", "", s)
-		s = re.sub (".* COMBINING ", "", s)
-		if re.match (".* VIRAMA", s):
+		for regex, repl in Unicode.pretty_name_subs:
+			s = regex.sub (repl, s)
+		if Unicode.pretty_name_virama.match (s):
 			s = "HALANT"
 		if s in Unicode.shorthands:
 			s = Unicode.shorthands[s]
 		return s
 
+	pretty_names_strip = re.compile (r"[<+>\\uU]|0[xX]")
+	pretty_names_split = re.compile ('[, \n]')
+
 	@staticmethod
 	def pretty_names (s):
-		s = re.sub (r"[<+>\\uU]", " ", s)
-		s = re.sub (r"0[xX]", " ", s)
-		s = [chr (int (x, 16)) for x in re.split ('[, \n]', s) if len (x)]
+		s = Unicode.pretty_names_strip.sub (" ", s)
+		s = [chr (int (x, 16)) for x in Unicode.pretty_names_split.split (s) if len (x)]
 		return ' + '.join (Unicode.pretty_name (x) for x in s)
 
 
 class FileHelpers:
 
 	@staticmethod
-	def open_file_or_stdin (f):
+	def open_file_or_stdin (f, buffering = -1):
 		if f == '-':
 			return sys.stdin
-		return open (f)
+		return open (f, buffering = buffering)
 
 
 class Manifest:
 
 	@staticmethod
-	def read (s, strict = True):
+	def read (s, strict = True, dirs = None):
 
 		if not os.path.exists (s):
 			if strict:
@@ -455,22 +814,75 @@ class Manifest:
 			try:
 				m = open (os.path.join (s, "MANIFEST"))
 				items = [x.strip () for x in m.readlines ()]
-				for f in items:
-					for p in Manifest.read (os.path.join (s, f)):
-						yield p
 			except IOError:
+				if dirs is not None:
+					dirs.append ([s, False])
 				if strict:
 					sys.exit ("%s: %s does not exist" % (sys.argv[0], os.path.join (s, "MANIFEST")))
 				return
+			if dirs is not None:
+				dirs.append ([s, True])
+			for f in items:
+				for p in Manifest.read (os.path.join (s, f), strict, dirs):
+					yield p
 		else:
 			yield s
 
+	cache_name = ".MANIFEST.cache"
+
+	@staticmethod
+	def _cache_stamps (dirs):
+		stamps = []
+		for d, has_manifest in dirs:
+			try:
+				stamps.append ([os.stat (d).st_mtime_ns,
+						os.stat (os.path.join (d, "MANIFEST")).st_mtime_ns if has_manifest else None])
+			except OSError:
+				return None
+		return stamps
+
+	@staticmethod
+	def read_cached (s, strict = True):
+		"""Like read(), but returns a list and keeps the result in a
+		   .MANIFEST.cache file in s.  The cache is used as long as none
+		   of the directories or MANIFEST files it was built from has
+		   changed, which costs a stat per directory instead of reading
+		   and recursing through every MANIFEST.  Directories without a
+		   MANIFEST are recorded too, so that non-strict reads do not
+		   look for it again until the directory changes."""
+
+		s = os.path.normpath (s)
+		if not os.path.isdir (s):
+			return list (Manifest.read (s, strict))
+
+		cache = os.path.join (s, Manifest.cache_name)
+		try:
+			with open (cache) as f:
+				cached = json.load (f)
+			if cached["strict"] == strict and Manifest._cache_stamps (cached["dirs"]) == cached["stamps"]:
+				return cached["paths"]
+		except (IOError, ValueError, KeyError, TypeError):
+			pass
+
+		dirs = []
+		paths = list (Manifest.read (s, strict, dirs))
+		try:
+			# Create the cache before taking the stamps, as doing so
+			# changes the mtime of s.
+			with open (cache, "w") as f:
+				stamps = Manifest._cache_stamps (dirs)
+				if stamps is not None:
+					json.dump ({"strict": strict, "dirs": dirs, "stamps": stamps, "paths": paths}, f)
+		except IOError:
+			pass
+		return paths
+
 	@staticmethod
 	def update_recursive (s):
 
 		for dirpath, dirnames, filenames in os.walk (s, followlinks=True):
 
-			for f in ["MANIFEST", "README", "LICENSE", "COPYING", "AUTHORS", "SOURCES", "ChangeLog"]:
+			for f in ["MANIFEST", Manifest.cache_name, "README", "LICENSE", "COPYING", "AUTHORS", "SOURCES", "ChangeLog"]:
 				if f in dirnames:
 					dirnames.remove (f)
 				if f in filenames:
@@ -478,14 +890,16 @@ class Manifest:
 			dirnames.sort ()
 			filenames.sort ()
 			ms = os.path.join (dirpath, "MANIFEST")
+			content = ''.join (f + '\n' for f in filenames + dirnames)
+			try:
+				with open (ms) as m:
+					if m.read () == content:
+						continue
+			except IOError:
+				pass
 			print ("  GEN    %s" % ms)
-			m = open (ms, "w")
-			for f in filenames:
-				print (f, file=m)
-			for f in dirnames:
-				print (f, file=m)
-			for f in dirnames:
-				Manifest.update_recursive (os.path.join (dirpath, f))
+			with open (ms, "w") as m:
+				m.write (content)
 
 if __name__ == '__main__':
 	pass
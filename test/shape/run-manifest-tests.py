@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Checks the manifest index of hb_test_tools: that Manifest.read_cached ()
+# matches Manifest.read (), answers from its cache while nothing changed,
+# and notices changed MANIFESTs and directories by their mtimes.
+
+import os, sys, tempfile
+
+sys.path.insert (0, os.path.dirname (os.path.abspath (__file__)))
+from hb_test_tools import Manifest
+
+fails = 0
+
+def check (what, ok):
+	global fails
+	if not ok:
+		print ("FAIL: %s" % what)
+		fails += 1
+
+def write (path, lines):
+	with open (path, "w") as f:
+		f.write (''.join (l + '\n' for l in lines))
+
+# Moves the mtime of path forward, so that changes are seen on file
+# systems with coarse timestamps.
+def touch (path):
+	st = os.stat (path)
+	os.utime (path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+reads = 0
+manifest_read = Manifest.read
+
+def counting_read (s, strict = True, dirs = None):
+	global reads
+	reads += 1
+	return manifest_read (s, strict, dirs)
+
+Manifest.read = counting_read
+
+def read_cached (top, strict = True):
+	global reads
+	reads = 0
+	paths = Manifest.read_cached (top, strict)
+	return paths, reads
+
+with tempfile.TemporaryDirectory () as top:
+	sub = os.path.join (top, "sub")
+	bare = os.path.join (top, "bare")
+	os.mkdir (sub)
+	os.mkdir (bare)
+	for f in ("a.ttf", os.path.join ("sub", "b.ttf"), os.path.join ("sub", "c.ttf")):
+		write (os.path.join (top, f), [])
+	write (os.path.join (top, "MANIFEST"), ["a.ttf", "sub", "bare"])
+	write (os.path.join (sub, "MANIFEST"), ["b.ttf"])
+
+	expected = [os.path.join (top, "a.ttf"), os.path.join (sub, "b.ttf")]
+	check ("read () lists the manifest", list (manifest_read (top, False)) == expected)
+
+	paths, n = read_cached (top, False)
+	check ("first read_cached () matches read ()", paths == expected)
+	check ("first read_cached () reads the MANIFESTs", n > 0)
+
+	paths, n = read_cached (top, False)
+	check ("cache hit returns the same paths", paths == expected)
+	check ("cache hit reads no MANIFEST, even in bare/", n == 0)
+
+	write (os.path.join (sub, "MANIFEST"), ["b.ttf", "c.ttf"])
+	touch (os.path.join (sub, "MANIFEST"))
+	expected.append (os.path.join (sub, "c.ttf"))
+	paths, n = read_cached (top, False)
+	check ("changed MANIFEST invalidates the cache", n > 0)
+	check ("changed MANIFEST is read again", paths == expected)
+
+	write (os.path.join (bare, "d.ttf"), [])
+	write (os.path.join (bare, "MANIFEST"), ["d.ttf"])
+	touch (bare)
+	expected.append (os.path.join (bare, "d.ttf"))
+	paths, n = read_cached (top, False)
+	check ("new MANIFEST in bare/ invalidates the cache", n > 0)
+	check ("new MANIFEST in bare/ is read", paths == expected)
+
+	paths, n = read_cached (top, False)
+	check ("cache hit after rebuilding", n == 0 and paths == expected)
+
+	paths, n = read_cached (top, True)
+	check ("strict reads do not use the non-strict cache", n > 0 and paths == expected)
+
+	Manifest.update_recursive (top)
+	mtime = os.stat (os.path.join (top, "MANIFEST")).st_mtime_ns
+	with open (os.path.join (top, "MANIFEST")) as f:
+		check ("update_recursive () skips the cache", Manifest.cache_name not in f.read ())
+	Manifest.update_recursive (top)
+	check ("update_recursive () leaves unchanged MANIFESTs alone",
+	       os.stat (os.path.join (top, "MANIFEST")).st_mtime_ns == mtime)
+
+if fails:
+	sys.exit ("%d check(s) failed." % fails)
+print ("All tests passed.")
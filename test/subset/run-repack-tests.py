@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
-# Runs a subsetting test suite. Compares the results of subsetting via harfbuzz
-# to subsetting via fonttools.
+# Runs repacker test suites.  Usage:
+#
+#   run-repack-tests.py /path/to/hb-subset (TEST.tests | DIR)...
+#
+# Directories are expanded to the .tests files they contain and all tests
+# are run in parallel.  For each test the wall time of the subset call, the
+# output size, and the net change in the GSUB/GPOS subtable and extension
+# subtable counts between the input and the output are reported.
 
 from difflib import unified_diff
 import os
@@ -11,6 +17,9 @@ import sys
 import tempfile
 import shutil
 import io
+import threading
+import time
+import concurrent.futures
 
 from repack_test import RepackTest
 
@@ -22,9 +31,24 @@ except ImportError:
 
 ots_sanitize = shutil.which ("ots-sanitize")
 
-def subset_cmd (command):
-	global hb_subset, process
-	print (hb_subset + ' ' + " ".join(command))
+# Each worker thread drives its own hb-subset --batch process.
+workers = threading.local ()
+processes = []
+processes_lock = threading.Lock ()
+
+def subset_process ():
+	if not hasattr (workers, 'process'):
+		workers.process = subprocess.Popen ([hb_subset, '--batch'],
+						    stdin=subprocess.PIPE,
+						    stdout=subprocess.PIPE,
+						    stderr=sys.stdout)
+		with processes_lock:
+			processes.append (workers.process)
+	return workers.process
+
+def subset_cmd (command, log):
+	process = subset_process ()
+	print (hb_subset + ' ' + " ".join(command), file=log)
 	process.stdin.write ((';'.join (command) + '\n').encode ("utf-8"))
 	process.stdin.flush ()
 	return process.stdout.readline().decode ("utf-8").strip ()
@@ -37,38 +61,74 @@ def cmd (command):
 	print (stderrdata, end="", file=sys.stderr)
 	return stdoutdata, p.returncode
 
-def fail_test (test, cli_args, message):
-	print ('ERROR: %s' % message)
-	print ('Test State:')
-	print ('  test.font_name    %s' % test.font_name)
-	print ('  test.test_path %s' % os.path.abspath (test.test_path))
+def fail_test (test, cli_args, message, log):
+	print ('ERROR: %s' % message, file=log)
+	print ('Test State:', file=log)
+	print ('  test.font_name    %s' % test.font_name, file=log)
+	print ('  test.test_path %s' % os.path.abspath (test.test_path), file=log)
 	return 1
 
-def run_test (test, should_check_ots):
-	out_file = os.path.join (tempfile.mkdtemp (), test.font_name + '-subset.ttf')
+def layout_stats (font):
+	# Returns (subtable count, extension subtable count) over GSUB and GPOS.
+	subtables = 0
+	extensions = 0
+	for tag in ('GSUB', 'GPOS'):
+		if tag not in font or not font[tag].table.LookupList:
+			continue
+		for lookup in font[tag].table.LookupList.Lookup:
+			subtables += lookup.SubTableCount
+			if lookup.LookupType == (7 if tag == 'GSUB' else 9):
+				extensions += lookup.SubTableCount
+	return subtables, extensions
+
+# The counts are net changes: the repacker splitting subtables or promoting
+# them to extension lookups adds to them, subsetting dropping subtables
+# takes away, so they are not counts of repacker events.  hb-subset does
+# not report those.
+def repack_stats (test, out_file, elapsed):
+	with TTFont (test.font_path (), lazy=True) as font:
+		in_subtables, in_extensions = layout_stats (font)
+	with TTFont (out_file, lazy=True) as font:
+		out_subtables, out_extensions = layout_stats (font)
+	return {
+		'time': elapsed,
+		'size': os.path.getsize (out_file),
+		'subtables': out_subtables - in_subtables,
+		'extensions': out_extensions - in_extensions,
+	}
+
+def run_test (test, should_check_ots, out_dir):
+	log = io.StringIO ()
+	out_file = os.path.join (tempfile.mkdtemp (dir=out_dir), test.font_name + '-subset.ttf')
 	cli_args = ["--font-file=" + test.font_path (),
 		    "--output-file=" + out_file,
 		    "--unicodes=%s" % test.codepoints_string (),
 		    "--drop-tables-=GPOS,GSUB,GDEF",]
-	print (' '.join (cli_args))
-	ret = subset_cmd (cli_args)
+	print (' '.join (cli_args), file=log)
+	start = time.perf_counter ()
+	ret = subset_cmd (cli_args, log)
+	elapsed = time.perf_counter () - start
 
 	if ret != "success":
-		return fail_test (test, cli_args, "%s failed" % ' '.join (cli_args))
+		return fail_test (test, cli_args, "%s failed" % ' '.join (cli_args), log), log, None
 
 	try:
-		with TTFont (out_file) as font:
-			pass
+		stats = repack_stats (test, out_file, elapsed)
 	except Exception as e:
-		print (e)
-		return fail_test (test, cli_args, "ttx failed to parse the result")
+		print (e, file=log)
+		return fail_test (test, cli_args, "ttx failed to parse the result", log), log, None
 
 	if should_check_ots:
-		print ("Checking output with ots-sanitize.")
-		if not check_ots (out_file):
-			return fail_test (test, cli_args, 'ots for subsetted file fails.')
+		print ("Checking output with ots-sanitize.", file=log)
+		if not check_ots (out_file, log):
+			return fail_test (test, cli_args, 'ots for subsetted file fails.', log), log, stats
 
-	return 0
+	return 0, log, stats
+
+def run_test_file (path, out_dir):
+	with open (path, mode="r", encoding="utf-8") as f:
+		# TODO(garretrieger): re-enable OTS checking.
+		return run_test (RepackTest (path, f.read ()), False, out_dir)
 
 def has_ots ():
 	if not ots_sanitize:
@@ -76,10 +136,10 @@ def has_ots ():
 		return False
 	return True
 
-def check_ots (path):
+def check_ots (path, log):
 	ots_report, returncode = cmd ([ots_sanitize, path])
 	if returncode:
-		print ("OTS Failure: %s" % ots_report)
+		print ("OTS Failure: %s" % ots_report, file=log)
 		return False
 	return True
 
@@ -88,26 +148,49 @@ if not args or sys.argv[1].find ('hb-subset') == -1 or not os.path.exists (sys.a
 	sys.exit ("First argument does not seem to point to usable hb-subset.")
 hb_subset, args = args[0], args[1:]
 
-if len (args) != 1:
+if not args:
 	sys.exit ("No tests supplied.")
 
-has_ots = has_ots()
-
-process = subprocess.Popen ([hb_subset, '--batch'],
-                            stdin=subprocess.PIPE,
-                            stdout=subprocess.PIPE,
-                            stderr=sys.stdout)
+# Directories, eg. data/repack_tests, are expanded to the .tests files in them.
+paths = []
+for arg in args:
+	if os.path.isdir (arg):
+		paths.extend (sorted (os.path.join (arg, f) for f in os.listdir (arg)
+				      if f.endswith (".tests")))
+	else:
+		paths.append (arg)
 
-fails = 0
+for path in paths:
+	if not path.endswith(".tests"):
+		sys.exit ("Not a valid test case path.")
 
-path = args[0]
-if not path.endswith(".tests"):
-        sys.exit ("Not a valid test case path.")
-
-with open (path, mode="r", encoding="utf-8") as f:
-	# TODO(garretrieger): re-enable OTS checking.
-	fails += run_test (RepackTest (path, f.read ()), False)
+has_ots = has_ots()
 
+fails = 0
+results = []
+
+# Subset outputs are only needed until their stats are taken; they all go
+# in one directory removed at the end of the run.
+with tempfile.TemporaryDirectory () as out_dir, \
+     concurrent.futures.ThreadPoolExecutor (max_workers=max (1, min (len (paths), os.cpu_count () or 1))) as executor:
+	for path, (failed, log, stats) in zip (paths, executor.map (run_test_file, paths, [out_dir] * len (paths))):
+		print (log.getvalue (), end="")
+		fails += failed
+		results.append ((path, stats))
+
+for process in processes:
+	process.stdin.close ()
+	process.wait ()
+
+print ()
+print ("%-32s %10s %10s %11s %12s" % ("test", "time (ms)", "size", "Δ subtables", "Δ extensions"))
+for path, stats in results:
+	name = os.path.basename (path)
+	if stats is None:
+		print ("%-32s %10s" % (name, "FAILED"))
+		continue
+	print ("%-32s %10.1f %10d %+11d %+12d" % (name, stats['time'] * 1000, stats['size'],
+						   stats['subtables'], stats['extensions']))
 
 if fails != 0:
 	sys.exit ("%d test(s) failed." % fails)